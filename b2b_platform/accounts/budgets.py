@@ -0,0 +1,122 @@
+# accounts/budgets.py
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class Budget:
+    """The most a single request to a route may cost."""
+
+    def __init__(self, max_queries, max_sql_ms=100, max_response_ms=500):
+        self.max_queries = max_queries
+        self.max_sql_ms = max_sql_ms
+        self.max_response_ms = max_response_ms
+
+    def __repr__(self):
+        return f"Budget(max_queries={self.max_queries}, max_sql_ms={self.max_sql_ms}, max_response_ms={self.max_response_ms})"
+
+
+# Budget for every named route in accounts/urls.py, measured against the
+# seeded test dataset. Query counts are exact enough to catch a new N+1;
+# the time limits are generous so they only catch gross regressions.
+ROUTE_BUDGETS = {
+    # Auth
+    'register': Budget(max_queries=0),
+    'login': Budget(max_queries=0),
+    'logout': Budget(max_queries=4),
+
+    # Dashboards
+    'buyer_dashboard': Budget(max_queries=3),
+    'buyer_recommendations': Budget(max_queries=6, max_response_ms=1000),
+    'seller_dashboard': Budget(max_queries=2),
+
+    # Product CRUD
+    'product_list': Budget(max_queries=3),
+    'product_add': Budget(max_queries=2),
+    'product_edit': Budget(max_queries=3),
+    'product_delete': Budget(max_queries=3),
+
+    # Orders
+    'my_orders': Budget(max_queries=4),
+    'place_order': Budget(max_queries=6),  # includes the order's first history row
+    # The cart lives in the session: changing it costs only the session save
+    'cart': Budget(max_queries=3),
+    'cart_add': Budget(max_queries=5),
+    'cart_update': Budget(max_queries=5),
+    # One product SELECT and two bulk INSERTs, however many lines the cart has
+    'checkout': Budget(max_queries=10),
+    'process_payment': Budget(max_queries=3),
+    'manage_orders': Budget(max_queries=3),
+    # Session, user, then one SELECT, one UPDATE and one bulk INSERT however many orders are ticked
+    'bulk_order_action': Budget(max_queries=7),
+    # Session, user, then the transition's UPDATE and history INSERT inside a
+    # transaction (which shows up as a savepoint pair under the test runner)
+    'accept_order': Budget(max_queries=6),
+    'reject_order': Budget(max_queries=6),
+    'ship_order': Budget(max_queries=6),
+    'complete_order': Budget(max_queries=6),
+    'order_conversation': Budget(max_queries=4),
+
+    # Exports: session, user, then one streamed query whatever the row count
+    'export_orders': Budget(max_queries=3),
+    'export_products': Budget(max_queries=3),
+}
+
+# Routes whose ROUTE_BUDGETS entry covers the GET page also get a budget for
+# the POST that does the work.
+POST_BUDGETS = {
+    # Session, user, order; the paid UPDATE, history INSERT and stock UPDATE
+    # inside two savepoints; then the popularity UPDATE, plus the row's
+    # INSERT in its own savepoint the first time the product sells
+    'process_payment': Budget(max_queries=14),
+}
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def enforce_budget(budget, label='request'):
+    """
+    Runs the enclosed block and raises BudgetExceeded if it ran more SQL
+    queries, spent longer in SQL, or took longer overall than `budget`
+    allows. The error lists every query that ran, slowest marked first.
+    """
+    with CaptureQueriesContext(connection) as captured:
+        start = time.perf_counter()
+        yield captured
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    queries = captured.captured_queries
+    sql_ms = sum(float(query['time']) for query in queries) * 1000
+    problems = []
+    if len(queries) > budget.max_queries:
+        problems.append(f"{len(queries)} queries (budget {budget.max_queries})")
+    if sql_ms > budget.max_sql_ms:
+        problems.append(f"{sql_ms:.1f} ms in SQL (budget {budget.max_sql_ms} ms)")
+    if elapsed_ms > budget.max_response_ms:
+        problems.append(f"{elapsed_ms:.1f} ms in total (budget {budget.max_response_ms} ms)")
+    if problems:
+        lines = [f"{label} is over budget: {', '.join(problems)}"]
+        for i, query in enumerate(sorted(queries, key=lambda q: -float(q['time'])), 1):
+            lines.append(f"  {i}. [{float(query['time']) * 1000:.1f} ms] {query['sql']}")
+        raise BudgetExceeded('\n'.join(lines))
+
+
+def within_budget(route_name, budget=None):
+    """
+    Decorator form of enforce_budget for test methods, using the route's
+    budget from ROUTE_BUDGETS unless one is given.
+    """
+    def decorator(test_method):
+        @wraps(test_method)
+        def wrapper(*args, **kwargs):
+            with enforce_budget(budget or ROUTE_BUDGETS[route_name], label=route_name):
+                return test_method(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+# accounts/cart.py
+
+from django.db import transaction
+
+from .models import Order, Product
+from .signals import record_status_changes
+
+CART_SESSION_KEY = 'cart'
+# Keeps a checkout's product lookup and inserts bounded
+MAX_CART_LINES = 100
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart cannot be checked out; nothing was ordered.
+    `missing_ids` are the products that no longer exist.
+    """
+
+    def __init__(self, problems, missing_ids=()):
+        super().__init__(' '.join(problems))
+        self.problems = problems
+        self.missing_ids = list(missing_ids)
+
+
+class Cart:
+    """
+    A buyer's cart, kept in the session as {product id: quantity}. Adding
+    and changing lines touches no tables; products are only looked up when
+    the cart is shown or checked out.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lines = {int(product_id): quantity for product_id, quantity in session.get(CART_SESSION_KEY, {}).items()}
+
+    def add(self, product_id, quantity):
+        """Adds to a line's quantity. Returns False if the cart is full."""
+        if product_id not in self.lines and len(self.lines) >= MAX_CART_LINES:
+            return False
+        self.lines[product_id] = self.lines.get(product_id, 0) + quantity
+        self._save()
+        return True
+
+    def update(self, product_id, quantity):
+        """Sets a line's quantity; zero removes the line."""
+        if quantity > 0:
+            if product_id not in self.lines:
+                return
+            self.lines[product_id] = quantity
+        else:
+            self.lines.pop(product_id, None)
+        self._save()
+
+    def discard(self, product_ids):
+        """Drops the lines for products that no longer exist."""
+        removed = [product_id for product_id in product_ids if self.lines.pop(product_id, None) is not None]
+        if removed:
+            self._save()
+        return removed
+
+    def clear(self):
+        self.lines = {}
+        self._save()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _save(self):
+        # JSON sessions need string keys
+        self.session[CART_SESSION_KEY] = {str(product_id): quantity for product_id, quantity in self.lines.items()}
+
+
+def checkout(buyer, lines):
+    """
+    Places one order per cart line in a single transaction: one query
+    fetches and locks every product, stock is checked for every line, then
+    all orders and their first history rows are written with two bulk
+    INSERTs. Either every line is ordered or, if any line cannot be,
+    CheckoutError lists the problems and nothing is. Returns the orders.
+
+    As with single orders, stock is only taken when an order is paid (see
+    inventory.pay_order); the check here stops orders that cannot be filled.
+    """
+    if not lines:
+        raise CheckoutError(["Your cart is empty."])
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().in_bulk(list(lines))
+        problems, missing_ids = [], []
+        for product_id, quantity in lines.items():
+            product = products.get(product_id)
+            if product is None:
+                missing_ids.append(product_id)
+                problems.append(f"Product #{product_id} is no longer available and was removed from your cart.")
+            elif quantity > product.stock_quantity:
+                problems.append(f"Only {product.stock_quantity} of {product.name} are in stock.")
+        if problems:
+            raise CheckoutError(problems, missing_ids)
+
+        orders = Order.objects.bulk_create([
+            Order(product=products[product_id], buyer=buyer, seller_id=products[product_id].seller_id, quantity=quantity)
+            for product_id, quantity in lines.items()
+        ])
+        # bulk_create sends no post_save, so write the history rows here
+        record_status_changes(orders)
+    return orders
@@ -2,7 +2,7 @@
 
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
-from .models import User,Product,Message
+from .models import User,Product,Message,Order
 
 class UserRegistrationForm(forms.ModelForm):
     """
@@ -90,4 +90,34 @@ class MessageForm(forms.ModelForm):
         }
         labels = {
             'body': '' # Hide the label for a cleaner look
-        }        
\ No newline at end of file
+        }
+
+
+class ExportFilterForm(forms.Form):
+    """
+    Query-string filters for the seller exports. Every field is optional;
+    the date range is inclusive on both ends.
+    """
+    FORMAT_CHOICES = [('csv', 'CSV'), ('jsonl', 'JSON Lines')]
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False,
+                               widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    start = forms.DateField(required=False, label="From",
+                            widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    end = forms.DateField(required=False, label="To",
+                          widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("The start date must not be after the end date.")
+        if not cleaned_data.get('format'):
+            cleaned_data['format'] = 'csv'
+        return cleaned_data
+
+
+class OrderExportFilterForm(ExportFilterForm):
+    status = forms.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False,
+                                       widget=forms.SelectMultiple(attrs={'class': 'form-select form-select-sm'}))
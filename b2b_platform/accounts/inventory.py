@@ -0,0 +1,39 @@
+# accounts/inventory.py
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Product
+from .order_states import transition
+
+
+class OutOfStock(Exception):
+    """Raised when a product does not have enough stock left for an order."""
+
+
+def decrement_stock(product_id, quantity):
+    """
+    Takes `quantity` units of a product with a single conditional
+    `UPDATE ... SET stock = stock - n WHERE stock >= n`. The database checks
+    and decrements in one step, so concurrent buyers can neither oversell
+    nor overwrite each other's decrements. Returns False if there was not
+    enough stock, leaving it untouched.
+    """
+    updated = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity
+    )
+    return updated == 1
+
+
+def pay_order(order, **conditions):
+    """
+    Marks a pending-payment order paid and takes its stock in one
+    transaction, so an order is never paid without its stock or vice versa.
+    Raises InvalidTransition if the order is no longer awaiting payment
+    (e.g. a double submit) and OutOfStock if the product sold out since the
+    order was placed.
+    """
+    with transaction.atomic():
+        order.status = transition(order.pk, 'pay', **conditions)
+        if not decrement_stock(order.product_id, order.quantity):
+            raise OutOfStock(f"Not enough stock left for order #{order.id}.")
@@ -0,0 +1,84 @@
+# accounts/management/commands/benchmark_recommender.py
+
+import json
+import sys
+from contextlib import redirect_stdout
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the recommendation training pipeline on synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            action='store_true',
+            help='Seed a test database per size, then time training/inference and evaluate every engine.',
+        )
+        parser.add_argument('--orders', type=int, nargs='+', default=[1000, 100000], help='Dataset sizes for --suite.')
+        parser.add_argument('--engines', nargs='+', choices=['knn', 'als'], default=['knn', 'als'])
+        parser.add_argument('--latency-samples', type=int, default=200)
+        parser.add_argument('--output', default=None, help='Write the JSON results to this file as well.')
+        parser.add_argument('--buyers', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--interactions', type=int, default=100000)
+        parser.add_argument(
+            '--skip-pivot',
+            action='store_true',
+            help='Only measure the streaming extractor (the dense pivot needs buyers x products memory).',
+        )
+        parser.add_argument(
+            '--ann-recall',
+            action='store_true',
+            help='Report recall@k of the IVF index against brute force on the saved training state '
+                 '(or on synthetic data if no model has been trained).',
+        )
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--ann-probes', type=int, default=None)
+        parser.add_argument('--ann-lists', type=int, default=None)
+
+    def handle(self, *args, **kwargs):
+        # Training and serving print progress; keep it out of the JSON report,
+        # which goes to self.stdout (bound to the real stdout)
+        with redirect_stdout(sys.stderr):
+            results = self._run(kwargs)
+        self._write(results, kwargs['output'])
+
+    def _run(self, kwargs):
+        from ml_models.benchmark import benchmark_ann_recall, benchmark_extraction, run_benchmark_suite
+
+        if kwargs['suite']:
+            results = run_benchmark_suite(
+                order_counts=kwargs['orders'],
+                engines=kwargs['engines'],
+                k=kwargs['k'],
+                latency_samples=kwargs['latency_samples'],
+            )
+            return {'suite': results}
+
+        if kwargs['ann_recall']:
+            results = benchmark_ann_recall(
+                n_buyers=kwargs['buyers'],
+                n_products=kwargs['products'],
+                n_interactions=kwargs['interactions'],
+                top_k=kwargs['k'],
+                n_probe=kwargs['ann_probes'],
+                n_lists=kwargs['ann_lists'],
+            )
+            return {'ann_recall': results}
+
+        results = benchmark_extraction(
+            n_buyers=kwargs['buyers'],
+            n_products=kwargs['products'],
+            n_interactions=kwargs['interactions'],
+            skip_pivot=kwargs['skip_pivot'],
+        )
+        return {'extraction': results}
+
+    def _write(self, results, output):
+        report = json.dumps(results, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report)
+        self.stdout.write(report)
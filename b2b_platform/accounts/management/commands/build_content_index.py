@@ -0,0 +1,17 @@
+# accounts/management/commands/build_content_index.py
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the TF-IDF product content index used for cold-start recommendations.'
+
+    def handle(self, *args, **kwargs):
+        from ml_models.content import build_content_index
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding the product content index...'))
+        try:
+            build_content_index()
+            self.stdout.write(self.style.SUCCESS('Successfully rebuilt the content index.'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'An error occurred while building the content index: {e}'))
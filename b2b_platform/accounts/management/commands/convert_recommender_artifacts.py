@@ -0,0 +1,20 @@
+# accounts/management/commands/convert_recommender_artifacts.py
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Converts joblib recommender artifacts to the memory-mapped .npy format.'
+
+    def handle(self, *args, **kwargs):
+        from ml_models.recommendations import convert_joblib_artifacts
+        from ml_models.scheduler import train_new_version
+
+        self.stdout.write(self.style.SUCCESS('Converting recommender artifacts...'))
+        try:
+            if train_new_version(train=lambda model_dir: convert_joblib_artifacts(model_dir)) is None:
+                self.stderr.write(self.style.ERROR('No trained model found. Run train_recommender first.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Successfully converted the recommender artifacts.'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'An error occurred during conversion: {e}'))
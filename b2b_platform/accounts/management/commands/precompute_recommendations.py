@@ -0,0 +1,28 @@
+# accounts/management/commands/precompute_recommendations.py
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Precomputes product recommendations for every buyer from the trained model.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--num-recs', type=int, default=None, help='Recommendations to store per buyer.')
+        parser.add_argument('--block-size', type=int, default=None, help='Buyers scored per sparse matrix product.')
+        parser.add_argument('--workers', type=int, default=1, help='Score blocks in a pool of this many processes.')
+
+    def handle(self, *args, **kwargs):
+        from ml_models.recommendations import (
+            PRECOMPUTE_BLOCK_SIZE, PRECOMPUTED_RECS, precompute_buyer_recommendations,
+        )
+
+        self.stdout.write(self.style.SUCCESS('Starting batch recommendation precomputation...'))
+        try:
+            stored = precompute_buyer_recommendations(
+                num_recs=kwargs['num_recs'] or PRECOMPUTED_RECS,
+                block_size=kwargs['block_size'] or PRECOMPUTE_BLOCK_SIZE,
+                workers=kwargs['workers'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Successfully stored recommendations for {stored} buyers.'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'An error occurred during precomputation: {e}'))
@@ -0,0 +1,17 @@
+# accounts/management/commands/rebuild_popularity_index.py
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the time-decayed per-category product popularity index from the order history.'
+
+    def handle(self, *args, **kwargs):
+        from ml_models.popularity import rebuild_popularity_index
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding the popularity index...'))
+        try:
+            count = rebuild_popularity_index()
+            self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the popularity index for {count} products.'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'An error occurred while rebuilding the popularity index: {e}'))
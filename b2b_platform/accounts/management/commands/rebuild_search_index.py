@@ -0,0 +1,17 @@
+# accounts/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text product search index from the catalog.'
+
+    def handle(self, *args, **kwargs):
+        from accounts.search import get_search_backend
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding the product search index...'))
+        try:
+            count = get_search_backend().rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Successfully indexed {count} products.'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'An error occurred while rebuilding the search index: {e}'))
@@ -0,0 +1,48 @@
+# accounts/management/commands/run_recommender_scheduler.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Retrains the recommendation model in the background whenever enough new orders arrive or the model gets too old.'
+
+    def add_arguments(self, parser):
+        from ml_models.scheduler import RETRAIN_INTERVAL_SECONDS, RETRAIN_ORDER_THRESHOLD, SCHEDULER_POLL_SECONDS
+
+        parser.add_argument(
+            '--engine',
+            choices=['knn', 'als'],
+            default=None,
+            help='Engine to retrain (defaults to settings.RECOMMENDER_ENGINE).',
+        )
+        parser.add_argument('--orders', type=int, default=RETRAIN_ORDER_THRESHOLD, help='Retrain after this many new qualifying orders (0 disables).')
+        parser.add_argument('--interval', type=int, default=RETRAIN_INTERVAL_SECONDS, help='Retrain once the published model is this many seconds old (0 disables).')
+        parser.add_argument('--poll', type=int, default=SCHEDULER_POLL_SECONDS, help='Seconds between trigger checks.')
+        parser.add_argument('--full', action='store_true', help='Rebuild from every qualifying order instead of incrementally.')
+        parser.add_argument('--once', action='store_true', help='Check the triggers once, retrain if due, and exit.')
+
+    def handle(self, *args, **kwargs):
+        from ml_models.scheduler import RetrainingScheduler
+
+        engine = kwargs['engine'] or getattr(settings, 'RECOMMENDER_ENGINE', 'knn')
+        scheduler = RetrainingScheduler(
+            engine=engine,
+            order_threshold=kwargs['orders'],
+            interval=kwargs['interval'],
+            poll_seconds=kwargs['poll'],
+            full=kwargs['full'],
+        )
+
+        if kwargs['once']:
+            if scheduler.run_once():
+                self.stdout.write(self.style.SUCCESS('Published a new recommender version.'))
+            else:
+                self.stdout.write('No new recommender version published.')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Recommender scheduler started for the '{engine}' engine. Press Ctrl+C to stop."))
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Recommender scheduler stopped.'))
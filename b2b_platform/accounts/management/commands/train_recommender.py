@@ -17,18 +17,74 @@ def setup_django_environment():
 class Command(BaseCommand):
     help = 'Trains the K-Nearest Neighbors model for product recommendations.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            choices=['knn', 'als'],
+            default='knn',
+            help='Which recommendation engine to train (serving follows settings.RECOMMENDER_ENGINE).',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild the model from every qualifying order instead of only the new ones.',
+        )
+        parser.add_argument(
+            '--neighbors-only',
+            action='store_true',
+            help='Only rebuild the precomputed neighbor table from the saved model.',
+        )
+        parser.add_argument(
+            '--ann',
+            action='store_true',
+            help='Compute the neighbor table with the approximate IVF index instead of brute force.',
+        )
+        parser.add_argument('--ann-probes', type=int, default=None, help='Partitions probed per product (more = higher recall, slower).')
+        parser.add_argument('--ann-lists', type=int, default=None, help='Number of partitions (defaults to sqrt of the catalog size).')
+
     def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.SUCCESS('Starting the recommendation model training process...'))
-        
         # Setup Django environment so our script can access models
         setup_django_environment()
-        
-        # Now we can import our training function
-        from ml_models.recommendations import train_and_save_knn_model
 
+        # Every run writes a new version directory and publishes it
+        # atomically, so serving never reads half-written artifacts
+        from ml_models.scheduler import train_new_version
+
+        if kwargs['engine'] == 'als':
+            self.stdout.write(self.style.SUCCESS('Starting the ALS recommendation model training process...'))
+            try:
+                train_new_version(engine='als')
+                self.stdout.write(self.style.SUCCESS('Successfully trained and saved the ALS model.'))
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'An error occurred during model training: {e}'))
+            return
+
+        from ml_models.recommendations import IVF_PROBES, IVFIndex
+
+        index = None
+        if kwargs['ann']:
+            index = IVFIndex(n_probe=kwargs['ann_probes'] or IVF_PROBES, n_lists=kwargs['ann_lists'])
+
+        if kwargs['neighbors_only']:
+            from ml_models.recommendations import rebuild_neighbor_table
+
+            self.stdout.write(self.style.SUCCESS('Rebuilding the recommendation neighbor table...'))
+            try:
+                version_dir = train_new_version(train=lambda model_dir: rebuild_neighbor_table(model_dir=model_dir, index=index))
+                if version_dir is None:
+                    self.stderr.write(self.style.ERROR('No trained model found. Run train_recommender first.'))
+                else:
+                    self.stdout.write(self.style.SUCCESS('Successfully rebuilt the neighbor table.'))
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'An error occurred while rebuilding the neighbor table: {e}'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Starting the recommendation model training process...'))
+        
         try:
-            # Call the main training function
-            train_and_save_knn_model()
+            # Call the main training function; incremental mode falls back to a
+            # full rebuild by itself when no training state has been saved yet
+            train_new_version(full=kwargs['full'], index=index)
             self.stdout.write(self.style.SUCCESS('Successfully trained and saved the recommendation model.'))
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f'An error occurred during model training: {e}'))
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(f'An error occurred during model training: {e}'))
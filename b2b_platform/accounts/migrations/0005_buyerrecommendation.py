@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuyerRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_to', to='accounts.product')),
+            ],
+            options={
+                'ordering': ['buyer', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('buyer', 'rank'), name='unique_buyer_recommendation_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_buyerrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='accounts.product')),
+                ('category', models.CharField(choices=[('steel', 'Steel Products'), ('cement', 'Cement & Concrete'), ('paints', 'Paints & Coatings'), ('construction', 'Construction Materials'), ('plumbing', 'Plumbing & Fittings'), ('soap', 'Soaps & Detergents'), ('chemicals', 'Chemicals & Solvents'), ('cleaning', 'Cleaning Supplies'), ('plastic', 'Plastic Products'), ('electricals', 'Electricals'), ('equipment', 'Industrial Equipment'), ('packaging', 'Packaging Materials'), ('tools', 'Tools & Hardware'), ('stationery', 'Stationery & Office Supplies'), ('garments', 'Textile & Garments'), ('food', 'Food Raw Materials')], max_length=100)),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', '-score'], name='popularity_category_score'), models.Index(fields=['-score'], name='popularity_score')],
+            },
+        ),
+    ]
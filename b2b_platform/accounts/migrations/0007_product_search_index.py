@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from accounts.search import SQLiteFTSBackend
+
+    schema_editor.execute(SQLiteFTSBackend.create_table_sql())
+    Product = apps.get_model('accounts', 'Product')
+    rows = [
+        (product.pk, product.name, product.description, dict(product._meta.get_field('category').choices).get(product.category, product.category))
+        for product in Product.objects.all()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SQLiteFTSBackend.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from accounts.search import SQLiteFTSBackend
+
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SQLiteFTSBackend.table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_productpopularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def configure_rank(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from accounts.search import SQLiteFTSBackend
+
+    schema_editor.execute(SQLiteFTSBackend.configure_rank_sql())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='accounts.product')),
+                ('document', models.TextField(db_column='accounts_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'accounts_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(configure_rank, migrations.RunPython.noop),
+    ]
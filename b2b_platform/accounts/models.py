@@ -1,5 +1,7 @@
 # from django.db import models
 
+from .search import FullTextMatch
+
 # Create your models here.
 # accounts/models.py
 
@@ -73,9 +75,36 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Catalog pages, newest first, optionally within one category,
+            # and each seller's own listings (keyset-paginated on created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='product_newest'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_newest'),
+            models.Index(fields=['seller', '-created_at', '-id'], name='product_seller_newest'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        # Keep the full-text search index in step with the catalog
+        from .search import get_search_backend
+        get_search_backend().index_product(self)
+        if not adding:
+            # The trending lists filter on a copy of the category
+            from ml_models.popularity import update_product_category
+            update_product_category(self)
+
+    def delete(self, *args, **kwargs):
+        product_id = self.pk
+        result = super().delete(*args, **kwargs)
+        from .search import get_search_backend
+        get_search_backend().remove_product(product_id)
+        return result
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -106,9 +135,40 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending_approval')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Buyer and seller order lists, newest first
+            models.Index(fields=['buyer', '-created_at', '-id'], name='order_buyer_newest'),
+            models.Index(fields=['seller', '-created_at', '-id'], name='order_seller_newest'),
+            # A buyer's orders in a given status (recommendation history, checks)
+            models.Index(fields=['buyer', 'status', '-created_at'], name='order_buyer_status_newest'),
+        ]
+
     def __str__(self):
-        return f"Order #{self.id} for {self.product.name} by {self.buyer.email}"    
+        # Only describe related objects that are already loaded, so printing
+        # or logging an order never runs extra queries
+        product = self.product.name if Order.product.is_cached(self) else f"product #{self.product_id}"
+        buyer = self.buyer.email if Order.buyer.is_cached(self) else f"buyer #{self.buyer_id}"
+        return f"Order #{self.id} for {product} by {buyer}"
+
+    # The status as last read from or written to the database (None for an
+    # unsaved order), so a status change can be detected without a query
+    _loaded_status = None
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # A deferred status stays unknown rather than being fetched here
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
+    @property
+    def status_changed(self):
+        return 'status' in self.__dict__ and self.status != self._loaded_status
 
     def save(self, *args, **kwargs):
         # If the object is being created for the first time (it has no pk yet),
@@ -127,9 +187,12 @@ class OrderStatusHistory(models.Model):
 
     class Meta:
         ordering = ['timestamp'] # Ensure history is always in chronological order
+        indexes = [
+            models.Index(fields=['order', 'timestamp'], name='status_history_order_time'),
+        ]
 
     def __str__(self):
-        return f"{self.order.id}: {self.status} at {self.timestamp}"     
+        return f"{self.order_id}: {self.status} at {self.timestamp}"     
            
 class Message(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='messages')
@@ -139,6 +202,72 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp'] # Ensure messages are always ordered chronologically
+        indexes = [
+            models.Index(fields=['order', 'timestamp'], name='message_order_time'),
+        ]
+
+    def __str__(self):
+        return f"Message from {self.sender} on Order #{self.order_id}"        
+
+class BuyerRecommendation(models.Model):
+    """
+    A precomputed, ranked product recommendation for a buyer. The whole table
+    is refreshed in bulk by the precompute_recommendations command.
+    """
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='recommendations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['buyer', 'rank']
+        constraints = [
+            # Also serves as the index for reading a buyer's list in rank order
+            models.UniqueConstraint(fields=['buyer', 'rank'], name='unique_buyer_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"Recommendation #{self.rank} for buyer {self.buyer_id}: product {self.product_id}"
+
+
+class ProductSearchEntry(models.Model):
+    """
+    A row of the SQLite FTS5 product index (see accounts/search.py). The
+    virtual table is created by migrations, not Django; the model only lets
+    product queries join it on rowid = product id.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', db_constraint=False, related_name='search_entry')
+    # FTS5's hidden column named after the table: MATCH on it searches every column
+    document = models.TextField(db_column='accounts_product_fts')
+    # FTS5's hidden BM25 score, lowest best, with the backend's column weights
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'accounts_product_fts'
+
+
+ProductSearchEntry._meta.get_field('document').register_lookup(FullTextMatch)
+
+
+class ProductPopularity(models.Model):
+    """
+    A product's exponentially time-decayed count of paid orders, updated as
+    orders are paid. `score` is kept relative to a fixed epoch (see
+    ml_models/popularity.py) so it never has to be decayed in place, and
+    ordering by it ranks products by their current popularity.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    # Copied from the product so "top N in a category" is a single index scan
+    category = models.CharField(max_length=100, choices=Product.CATEGORY_CHOICES)
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-score'], name='popularity_category_score'),
+            models.Index(fields=['-score'], name='popularity_score'),
+        ]
 
     def __str__(self):
-        return f"Message from {self.sender} on Order #{self.order.id}"        
\ No newline at end of file
+        return f"Popularity of product {self.product_id} in {self.category}"
@@ -0,0 +1,89 @@
+# accounts/order_states.py
+
+from django.db import transaction
+
+from .models import Order, OrderStatusHistory
+
+# action -> (status the order must be in, status it moves to)
+TRANSITIONS = {
+    'accept': ('pending_approval', 'pending_payment'),
+    'reject': ('pending_approval', 'rejected'),
+    'pay': ('pending_payment', 'paid'),
+    'ship': ('paid', 'shipped'),
+    'complete': ('shipped', 'completed'),
+}
+
+# How an order that took the transition is described in messages
+ACTION_LABELS = {
+    'accept': 'accepted',
+    'reject': 'rejected',
+    'pay': 'paid',
+    'ship': 'shipped',
+    'complete': 'completed',
+}
+
+# Transitions a seller may apply to their own orders
+SELLER_ACTIONS = ('accept', 'reject', 'ship', 'complete')
+
+
+class InvalidTransition(Exception):
+    """Raised when an order cannot take a transition from its current status."""
+
+
+def transition(order_id, action, **conditions):
+    """
+    Moves an order along `action` with a single conditional
+    `UPDATE ... SET status = new WHERE id = ? AND status = expected` and
+    records the new status in its history, in one transaction. `conditions`
+    narrow the UPDATE further (e.g. seller=user), so ownership is checked
+    by the same statement.
+
+    Raises InvalidTransition when no row matched: the order does not exist,
+    is not the caller's, or is no longer in the expected status, e.g.
+    because a concurrent request moved it first. Nothing is read first.
+    """
+    source, target = TRANSITIONS[action]
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order_id, status=source, **conditions).update(status=target)
+        if not updated:
+            raise InvalidTransition(f"Order #{order_id} cannot be {ACTION_LABELS[action]} from its current status.")
+        OrderStatusHistory.objects.create(order_id=order_id, status=target)
+    return target
+
+
+def transition_many(order_ids, action, **conditions):
+    """
+    Moves many orders along `action` at once. One query reads the status
+    of every requested order that matches `conditions` (e.g. seller=user),
+    then a single UPDATE moves the eligible ones and one bulk INSERT records
+    their history, all in one transaction with the rows locked.
+
+    Returns {order_id: None if the order moved, else the reason it did not},
+    in the order the ids were given.
+    """
+    source, target = TRANSITIONS[action]
+    order_ids = list(dict.fromkeys(order_ids))
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, **conditions)
+            .values_list('pk', 'status')
+        )
+        eligible = [pk for pk in order_ids if current.get(pk) == source]
+        if eligible:
+            # Still conditional on the status, so a concurrent change can never be overwritten
+            Order.objects.filter(pk__in=eligible, status=source).update(status=target)
+            OrderStatusHistory.objects.bulk_create(
+                [OrderStatusHistory(order_id=pk, status=target) for pk in eligible]
+            )
+
+    labels = dict(Order.STATUS_CHOICES)
+    results = {}
+    for pk in order_ids:
+        if pk not in current:
+            results[pk] = "Order not found."
+        elif current[pk] != source:
+            results[pk] = f"Order is {labels.get(current[pk], current[pk])}, not {labels[source]}."
+        else:
+            results[pk] = None
+    return results
@@ -0,0 +1,150 @@
+# accounts/pagination.py
+
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'accounts.pagination.cursor'
+
+
+class KeysetPage:
+    """The slice of a keyset-paginated list shown on one page, plus its neighbours' cursors."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for ListViews. Instead of COUNT(*) and OFFSET, each
+    page is fetched with a WHERE on the ordering columns of the last row
+    seen, so page N costs the same as page 1 given an index on those
+    columns. The cursor in the ?after= / ?before= parameter is signed, so
+    it is opaque to the client and cannot be tampered with.
+    """
+    paginate_by = 12
+    # Must end in a unique column so every row has a distinct position
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        fields = [name.lstrip('-') for name in ordering]
+        after = self._read_cursor('after', queryset, fields)
+        before = self._read_cursor('before', queryset, fields) if after is None else None
+
+        if before is not None:
+            # Walk backwards from the cursor, then restore the display order
+            queryset = queryset.filter(self._keyset_filter(ordering, before, backwards=True))
+            rows = list(queryset.order_by(*[self._reverse(name) for name in ordering])[:page_size + 1])
+            has_more = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_previous, has_next = has_more, True
+        else:
+            if after is not None:
+                queryset = queryset.filter(self._keyset_filter(ordering, after))
+            rows = list(queryset.order_by(*ordering)[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = after is not None
+
+        page = KeysetPage(
+            rows,
+            next_cursor=self._make_cursor(rows[-1], fields) if rows and has_next else None,
+            previous_cursor=self._make_cursor(rows[0], fields) if rows and has_previous else None,
+        )
+        # Same shape as ListView's (paginator, page, object_list, is_paginated)
+        return None, page, rows, page.has_other_pages
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if isinstance(page, KeysetPage):
+            context['next_page_query'] = self._page_query('after', page.next_cursor)
+            context['previous_page_query'] = self._page_query('before', page.previous_cursor)
+        return context
+
+    def _page_query(self, param, cursor):
+        # Keeps the other filters (search, category, ...) on the page links
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[param] = cursor
+        return query.urlencode()
+
+    @staticmethod
+    def _reverse(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    @staticmethod
+    def _keyset_filter(ordering, values, backwards=False):
+        # (a, b) after (x, y) in the given directions:
+        # a beyond x, or a = x and b beyond y
+        clauses = []
+        for i, name in enumerate(ordering):
+            descending = name.startswith('-') != backwards
+            field = name.lstrip('-')
+            lookup = {f'{field}__{"lt" if descending else "gt"}': values[i]}
+            lookup.update({ordering[j].lstrip('-'): values[j] for j in range(i)})
+            clauses.append(Q(**lookup))
+        # The redundant bound on the leading column lets the database use it
+        # as an index range instead of evaluating the OR for every row
+        descending = ordering[0].startswith('-') != backwards
+        leading = Q(**{f'{ordering[0].lstrip("-")}__{"lte" if descending else "gte"}': values[0]})
+        return leading & reduce(or_, clauses)
+
+    @staticmethod
+    def _make_cursor(row, fields):
+        values = []
+        for field in fields:
+            value = getattr(row, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return signing.dumps(values, salt=CURSOR_SALT, compress=True)
+
+    def _read_cursor(self, param, queryset, fields):
+        token = self.request.GET.get(param)
+        if not token:
+            return None
+        try:
+            values = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            # A stale or mangled link just starts from the first page
+            return None
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        for i, field in enumerate(fields):
+            try:
+                model_field = queryset.model._meta.get_field(field)
+            except FieldDoesNotExist:
+                continue
+            if isinstance(model_field, DateTimeField) and values[i] is not None:
+                values[i] = parse_datetime(values[i])
+        return values
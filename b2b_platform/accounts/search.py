@@ -0,0 +1,160 @@
+# accounts/search.py
+
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, Lookup, Q, Value
+from django.db.models.expressions import ExpressionWrapper
+from django.utils.module_loading import import_string
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class FullTextMatch(Lookup):
+    """`document__match=expression`: an FTS5 MATCH against the whole index row."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+def _search_text(product):
+    from .models import Product
+
+    category_label = dict(Product.CATEGORY_CHOICES).get(product.category, product.category)
+    return product.name, product.description, category_label
+
+
+class BaseSearchBackend:
+    """
+    Interface for product search backends. `search` narrows a Product
+    queryset to the matches and annotates each with `search_rank`, lower
+    meaning more relevant. It runs in the same SQL query as the queryset's
+    other filters, so those apply to every match, not a truncated list. The
+    index methods keep the backend in step with the Product table.
+    """
+
+    def search(self, queryset, query):
+        # `query` always contains at least one word
+        raise NotImplementedError
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self, chunk_size=2000):
+        return 0
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Fallback for databases without a full-text index: every word must appear
+    in the name, description or category. No ranking beyond newest first.
+    """
+
+    def search(self, queryset, query):
+        for word in _WORD_RE.findall(query):
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(description__icontains=word) | Q(category__icontains=word)
+            )
+        # Newest (highest id) first
+        return queryset.annotate(search_rank=ExpressionWrapper(-F('pk'), output_field=IntegerField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index over product name, description and category label,
+    keyed by product id. Queries are BM25-ranked with name matches weighted
+    highest, and every word is matched as a prefix, so "ste" finds "steel".
+    """
+
+    table = 'accounts_product_fts'
+    # bm25() column weights for name, description, category
+    weights = (10.0, 1.0, 3.0)
+
+    @classmethod
+    def create_table_sql(cls):
+        # prefix='2 3' adds prefix indexes so short prefix queries stay fast
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls.table} USING fts5("
+            "name, description, category, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    @classmethod
+    def configure_rank_sql(cls):
+        # Makes the hidden `rank` column the weighted BM25 score; the setting
+        # is stored with the index
+        return f"INSERT INTO {cls.table} ({cls.table}, rank) VALUES ('rank', 'bm25({', '.join(map(str, cls.weights))})')"
+
+    @staticmethod
+    def match_expression(query):
+        # Quote every word so FTS5 operators in user input are taken literally
+        return ' '.join(f'"{word}"*' for word in _WORD_RE.findall(query))
+
+    def search(self, queryset, query):
+        # One join of the index against the product table, so the other
+        # filters narrow the matches in the same query
+        return queryset.filter(search_entry__document__match=self.match_expression(query)).annotate(
+            search_rank=F('search_entry__rank'))
+
+    def index_product(self, product):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+                [product.pk, *_search_text(product)],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product_id])
+
+    def rebuild(self, chunk_size=2000):
+        from .models import Product
+
+        count = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(self.create_table_sql())
+            cursor.execute(self.configure_rank_sql())
+            cursor.execute(f"DELETE FROM {self.table}")
+            products = Product.objects.only('id', 'name', 'description', 'category').iterator(chunk_size=chunk_size)
+            batch = []
+            for product in products:
+                batch.append((product.pk, *_search_text(product)))
+                if len(batch) == chunk_size:
+                    cursor.executemany(f"INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)", batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(f"INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)", batch)
+                count += len(batch)
+        return count
+
+
+def get_search_backend():
+    """
+    Returns the backend named by settings.PRODUCT_SEARCH_BACKEND (a dotted
+    path), or the best one available for the configured database.
+    """
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return BasicSearchBackend()
+
+
+def search_products(queryset, query):
+    """
+    Narrows a Product queryset to the products matching `query`, ordered by
+    relevance. Each product is annotated with its score as `search_rank`,
+    lower first.
+    """
+    if not _WORD_RE.search(query):
+        return queryset.annotate(search_rank=Value(0, output_field=IntegerField())).none()
+    return get_search_backend().search(queryset, query).order_by('search_rank', 'id')
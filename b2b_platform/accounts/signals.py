@@ -4,32 +4,32 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Order, OrderStatusHistory
 
-@receiver(post_save, sender=Order)
-def log_order_status_change(sender, instance, created, **kwargs):
+
+@receiver(post_save, sender=Order, dispatch_uid='accounts.log_order_status_change')
+def log_order_status_change(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """
+    Creates a history record whenever an Order is saved with a new status.
+    The status the order was loaded with is remembered on the instance, so
+    this costs one INSERT when the status changed and no query otherwise.
+    """
+    if raw or (update_fields is not None and 'status' not in update_fields):
+        return
+    if created or instance.status_changed:
+        OrderStatusHistory.objects.create(order=instance, status=instance.status)
+    instance._loaded_status = instance.status
+
+
+def record_status_changes(orders):
     """
-    A signal receiver that creates a history record every time an Order's
-    status is saved.
+    Bulk counterpart of log_order_status_change for orders whose status was
+    written in bulk (bulk_update, bulk_create), which sends no post_save:
+    creates the history rows of every changed order in one INSERT.
     """
-    # If the order is being created for the first time
-    if created:
-        OrderStatusHistory.objects.create(
-            order=instance,
-            status=instance.status
-        )
-    else:
-        # If the order is being updated, check if the status has changed
-        try:
-            # Get the most recent history event for this order
-            last_event = instance.history_events.latest('timestamp')
-            if last_event.status != instance.status:
-                # If the status is different, create a new history record
-                OrderStatusHistory.objects.create(
-                    order=instance,
-                    status=instance.status
-                )
-        except OrderStatusHistory.DoesNotExist:
-            # Fallback in case history is empty but order is being updated
-            OrderStatusHistory.objects.create(
-                order=instance,
-                status=instance.status
-            )
\ No newline at end of file
+    events = [
+        OrderStatusHistory(order=order, status=order.status)
+        for order in orders if order.status_changed
+    ]
+    OrderStatusHistory.objects.bulk_create(events)
+    for order in orders:
+        order._loaded_status = order.status
+    return events
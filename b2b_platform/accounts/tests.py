@@ -1,3 +1,1457 @@
-from django.test import TestCase
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from contextlib import redirect_stdout
+from decimal import Decimal
+from functools import partial
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cart import CheckoutError, checkout
+from .exports import EXPORT_CHUNK_SIZE
+from .budgets import POST_BUDGETS, ROUTE_BUDGETS, Budget, BudgetExceeded, enforce_budget, within_budget
+from .inventory import OutOfStock, pay_order
+from .order_states import InvalidTransition, transition, transition_many
+from .search import search_products
+from .signals import record_status_changes
+from .views import RECOMMENDATIONS_CACHE_SECONDS
+from .models import BuyerRecommendation, Message, Order, OrderStatusHistory, Product, ProductPopularity, User
+from ml_models.benchmark import _pivot_extraction, synthetic_interactions
+from ml_models.popularity import decayed_count, record_paid_order, trending_product_ids
+from ml_models.content import (
+    CONTENT_COMPACT_LOCK_FILENAME, CONTENT_DELTA_FILENAME, ContentIndexRegistry, build_content_index, compact_content_index,
+    load_content_index, remove_from_content_index, similar_to_products, update_content_index,
+)
+from ml_models.recommendations import (
+    ALS_MANIFEST_FILENAME, VERSIONS_DIRNAME, MANIFEST_FILENAME, MODEL_FILENAME, NEIGHBORS_FILENAME, QUALIFYING_STATUSES, STATE_FILENAME, ALSModelRegistry, IVFIndex, ModelRegistry, _history_weights, _item_neighbors, build_user_item_matrix, evaluate_ann_recall,
+    extract_interactions, get_precomputed_recommendations, get_recommendations, load_mmap_artifacts, load_neighbor_table, load_training_state, precompute_buyer_recommendations, score_history, train_and_save_knn_model,
+    update_knn_model_incremental, _als_solve, load_als_model, resolve_model_dir, score_history_als, train_als_model,
+)
+from ml_models.scheduler import load_version_info, prune_versions, publish_version, train_new_version
+
+
+logger = logging.getLogger(__name__)
+
+
+class MarketplaceDataMixin:
+    """Two sellers, two buyers, a multi-category catalog and an order history."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            username='seller', email='seller@example.com', password='pass', role='seller', company_name='Acme Steel')
+        cls.other_seller = User.objects.create_user(
+            username='seller2', email='seller2@example.com', password='pass', role='seller', company_name='Build Co')
+        cls.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass', role='buyer')
+        cls.other_buyer = User.objects.create_user(username='buyer2', email='buyer2@example.com', password='pass', role='buyer')
+
+        categories = [value for value, _ in Product.CATEGORY_CHOICES]
+        cls.products = [
+            Product.objects.create(
+                seller=cls.seller if (i // 2) % 2 else cls.other_seller,
+                name=f'Steel rod {i}' if i % 3 else f'Cement bag {i}',
+                description=f'Grade {i} construction material',
+                category=categories[i % len(categories)],
+                price=10 + i,
+                stock_quantity=100,
+            )
+            for i in range(40)
+        ]
+        statuses = ['pending_approval', 'pending_payment', 'paid', 'shipped', 'completed', 'rejected']
+        cls.orders = []
+        for i in range(60):
+            order = Order.objects.create(
+                product=cls.products[i % len(cls.products)],
+                buyer=cls.buyer if i % 4 else cls.other_buyer,
+                quantity=1 + i % 3,
+                status=statuses[i % len(statuses)],
+            )
+            cls.orders.append(order)
+        cls.conversation_order = next(o for o in cls.orders if o.buyer == cls.buyer and o.seller == cls.seller)
+        for i in range(5):
+            Message.objects.create(order=cls.conversation_order, sender=cls.buyer if i % 2 else cls.seller, body=f'Message {i}')
+
+    def setUp(self):
+        # Cached recommendations from an earlier test would skip the queries under test
+        cache.clear()
+
+
+class EmptyModelDirMixin:
+    """
+    Serves recommendations from an empty model directory instead of the
+    committed models, so pages only hit the popularity fallback. Recommender
+    output is silenced.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Serve recommendations from an empty model directory, not the committed models
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir, ignore_errors=True)
+        for target, registry in [
+            ('ml_models.recommendations.model_registry', ModelRegistry(model_dir)),
+            ('ml_models.recommendations.als_registry', ALSModelRegistry(model_dir)),
+            ('ml_models.content.content_registry', ContentIndexRegistry(model_dir)),
+        ]:
+            patcher = mock.patch(target, registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        quiet = redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(EmptyModelDirMixin, MarketplaceDataMixin, TestCase):
+    """
+    Runs every query a page issues through EXPLAIN QUERY PLAN and fails if
+    any of them reads a whole table instead of an index.
+    """
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    # "SCAN t" without an index is a full table scan; FTS
+                    # queries show up as scans of their virtual table
+                    if detail.startswith('SCAN') and 'INDEX' not in detail and 'VIRTUAL TABLE' not in detail:
+                        scans.append(f'{detail}: {sql}')
+        return scans
+
+    def assertNoFullScans(self, user, url, data=None):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.full_scans(queries.captured_queries), [])
+        return response
+
+    def test_catalog(self):
+        response = self.assertNoFullScans(self.buyer, reverse('buyer_dashboard'))
+        # A later page is fetched from its keyset cursor, not an OFFSET
+        self.assertNoFullScans(self.buyer, f"{reverse('buyer_dashboard')}?{response.context['next_page_query']}")
+
+    def test_catalog_category_filter(self):
+        self.assertNoFullScans(self.buyer, reverse('buyer_dashboard'), {'category': 'steel'})
+
+    def test_catalog_search(self):
+        response = self.assertNoFullScans(self.buyer, reverse('buyer_dashboard'), {'q': 'steel'})
+        self.assertNoFullScans(self.buyer, f"{reverse('buyer_dashboard')}?{response.context['next_page_query']}")
+
+    def test_recommendations_fragment(self):
+        self.assertNoFullScans(self.buyer, reverse('buyer_recommendations'))
+
+    def test_my_orders(self):
+        self.assertNoFullScans(self.buyer, reverse('my_orders'))
+
+    def test_manage_orders(self):
+        self.assertNoFullScans(self.seller, reverse('manage_orders'))
+
+    def test_seller_product_list(self):
+        self.assertNoFullScans(self.seller, reverse('product_list'))
+
+    def test_order_conversation(self):
+        self.assertNoFullScans(self.buyer, reverse('order_conversation', args=[self.conversation_order.id]))
+
+
+class QueryCountTests(MarketplaceDataMixin, TestCase):
+    """
+    Locks in the number of queries each list page runs. The counts must not
+    grow with the number of rows on the page.
+    """
+
+    def add_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(product=self.products[i % len(self.products)], buyer=self.buyer, quantity=1, status='paid')
+            OrderStatusHistory.objects.create(order=order, status='pending_approval')
+            OrderStatusHistory.objects.create(order=order, status='paid')
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_my_orders(self):
+        url = reverse('my_orders')
+        self.client.force_login(self.buyer)
+        with self.assertNumQueries(4):  # session, user, orders + products, history
+            self.client.get(url)
+        before = self.count_queries(self.buyer, url)
+        self.add_orders(30)
+        self.assertEqual(self.count_queries(self.buyer, url), before)
+
+    def test_manage_orders(self):
+        url = reverse('manage_orders')
+        self.client.force_login(self.seller)
+        with self.assertNumQueries(3):  # session, user, orders + products + buyers
+            self.client.get(url)
+        before = self.count_queries(self.seller, url)
+        self.add_orders(30)
+        self.assertEqual(self.count_queries(self.seller, url), before)
+
+    def test_order_conversation(self):
+        url = reverse('order_conversation', args=[self.conversation_order.id])
+        self.client.force_login(self.buyer)
+        with self.assertNumQueries(4):  # session, user, order + product, messages + senders
+            self.client.get(url)
+        for i in range(10):
+            Message.objects.create(order=self.conversation_order, sender=self.seller, body=f'Follow-up {i}')
+        self.assertEqual(self.count_queries(self.buyer, url), 4)
+
+    def test_catalog(self):
+        url = reverse('buyer_dashboard')
+        self.client.force_login(self.buyer)
+        with self.assertNumQueries(3):  # session, user, products + sellers
+            self.client.get(url)
+
+    def test_order_str_does_not_query(self):
+        order = Order.objects.get(pk=self.orders[0].pk)
+        with self.assertNumQueries(0):
+            str(order)
+        order = Order.objects.select_related('product', 'buyer').get(pk=self.orders[0].pk)
+        with self.assertNumQueries(0):
+            self.assertIn(order.product.name, str(order))
+
+
+class RouteBudgetTests(EmptyModelDirMixin, MarketplaceDataMixin, TestCase):
+    """Requests every named route once and holds it to its ROUTE_BUDGETS entry."""
+
+    def route_requests(self):
+        # route name -> (user, method, url args, POST data)
+        pending = next(o for o in self.orders if o.seller == self.seller and o.status == 'pending_approval')
+        to_reject = next(o for o in self.orders if o.seller == self.seller and o.status == 'pending_approval' and o != pending)
+        unpaid = next(o for o in self.orders if o.buyer == self.buyer and o.status == 'pending_payment')
+        paid = next(o for o in self.orders if o.seller == self.seller and o.status == 'paid')
+        shipped = next(o for o in self.orders if o.seller == self.seller and o.status == 'shipped')
+        product = next(p for p in self.products if p.seller == self.seller)
+        return {
+            'register': (None, 'get', [], None),
+            'login': (None, 'get', [], None),
+            'logout': (self.buyer, 'get', [], None),
+            'buyer_dashboard': (self.buyer, 'get', [], None),
+            'buyer_recommendations': (self.buyer, 'get', [], None),
+            'seller_dashboard': (self.seller, 'get', [], None),
+            'product_list': (self.seller, 'get', [], None),
+            'product_add': (self.seller, 'get', [], None),
+            'product_edit': (self.seller, 'get', [product.id], None),
+            'product_delete': (self.seller, 'get', [product.id], None),
+            'my_orders': (self.buyer, 'get', [], None),
+            'place_order': (self.buyer, 'post', [], {'product_id': product.id, 'quantity': 2}),
+            # Consecutive, so checkout finds the cart filled by cart_add
+            'cart_add': (self.buyer, 'post', [], {'product_id': product.id, 'quantity': 2}),
+            'cart': (self.buyer, 'get', [], None),
+            'cart_update': (self.buyer, 'post', [], {'product_id': product.id, 'quantity': 3}),
+            'checkout': (self.buyer, 'post', [], None),
+            'process_payment': (self.buyer, 'get', [unpaid.id], None),
+            'manage_orders': (self.seller, 'get', [], None),
+            'bulk_order_action': (self.seller, 'post', [], {
+                'status': 'shipped',
+                'order_ids': [o.id for o in self.orders if o.seller == self.seller and o.status == 'paid'],
+            }),
+            'accept_order': (self.seller, 'post', [pending.id], None),
+            'reject_order': (self.seller, 'post', [to_reject.id], None),
+            'ship_order': (self.seller, 'post', [paid.id], None),
+            'complete_order': (self.seller, 'post', [shipped.id], None),
+            'order_conversation': (self.buyer, 'get', [self.conversation_order.id], None),
+            'export_orders': (self.seller, 'get', [], {'status': ['paid', 'shipped'], 'start': '2000-01-01'}),
+            'export_products': (self.seller, 'get', [], {'format': 'jsonl'}),
+        }
+
+    def test_every_route_has_a_budget(self):
+        from .urls import urlpatterns
+
+        route_names = {pattern.name for pattern in urlpatterns if pattern.name}
+        self.assertEqual(set(ROUTE_BUDGETS), route_names)
+        self.assertEqual(set(self.route_requests()), route_names)
+        self.assertLessEqual(set(POST_BUDGETS), route_names)
+
+    def test_routes_within_budget(self):
+        for name, (user, method, args, data) in self.route_requests().items():
+            with self.subTest(route=name):
+                if user is None:
+                    self.client.logout()
+                else:
+                    self.client.force_login(user)
+                url = reverse(name, args=args)
+                with enforce_budget(ROUTE_BUDGETS[name], label=name):
+                    response = getattr(self.client, method)(url, data)
+                    if response.streaming:
+                        # Streamed rows are fetched while the body is written
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+
+    def test_payment_within_budget(self):
+        # The first paid order of a product also creates its popularity row
+        unpaid = next(o for o in self.orders if o.buyer == self.buyer and o.status == 'pending_payment')
+        self.client.force_login(self.buyer)
+        with enforce_budget(POST_BUDGETS['process_payment'], label='process_payment (POST)'):
+            response = self.client.post(reverse('process_payment', args=[unpaid.id]))
+        self.assertRedirects(response, reverse('my_orders'), fetch_redirect_response=False)
+        self.assertTrue(ProductPopularity.objects.filter(product_id=unpaid.product_id).exists())
+
+    def test_budget_failure_lists_the_queries(self):
+        with self.assertRaises(BudgetExceeded) as raised:
+            with enforce_budget(Budget(max_queries=1), label='two queries'):
+                list(Product.objects.all())
+                list(Order.objects.all())
+        message = str(raised.exception)
+        self.assertIn('2 queries (budget 1)', message)
+        self.assertIn('FROM "accounts_order"', message)
+
+    @within_budget('my_orders', Budget(max_queries=0))
+    def decorated_without_queries(self):
+        pass
+
+    def test_decorator(self):
+        self.decorated_without_queries()
+
+
+class OrderStateMachineTests(MarketplaceDataMixin, TestCase):
+    """Transitions are conditional UPDATEs: stale, foreign or repeated ones change nothing."""
+
+    def pending_order(self):
+        return next(o for o in self.orders if o.seller == self.seller and o.status == 'pending_approval')
+
+    def test_transition_records_history(self):
+        order = self.pending_order()
+        self.assertEqual(transition(order.id, 'accept', seller=self.seller), 'pending_payment')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending_payment')
+        self.assertEqual(order.history_events.latest('timestamp').status, 'pending_payment')
+
+    def test_repeated_transition_is_rejected(self):
+        order = self.pending_order()
+        transition(order.id, 'accept', seller=self.seller)
+        history_count = order.history_events.count()
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaisesMessage(InvalidTransition, f'Order #{order.id} cannot be rejected'):
+                transition(order.id, 'reject', seller=self.seller)
+        # No read before the UPDATE and no INSERT after it
+        statements = [q['sql'].split()[0] for q in queries.captured_queries]
+        self.assertEqual([s for s in statements if s not in ('SAVEPOINT', 'ROLLBACK', 'RELEASE')], ['UPDATE'])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending_payment')
+        self.assertEqual(order.history_events.count(), history_count)
+
+    def test_other_sellers_order_is_rejected(self):
+        order = self.pending_order()
+        with self.assertRaises(InvalidTransition):
+            transition(order.id, 'accept', seller=self.other_seller)
+        with self.assertRaisesMessage(InvalidTransition, 'cannot be shipped'):
+            transition(order.id, 'ship', seller=self.seller)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending_approval')
+
+    def test_view_reports_stale_transition(self):
+        order = self.pending_order()
+        self.client.force_login(self.seller)
+        self.client.post(reverse('accept_order', args=[order.id]))
+        response = self.client.post(reverse('reject_order', args=[order.id]), follow=True)
+        self.assertContains(response, f'Order #{order.id} can no longer be rejected.')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending_payment')
+
+    def test_double_payment_takes_stock_once(self):
+        order = next(o for o in self.orders if o.buyer == self.buyer and o.status == 'pending_payment')
+        stock = Product.objects.get(pk=order.product_id).stock_quantity
+        pay_order(order, buyer=self.buyer)
+        with self.assertRaises(InvalidTransition):
+            pay_order(Order.objects.get(pk=order.pk), buyer=self.buyer)
+        self.assertEqual(Product.objects.get(pk=order.product_id).stock_quantity, stock - order.quantity)
+
+
+class BulkOrderActionTests(MarketplaceDataMixin, TestCase):
+    """One request moves many orders; each order reports whether it moved."""
+
+    def test_transition_many(self):
+        pending = [o.id for o in self.orders if o.seller == self.seller and o.status == 'pending_approval']
+        paid = next(o.id for o in self.orders if o.seller == self.seller and o.status == 'paid')
+        foreign = next(o.id for o in self.orders if o.seller == self.other_seller and o.status == 'pending_approval')
+        with CaptureQueriesContext(connection) as queries:
+            results = transition_many(pending + [paid, foreign, 999999], 'accept', seller=self.seller)
+        statements = [q['sql'].split()[0] for q in queries.captured_queries]
+        self.assertEqual([s for s in statements if s not in ('SAVEPOINT', 'RELEASE')], ['SELECT', 'UPDATE', 'INSERT'])
+
+        self.assertEqual([pk for pk, error in results.items() if error is None], pending)
+        self.assertEqual(results[paid], 'Order is Paid, not Pending Approval.')
+        self.assertEqual(results[foreign], 'Order not found.')
+        self.assertEqual(results[999999], 'Order not found.')
+        self.assertEqual(Order.objects.filter(pk__in=pending, status='pending_payment').count(), len(pending))
+        self.assertEqual(OrderStatusHistory.objects.filter(order__in=pending, status='pending_payment').count(), len(pending))
+        self.assertEqual(Order.objects.get(pk=foreign).status, 'pending_approval')
+
+    def test_json_response(self):
+        shipped = [o.id for o in self.orders if o.seller == self.seller and o.status == 'shipped']
+        rejected = next(o.id for o in self.orders if o.seller == self.seller and o.status == 'rejected')
+        self.client.force_login(self.seller)
+        response = self.client.post(
+            reverse('bulk_order_action'), {'status': 'completed', 'order_ids': shipped + [rejected]},
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = {row['order_id']: row for row in response.json()['results']}
+        self.assertTrue(all(results[pk]['ok'] for pk in shipped))
+        self.assertFalse(results[rejected]['ok'])
+        self.assertEqual(results[rejected]['error'], 'Order is Rejected, not Shipped.')
+
+    def test_sellers_cannot_mark_orders_paid(self):
+        unpaid = next(o.id for o in self.orders if o.seller == self.seller and o.status == 'pending_payment')
+        self.client.force_login(self.seller)
+        response = self.client.post(
+            reverse('bulk_order_action'), {'status': 'paid', 'order_ids': [unpaid]}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=unpaid).status, 'pending_payment')
+
+    def test_form_post_reports_messages(self):
+        paid = next(o.id for o in self.orders if o.seller == self.seller and o.status == 'paid')
+        completed = next(o.id for o in self.orders if o.seller == self.seller and o.status == 'completed')
+        self.client.force_login(self.seller)
+        response = self.client.post(
+            reverse('bulk_order_action'), {'status': 'shipped', 'order_ids': [paid, completed]}, follow=True)
+        self.assertContains(response, f'1 order(s) marked as Shipped: #{paid}')
+        self.assertContains(response, f'Order #{completed} was not changed. Order is Completed, not Paid.')
+
+
+class CheckoutTests(MarketplaceDataMixin, TestCase):
+    """A whole cart is ordered in one transaction and a fixed number of queries."""
+
+    def count_checkout_queries(self, lines):
+        with CaptureQueriesContext(connection) as queries:
+            orders = checkout(self.buyer, lines)
+        self.assertEqual(len(orders), len(lines))
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        small = self.count_checkout_queries({p.id: 1 for p in self.products[:3]})
+        large = self.count_checkout_queries({p.id: 2 for p in self.products[:30]})
+        self.assertEqual(small, large)
+
+    def test_orders_and_history(self):
+        lines = {self.products[0].id: 2, self.products[3].id: 5}
+        orders = checkout(self.buyer, lines)
+        for order in orders:
+            self.assertEqual(order.seller_id, order.product.seller_id)
+            self.assertEqual(order.quantity, lines[order.product_id])
+            self.assertEqual(list(order.history_events.values_list('status', flat=True)), ['pending_approval'])
+
+    def test_any_bad_line_orders_nothing(self):
+        order_count = Order.objects.count()
+        lines = {self.products[0].id: 1, self.products[1].id: 1000, 999999: 1}
+        with self.assertRaises(CheckoutError) as raised:
+            checkout(self.buyer, lines)
+        self.assertEqual(len(raised.exception.problems), 2)
+        self.assertEqual(Order.objects.count(), order_count)
+
+    def test_cart_views(self):
+        self.client.force_login(self.buyer)
+        for product in self.products[:3]:
+            self.client.post(reverse('cart_add'), {'product_id': product.id, 'quantity': 1})
+        self.client.post(reverse('cart_add'), {'product_id': self.products[0].id, 'quantity': 2})
+        self.client.post(reverse('cart_update'), {'product_id': self.products[2].id, 'quantity': 0})
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual([(line['product'], line['quantity']) for line in response.context['lines']],
+                         [(self.products[0], 3), (self.products[1], 1)])
+
+        response = self.client.post(reverse('checkout'), follow=True)
+        self.assertContains(response, '2 order request(s) have been sent!')
+        self.assertEqual(self.client.session['cart'], {})
+        self.assertEqual(Order.objects.filter(buyer=self.buyer, product=self.products[0], quantity=3).count(), 1)
+
+    def test_deleted_products_leave_the_cart(self):
+        self.client.force_login(self.buyer)
+        gone, kept = self.products[:2]
+        for product in (gone, kept):
+            self.client.post(reverse('cart_add'), {'product_id': product.id, 'quantity': 1})
+
+        # Deleted after the cart was shown: checkout fails once, then the line is gone
+        gone_id = gone.id
+        Product.objects.get(pk=gone_id).delete()
+        response = self.client.post(reverse('checkout'), follow=True)
+        self.assertContains(response, f'Product #{gone_id} is no longer available')
+        self.assertEqual(self.client.session['cart'], {str(kept.id): 1})
+        response = self.client.post(reverse('checkout'), follow=True)
+        self.assertContains(response, '1 order request(s) have been sent!')
+
+        # Deleted before the cart is shown: the cart page drops it
+        for product in self.products[2:4]:
+            self.client.post(reverse('cart_add'), {'product_id': product.id, 'quantity': 1})
+        self.products[2].delete()
+        response = self.client.get(reverse('cart'))
+        self.assertContains(response, '1 product(s) in your cart are no longer available and were removed.')
+        self.assertEqual([line['product'] for line in response.context['lines']], [self.products[3]])
+        self.assertEqual(self.client.session['cart'], {str(self.products[3].id): 1})
+
+
+class ExportTests(MarketplaceDataMixin, TestCase):
+    """Seller exports stream only the seller's own rows, in one query however many there are."""
+
+    def export(self, route, data=None):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse(route), data or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv(self):
+        content = self.export('export_orders', {'status': ['paid', 'shipped']})
+        rows = list(csv.DictReader(io.StringIO(content)))
+        expected = [o for o in self.orders if o.seller == self.seller and o.status in ('paid', 'shipped')]
+        self.assertEqual([int(row['order_id']) for row in rows], [o.id for o in expected])
+        self.assertEqual(rows[0]['buyer_email'], expected[0].buyer.email)
+        self.assertEqual(Decimal(rows[0]['unit_price']), expected[0].product.price)
+
+    def test_products_jsonl(self):
+        content = self.export('export_products', {'format': 'jsonl'})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual({row['product_id'] for row in rows}, {p.id for p in self.products if p.seller == self.seller})
+        self.assertEqual(set(rows[0]), {'product_id', 'name', 'category', 'price', 'stock_quantity', 'created_at', 'updated_at'})
+
+    def test_date_range(self):
+        today = timezone.localdate()
+        self.assertEqual(len(self.export('export_orders', {'end': (today - timedelta(days=1)).isoformat()}).splitlines()), 1)
+        rows = self.export('export_orders', {'start': today.isoformat(), 'end': today.isoformat()}).splitlines()
+        self.assertEqual(len(rows) - 1, sum(1 for o in self.orders if o.seller == self.seller))
+
+    def test_invalid_filters(self):
+        self.client.force_login(self.seller)
+        for data in ({'status': 'lost'}, {'format': 'xml'}, {'start': '2025-02-01', 'end': '2025-01-01'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.client.get(reverse('export_orders'), data).status_code, 400)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        product = next(p for p in self.products if p.seller == self.seller)
+        Order.objects.bulk_create([
+            Order(product=product, buyer=self.buyer, seller=self.seller, quantity=1)
+            for _ in range(EXPORT_CHUNK_SIZE + 10)
+        ])
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('export_orders'))
+        with CaptureQueriesContext(connection) as queries:
+            lines = sum(1 for _ in response.streaming_content)
+        self.assertGreater(lines, EXPORT_CHUNK_SIZE)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+
+class StatusHistoryTests(MarketplaceDataMixin, TestCase):
+    """History rows are written for status changes only, without reading the history first."""
+
+    def test_new_order_records_its_status(self):
+        order = Order.objects.create(product=self.products[0], buyer=self.buyer, quantity=1)
+        self.assertEqual(list(order.history_events.values_list('status', flat=True)), ['pending_approval'])
+
+    def test_status_change_costs_one_insert(self):
+        order = Order.objects.get(pk=self.orders[0].pk)
+        order.status = 'rejected'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries], ['UPDATE', 'INSERT'])
+        self.assertEqual(order.history_events.latest('timestamp').status, 'rejected')
+
+    def test_unchanged_status_is_not_recorded(self):
+        order = Order.objects.get(pk=self.orders[0].pk)
+        order.quantity += 1
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertEqual([q['sql'].split()[0] for q in queries.captured_queries], ['UPDATE'])
+
+        # Saving other fields only leaves the history alone as well
+        order.status = 'rejected'
+        order.save(update_fields=['quantity'])
+        self.assertEqual(order.history_events.count(), 1)
+
+    def test_bulk_status_changes(self):
+        orders = list(Order.objects.filter(seller=self.seller, status='pending_approval'))
+        for order in orders:
+            order.status = 'rejected'
+        unchanged = Order.objects.get(pk=next(o for o in self.orders if o.status == 'paid').pk)
+        with CaptureQueriesContext(connection) as queries:
+            Order.objects.bulk_update(orders, ['status'])
+            events = record_status_changes(orders + [unchanged])
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertEqual(len(events), len(orders))
+        self.assertEqual(OrderStatusHistory.objects.filter(order__in=orders, status='rejected').count(), len(orders))
+        self.assertFalse(any(order.status_changed for order in orders))
+
+
+class KeysetPaginationTests(MarketplaceDataMixin, TestCase):
+    """Cursor pages cover every row exactly once, in both directions, whatever the ties."""
+
+    def setUp(self):
+        super().setUp()
+        # Many products share a timestamp, so only the id breaks ties
+        base = timezone.now()
+        for i, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(created_at=base - timedelta(minutes=i % 3))
+        self.client.force_login(self.buyer)
+
+    def page(self, query=''):
+        response = self.client.get(f"{reverse('buyer_dashboard')}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [product.id for product in response.context['products']], response.context
+
+    def walk(self, params=''):
+        ids, context = self.page(params)
+        pages = [ids]
+        while context['next_page_query']:
+            ids, context = self.page(context['next_page_query'])
+            pages.append(ids)
+        # ...and back again from the last page
+        backwards = [pages[-1]]
+        while context['previous_page_query']:
+            ids, context = self.page(context['previous_page_query'])
+            backwards.append(ids)
+        self.assertEqual(backwards[::-1], pages)
+        return [product_id for ids in pages for product_id in ids]
+
+    def test_walk_catalog(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        walked = self.walk()
+        self.assertEqual(walked, expected)
+        self.assertGreater(len(expected), 2 * 12)
+
+    def test_walk_search_results(self):
+        expected = list(search_products(Product.objects.all(), 'rod').values_list('id', flat=True))
+        self.assertGreater(len(expected), 12)
+        self.assertEqual(self.walk('q=rod'), expected)
+
+    def test_filters_stay_on_page_links(self):
+        category = self.products[0].category
+        expected = list(Product.objects.filter(category=category).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(f'category={category}'), expected)
+
+    def test_tampered_cursor_starts_over(self):
+        first, context = self.page()
+        cursor = context['next_page_query'].split('after=')[1]
+        for query in (f'after={cursor[:-2]}xx', 'after=garbage', f'before={cursor}xx'):
+            self.assertEqual(self.page(query)[0], first)
+
+
+class SearchTests(MarketplaceDataMixin, TestCase):
+    """Catalog search: ranking, prefix matching, other filters, and the index following product edits."""
+
+    def setUp(self):
+        super().setUp()
+        self.pipe = Product.objects.create(
+            seller=self.seller, name='Galvanised pipe', description='Threads onto any steel rod',
+            category=self.products[1].category, price=12, stock_quantity=5)
+
+    def search(self, query, **filters):
+        return list(search_products(Product.objects.filter(**filters), query).values_list('id', flat=True))
+
+    def test_name_matches_rank_first(self):
+        rods = {p.id for p in self.products if p.name.startswith('Steel rod')}
+        results = self.search('rod')
+        self.assertEqual(set(results), rods | {self.pipe.id})
+        self.assertEqual(results[-1], self.pipe.id)
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('ste'), self.search('steel'))
+        self.assertEqual(self.search('galv THR'), [self.pipe.id])
+        self.assertEqual(self.search('"steel" OR'), self.search('steel or'))
+        self.assertEqual(self.search('!!'), [])
+
+    def test_filters_apply_to_every_match(self):
+        category = self.pipe.category
+        expected = {p.id for p in self.products if p.name.startswith('Steel rod') and p.category == category} | {self.pipe.id}
+        self.assertEqual(set(self.search('rod', category=category)), expected)
+
+    def test_index_follows_edits(self):
+        self.pipe.name = 'Copper wire'
+        self.pipe.description = 'Annealed'
+        self.pipe.save()
+        self.assertEqual(self.search('copper'), [self.pipe.id])
+        self.assertEqual(self.search('galvanised'), [])
+
+        self.pipe.delete()
+        self.assertEqual(self.search('copper'), [])
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='accounts.search.BasicSearchBackend')
+    def test_basic_backend(self):
+        # Substring matches, newest first
+        results = self.search('rod', category=self.pipe.category)
+        self.assertEqual(results[0], self.pipe.id)
+        self.assertEqual(results, sorted(results, reverse=True))
+        self.assertEqual(set(results), set(self.search('ro', category=self.pipe.category)))
+
+
+class RecommendationsFragmentTests(MarketplaceDataMixin, TestCase):
+    """The lazily loaded recommendations fragment degrades to nothing and is cached per buyer."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.buyer)
+
+    def fragment(self):
+        response = self.client.get(reverse('buyer_recommendations'))
+        self.assertEqual(response.status_code, 200)
+        return response.context['recommended_products']
+
+    def test_recommender_failure_renders_empty_fragment(self):
+        with mock.patch('accounts.views.get_precomputed_recommendations', side_effect=RuntimeError('model exploded')), \
+                self.assertLogs('accounts.views', 'ERROR') as logs:
+            self.assertEqual(self.fragment(), [])
+        self.assertIn('model exploded', '\n'.join(logs.output))
+
+    def test_cached_within_ttl(self):
+        recommended = self.products[5:9]
+        with mock.patch('accounts.views.get_precomputed_recommendations', return_value=recommended) as precomputed, \
+                mock.patch('accounts.views.get_recommendations') as live:
+            self.assertEqual(self.fragment(), recommended)
+            self.assertEqual(self.fragment(), recommended)
+            self.assertEqual(precomputed.call_count, 1)
+
+            # Once the entry expires the recommender runs again
+            expired = time.time() + RECOMMENDATIONS_CACHE_SECONDS + 1
+            with mock.patch('django.core.cache.backends.locmem.time.time', return_value=expired):
+                self.assertEqual(self.fragment(), recommended)
+            self.assertEqual(precomputed.call_count, 2)
+        live.assert_not_called()
+
+
+class PopularityTests(MarketplaceDataMixin, TestCase):
+    """Paid orders feed the trending lists, weighted by how recently they were paid."""
+
+    def test_payment_updates_score(self):
+        order = next(o for o in self.orders if o.buyer == self.buyer and o.status == 'pending_payment')
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('process_payment', args=[order.id]))
+        popularity = ProductPopularity.objects.get(product_id=order.product_id)
+        self.assertAlmostEqual(decayed_count(popularity.score), 1, places=3)
+        self.assertEqual(trending_product_ids(), [order.product_id])
+
+        record_paid_order(order)
+        popularity.refresh_from_db()
+        self.assertAlmostEqual(decayed_count(popularity.score), 2, places=3)
+
+    def test_payment_survives_index_failure(self):
+        order = next(o for o in self.orders if o.buyer == self.buyer and o.status == 'pending_payment')
+        self.client.force_login(self.buyer)
+        with mock.patch('accounts.views.record_paid_order', side_effect=RuntimeError('boom')), \
+                self.assertLogs('accounts.views', 'ERROR') as logs:
+            response = self.client.post(reverse('process_payment', args=[order.id]))
+        self.assertRedirects(response, reverse('my_orders'), fetch_redirect_response=False)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        self.assertIn(f'popularity index for order {order.id}', logs.output[0])
+
+    def test_category_follows_product_edit(self):
+        product = self.products[0]
+        record_paid_order(self.orders[0])
+        other_category = next(value for value, _ in Product.CATEGORY_CHOICES if value != product.category)
+        self.assertEqual(trending_product_ids([other_category]), [])
+
+        product.category = other_category
+        product.save()
+        self.assertEqual(trending_product_ids([other_category]), [product.id])
+        self.assertEqual(ProductPopularity.objects.get(product=product).category, other_category)
+
+    def test_category_follows_seller_edit(self):
+        product = self.products[0]
+        record_paid_order(self.orders[0])
+        other_category = next(value for value, _ in Product.CATEGORY_CHOICES if value != product.category)
+
+        self.client.force_login(product.seller)
+        # The content index lives in the model directory; it is not under test here
+        with mock.patch('accounts.views.refresh_content_index'):
+            response = self.client.post(reverse('product_edit', args=[product.id]), {
+                'name': product.name, 'description': product.description, 'price': product.price,
+                'stock_quantity': product.stock_quantity, 'category': other_category,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(trending_product_ids([other_category]), [product.id])
+
+    def test_recent_orders_rank_higher(self):
+        now = timezone.now()
+        old, recent = self.orders[0], self.orders[1]
+        # Two orders from a month ago count for less than one from today
+        record_paid_order(old, paid_at=now - timedelta(days=30))
+        record_paid_order(old, paid_at=now - timedelta(days=30))
+        record_paid_order(recent, paid_at=now)
+        self.assertEqual(trending_product_ids(num_recs=2), [recent.product_id, old.product_id])
+        self.assertEqual(trending_product_ids(num_recs=2, exclude_ids=[recent.product_id]), [old.product_id])
+
+
+class RecommenderDataMixin(MarketplaceDataMixin):
+    """
+    Adds shoppers with overlapping paid orders, so products are co-purchased,
+    and gives every test a throwaway model directory. Training output is
+    silenced.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.shoppers = [
+            User.objects.create_user(username=f'shopper{i}', email=f'shopper{i}@example.com', password='pass', role='buyer')
+            for i in range(8)
+        ]
+        # Shopper k buys products k..k+3, so neighbouring windows overlap
+        cls.add_orders([(shopper, cls.products[k + j]) for k, shopper in enumerate(cls.shoppers) for j in range(4)])
+
+    @staticmethod
+    def add_orders(pairs, status='paid'):
+        return Order.objects.bulk_create([
+            Order(product=product, buyer=buyer, seller_id=product.seller_id, quantity=1, status=status)
+            for buyer, product in pairs
+        ])
+
+    def setUp(self):
+        super().setUp()
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        quiet = redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+
+class PrecomputeRecommendationsTests(RecommenderDataMixin, TestCase):
+    """Precomputed recommendations follow the live path's masking and skip what was deleted or ordered since."""
+
+    def stored(self, buyer):
+        return list(BuyerRecommendation.objects.filter(buyer=buyer).order_by('rank').values_list('product_id', flat=True))
+
+    def test_every_ordered_product_is_masked(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        shopper = self.shoppers[2]
+        precompute_buyer_recommendations(model_dir=self.model_dir)
+        top = self.stored(shopper)[0]
+
+        # An order that does not count as an interaction still masks the product
+        self.add_orders([(shopper, Product.objects.get(pk=top))], status='pending_approval')
+        precompute_buyer_recommendations(model_dir=self.model_dir)
+        self.assertNotIn(top, self.stored(shopper))
+        ordered = set(Order.objects.filter(buyer=shopper).values_list('product_id', flat=True))
+        self.assertFalse(ordered & set(self.stored(shopper)))
+
+    def test_read_skips_products_ordered_since(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        shopper = self.shoppers[2]
+        precompute_buyer_recommendations(model_dir=self.model_dir)
+        stored = self.stored(shopper)
+        self.assertEqual([p.id for p in get_precomputed_recommendations(shopper)], stored[:4])
+
+        self.add_orders([(shopper, Product.objects.get(pk=stored[0]))], status='pending_payment')
+        self.assertEqual([p.id for p in get_precomputed_recommendations(shopper)], stored[1:5])
+        # The lists come from the KNN model; another engine serves live
+        self.assertEqual(get_precomputed_recommendations(shopper, engine='als'), [])
+        with override_settings(RECOMMENDER_ENGINE='als'):
+            self.assertEqual(get_precomputed_recommendations(shopper), [])
+
+    def test_precompute_after_deletions(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        precompute_buyer_recommendations(model_dir=self.model_dir)
+        recommended = set(BuyerRecommendation.objects.values_list('product_id', flat=True))
+        self.assertTrue(recommended)
+
+        deleted_product = Product.objects.get(pk=min(recommended))
+        deleted_product.delete()
+        self.shoppers[0].delete()
+        precompute_buyer_recommendations(model_dir=self.model_dir)
+
+        rows = list(BuyerRecommendation.objects.values_list('buyer_id', 'product_id', 'rank'))
+        self.assertTrue(rows)
+        self.assertNotIn(deleted_product.pk, {product_id for _, product_id, _ in rows})
+        self.assertNotIn(self.shoppers[0].pk, {buyer_id for buyer_id, _, _ in rows})
+        # Ranks stay contiguous once deleted products are skipped
+        for buyer_id in {buyer_id for buyer_id, _, _ in rows}:
+            ranks = sorted(rank for b, _, rank in rows if b == buyer_id)
+            self.assertEqual(ranks, list(range(1, len(ranks) + 1)))
+
+
+class ModelRegistryTests(RecommenderDataMixin, TestCase):
+    """The registry loads artifacts once, reloads them when they change and survives bad files."""
+
+    def test_reload_and_fallback(self):
+        registry = ModelRegistry(self.model_dir)
+        self.assertIsNone(registry.get())
+        self.assertEqual(registry.stats()['misses'], 1)
+
+        train_and_save_knn_model(model_dir=self.model_dir)
+        artifacts = registry.get()
+        self.assertIsNotNone(artifacts)
+        self.assertIs(registry.get(), artifacts)
+        self.assertEqual(registry.stats()['reloads'], 1)
+        self.assertEqual(registry.stats()['cache_hits'], 1)
+
+        # New artifacts on disk are picked up on the next call
+        self.add_orders([(self.shoppers[0], self.products[30])])
+        train_and_save_knn_model(model_dir=self.model_dir)
+        retrained = registry.get()
+        self.assertIsNot(retrained, artifacts)
+        self.assertIn(self.products[30].id, retrained['id_to_idx'])
+
+        # A corrupt manifest keeps the last good version serving, without retrying every call
+        with open(os.path.join(self.model_dir, MANIFEST_FILENAME), 'w') as f:
+            f.write('{not json')
+        with self.assertLogs('ml_models.recommendations', 'ERROR') as logs:
+            self.assertIs(registry.get(), retrained)
+            self.assertIs(registry.get(), retrained)
+            self.assertEqual(len(logs.output), 1)
+            self.assertEqual(registry.stats()['reload_failures'], 1)
+
+            registry.clear()
+            self.assertIsNone(registry.get())
+
+    def test_stats_are_logged_periodically(self):
+        registry = ModelRegistry(self.model_dir)
+        train_and_save_knn_model(model_dir=self.model_dir)
+        with mock.patch('ml_models.recommendations.REGISTRY_STATS_LOG_EVERY', 3), \
+                self.assertLogs('ml_models.recommendations', 'INFO') as logs:
+            for _ in range(6):
+                registry.get()
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("'reloads': 1", logs.output[0])
+        self.assertIn("'cache_hits': 5", logs.output[1])
+
+
+class MmapArtifactTests(RecommenderDataMixin, TestCase):
+    """The memory-mapped .npy artifacts serve the same recommendations as the joblib files they replace."""
+
+    def setUp(self):
+        super().setUp()
+        self.histories = {
+            shopper.id: [(product_id, 'paid', timezone.now()) for product_id in
+                         Order.objects.filter(buyer=shopper).values_list('product_id', flat=True)]
+            for shopper in self.shoppers
+        }
+
+    def recommendations(self, artifacts):
+        return {
+            buyer_id: score_history(history, artifacts, 4, half_life_days=None)
+            for buyer_id, history in self.histories.items()
+        }
+
+    @staticmethod
+    def memory_mapped(array):
+        # csr_matrix wraps the arrays in plain views; the mapping is underneath
+        while array is not None:
+            if isinstance(array, np.memmap):
+                return True
+            array = getattr(array, 'base', None)
+        return False
+
+    @staticmethod
+    def strip_npy(model_dir):
+        for name in os.listdir(model_dir):
+            if name.endswith('.npy') or name == MANIFEST_FILENAME:
+                os.remove(os.path.join(model_dir, name))
+
+    def test_registry_memory_maps_npy(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        with mock.patch('numpy.load', wraps=np.load) as load:
+            artifacts = ModelRegistry(self.model_dir).get()
+        self.assertTrue(load.call_args_list)
+        self.assertTrue(all(call.kwargs.get('mmap_mode') == 'r' for call in load.call_args_list))
+        for array in (
+            artifacts['similarity'].data, artifacts['similarity'].indices, artifacts['similarity'].indptr,
+            artifacts['item_user'].data, artifacts['neighbors']['neighbor_ids'], artifacts['neighbors']['scores'],
+        ):
+            self.assertTrue(self.memory_mapped(array))
+            self.assertFalse(array.flags.writeable)
+
+    def test_joblib_only_directory(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        expected = self.recommendations(load_mmap_artifacts(self.model_dir))
+        self.assertTrue(any(expected.values()))
+
+        self.strip_npy(self.model_dir)
+        artifacts = ModelRegistry(self.model_dir).get()
+        self.assertFalse(self.memory_mapped(artifacts['similarity'].data))
+        self.assertEqual(self.recommendations(artifacts), expected)
+
+    def test_convert_command(self):
+        published = train_new_version(full=True, root=self.model_dir)
+        expected = self.recommendations(load_mmap_artifacts(published))
+        self.strip_npy(published)
+
+        registry = ModelRegistry(self.model_dir)
+        self.assertEqual(self.recommendations(registry.get()), expected)
+        with mock.patch('ml_models.scheduler.train_new_version', partial(train_new_version, root=self.model_dir)):
+            call_command('convert_recommender_artifacts', stdout=io.StringIO(), stderr=io.StringIO())
+
+        converted = resolve_model_dir(self.model_dir)
+        self.assertNotEqual(converted, os.path.realpath(published))
+        self.assertTrue(os.path.exists(os.path.join(converted, MANIFEST_FILENAME)))
+        artifacts = registry.get()
+        self.assertTrue(self.memory_mapped(artifacts['similarity'].data))
+        self.assertEqual(self.recommendations(artifacts), expected)
+
+
+class HistoryScoringTests(RecommenderDataMixin, TestCase):
+    """Live scoring is one product of the weighted history vector with the similarity matrix."""
+
+    def setUp(self):
+        super().setUp()
+        train_and_save_knn_model(model_dir=self.model_dir)
+        self.artifacts = load_mmap_artifacts(self.model_dir)
+        self.similarity = self.artifacts['similarity'].toarray().astype(np.float64)
+        self.product_ids = self.artifacts['neighbors']['product_ids']
+
+    def assertTopScores(self, recommended, weights, ordered_ids, num_recs):
+        # Scores straight from history_vector @ similarity, ordered products masked
+        history_vector = np.zeros(len(self.product_ids))
+        for product_id, weight in weights.items():
+            history_vector[self.artifacts['id_to_idx'].get(product_id)] = weight
+        scores = {int(pid): score for pid, score in zip(self.product_ids, history_vector @ self.similarity)
+                  if score > 0 and int(pid) not in ordered_ids}
+        self.assertEqual(len(recommended), min(num_recs * 2, len(scores)))
+        ranked = [scores[pid] for pid in recommended]
+        self.assertTrue(all(a >= b - 1e-6 for a, b in zip(ranked, ranked[1:])))
+        left_out = [score for pid, score in scores.items() if pid not in recommended]
+        self.assertLessEqual(max(left_out, default=0), min(ranked) + 1e-6)
+
+    def test_multi_seed_scores(self):
+        seeds = [self.products[k].id for k in (2, 3, 7)]
+        history = [(product_id, 'paid', timezone.now()) for product_id in seeds]
+        recommended = score_history(history, self.artifacts, 3, half_life_days=None)
+        self.assertTrue(recommended)
+        self.assertTopScores(recommended, dict.fromkeys(seeds, 1.0), set(seeds), 3)
+
+    def test_every_ordered_product_is_masked(self):
+        seed = self.products[3].id
+        everything = score_history([(seed, 'paid', timezone.now())], self.artifacts, 10, half_life_days=None)
+        self.assertGreaterEqual(len(everything), 3)
+        # Open and rejected orders seed nothing but are never recommended back
+        unpaid = [(product_id, status, timezone.now()) for product_id, status in zip(everything[:2], ('pending_approval', 'rejected'))]
+        recommended = score_history([(seed, 'paid', timezone.now())] + unpaid, self.artifacts, 10, half_life_days=None)
+        self.assertFalse(set(everything[:2]) & set(recommended))
+        self.assertNotIn(seed, recommended)
+        self.assertEqual(score_history(unpaid, self.artifacts, 10, half_life_days=None), [])
+
+    def test_half_life_weights(self):
+        now = timezone.now()
+        old, recent = self.products[0].id, self.products[6].id
+        history = [(old, 'paid', now - timedelta(days=180)), (recent, 'completed', now - timedelta(days=1)),
+                   (recent, 'paid', now - timedelta(days=400))]
+        id_to_idx = self.artifacts['id_to_idx']
+        weights, ordered = _history_weights(history, id_to_idx, 90, now)
+        self.assertAlmostEqual(weights[id_to_idx.get(old)], 0.25)
+        # A repeat purchase only refreshes recency
+        self.assertAlmostEqual(weights[id_to_idx.get(recent)], 0.5 ** (1 / 90))
+        self.assertEqual(ordered, {id_to_idx.get(old), id_to_idx.get(recent)})
+        self.assertEqual(_history_weights(history, id_to_idx, None, now)[0], dict.fromkeys(ordered, 1.0))
+
+        recommended = score_history(history, self.artifacts, 3, half_life_days=90, now=now)
+        self.assertTopScores(recommended, {old: 0.25, recent: 0.5 ** (1 / 90)}, {old, recent}, 3)
+
+    def test_live_recommendations_take_two_queries(self):
+        content = ContentIndexRegistry(tempfile.mkdtemp(dir=self.model_dir))
+        with mock.patch('ml_models.recommendations.model_registry', ModelRegistry(self.model_dir)), \
+                mock.patch('ml_models.content.content_registry', content):
+            get_recommendations(self.shoppers[2], engine='knn')
+            # The order history, then the recommended products
+            with self.assertNumQueries(2):
+                recommended = get_recommendations(self.shoppers[2], engine='knn')
+        self.assertEqual(len(recommended), 4)
+
+
+@skipUnless(importlib.util.find_spec('pandas'), 'the pivot-table reference needs pandas')
+class InteractionExtractionTests(RecommenderDataMixin, TestCase):
+    """The streaming extractor builds the same matrix as the old pandas pivot table."""
+
+    def test_matches_pivot_table(self):
+        # Repeat purchases, and orders that do not count as interactions
+        self.add_orders([(self.shoppers[0], self.products[0]), (self.shoppers[0], self.products[1])], status='completed')
+        self.add_orders([(self.shoppers[1], self.products[30])], status='pending_payment')
+        pairs = list(Order.objects.filter(status__in=QUALIFYING_STATUSES).values_list('buyer_id', 'product_id'))
+        self.assertGreater(len(pairs), len(set(pairs)))
+
+        with mock.patch.object(QuerySet, 'iterator', autospec=True, side_effect=QuerySet.iterator) as iterator:
+            user_item, buyer_ids, product_ids = extract_interactions(chunk_size=7)
+        self.assertEqual(iterator.call_args.kwargs, {'chunk_size': 7})
+
+        # The pivot table orders rows and columns by id; the extractor by first appearance
+        self.assertEqual(sorted(buyer_ids.tolist()), sorted({buyer for buyer, _ in pairs}))
+        self.assertEqual(sorted(product_ids.tolist()), sorted({product for _, product in pairs}))
+        by_id = user_item[np.argsort(buyer_ids)][:, np.argsort(product_ids)]
+        np.testing.assert_array_equal(by_id.toarray(), _pivot_extraction(pairs).toarray())
+        self.assertEqual(user_item.nnz, len(set(pairs)))
+        self.assertTrue((user_item.data == 1).all())
+
+
+class NeighborTableTests(RecommenderDataMixin, TestCase):
+    """The neighbour table is the exact cosine top-K of the fitted item vectors, and can be rebuilt on its own."""
+
+    def test_rows_match_brute_force(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        model_knn = joblib.load(os.path.join(self.model_dir, MODEL_FILENAME))
+        table = load_neighbor_table(self.model_dir)
+        product_ids = table['product_ids']
+        top_k = table['neighbor_ids'].shape[1]
+
+        vectors = model_knn._fit_X.toarray()
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarities = vectors @ vectors.T
+        for row, product_id in enumerate(product_ids):
+            candidates = [(-similarities[row, col], product_ids[col]) for col in range(len(product_ids))
+                          if col != row and similarities[row, col] > 0]
+            expected = sorted(candidates)[:top_k]
+            count = len(expected)
+            self.assertEqual(table['neighbor_ids'][row, :count].tolist(), [pid for _, pid in expected], f"product #{product_id}")
+            np.testing.assert_allclose(table['scores'][row, :count], [-score for score, _ in expected], rtol=1e-5)
+            self.assertTrue((table['neighbor_ids'][row, count:] == -1).all())
+
+    def test_neighbors_only_does_not_retrain(self):
+        published = train_new_version(full=True, root=self.model_dir)
+        with open(os.path.join(published, MODEL_FILENAME), 'rb') as f:
+            model_bytes = f.read()
+        expected = load_neighbor_table(published)
+        os.remove(os.path.join(published, NEIGHBORS_FILENAME))
+
+        with mock.patch('ml_models.scheduler.train_new_version', partial(train_new_version, root=self.model_dir)), \
+                mock.patch('ml_models.recommendations.extract_interactions', side_effect=AssertionError('retrained')), \
+                mock.patch('ml_models.recommendations.NearestNeighbors', side_effect=AssertionError('refitted')):
+            call_command('train_recommender', '--neighbors-only', stdout=io.StringIO(), stderr=io.StringIO())
+
+        rebuilt = resolve_model_dir(self.model_dir)
+        self.assertNotEqual(rebuilt, os.path.realpath(published))
+        with open(os.path.join(rebuilt, MODEL_FILENAME), 'rb') as f:
+            self.assertEqual(f.read(), model_bytes)
+        table = load_neighbor_table(rebuilt)
+        for key in ('product_ids', 'neighbor_ids'):
+            np.testing.assert_array_equal(table[key], expected[key])
+        np.testing.assert_allclose(table['scores'], expected['scores'])
+
+
+class IncrementalTrainingTests(RecommenderDataMixin, TestCase):
+    """An incremental run must end in the same model as a full rebuild on the same orders."""
+
+    @staticmethod
+    def neighbours_by_product(model_dir):
+        table = load_neighbor_table(model_dir)
+        return {
+            int(product_id): (table['neighbor_ids'][i].tolist(), table['scores'][i])
+            for i, product_id in enumerate(table['product_ids'])
+        }
+
+    @staticmethod
+    def interactions(state):
+        user_item = state['user_item'].tocoo()
+        return {
+            (int(state['buyer_ids'][row]), int(state['product_ids'][col]))
+            for row, col in zip(user_item.row, user_item.col)
+        }
+
+    def test_incremental_matches_full_rebuild(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+
+        # New buyers and products, repeat purchases, and older orders that get paid
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='pass', role='buyer')
+        self.add_orders([(newcomer, self.products[35]), (newcomer, self.products[2]), (self.shoppers[1], self.products[1])])
+        self.add_orders([(self.shoppers[5], self.products[36])], status='pending_approval')
+        pending = list(Order.objects.filter(status='pending_payment').values_list('id', flat=True)[:3])
+        Order.objects.filter(id__in=pending).update(status='paid')
+
+        update_knn_model_incremental(model_dir=self.model_dir)
+        full_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, full_dir, ignore_errors=True)
+        train_and_save_knn_model(model_dir=full_dir)
+
+        incremental, full = load_training_state(self.model_dir), load_training_state(full_dir)
+        self.assertEqual(self.interactions(incremental), self.interactions(full))
+        self.assertEqual(incremental['watermark'], full['watermark'])
+        self.assertEqual(sorted(incremental['pending_ids'].tolist()), sorted(full['pending_ids'].tolist()))
+
+        incremental_table, full_table = self.neighbours_by_product(self.model_dir), self.neighbours_by_product(full_dir)
+        self.assertEqual(set(incremental_table), set(full_table))
+        for product_id, (neighbour_ids, scores) in full_table.items():
+            self.assertEqual(incremental_table[product_id][0], neighbour_ids, f"product #{product_id}")
+            np.testing.assert_allclose(incremental_table[product_id][1], scores, rtol=1e-5)
+
+
+class ModelVersioningTests(RecommenderDataMixin, TestCase):
+    """Training runs publish new versions atomically, discard failed runs and prune old versions."""
+
+    def versions(self):
+        return sorted(os.listdir(os.path.join(self.model_dir, VERSIONS_DIRNAME)))
+
+    def test_publish_and_prune(self):
+        first = train_new_version(full=True, root=self.model_dir)
+        self.assertEqual(resolve_model_dir(self.model_dir), os.path.realpath(first))
+        self.assertEqual(load_version_info(self.model_dir)['last_order_id'], Order.objects.latest('id').id)
+
+        # An incremental run continues from the published state
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='pass', role='buyer')
+        self.add_orders([(newcomer, self.products[2])])
+        second = train_new_version(root=self.model_dir)
+        self.assertEqual(resolve_model_dir(self.model_dir), os.path.realpath(second))
+        self.assertIn(newcomer.id, load_training_state(second)['buyer_ids'].tolist())
+        self.assertEqual(self.versions(), [os.path.basename(first), os.path.basename(second)])
+
+        # The published version survives pruning even when it is not the newest
+        publish_version(first, root=self.model_dir)
+        prune_versions(root=self.model_dir, keep=1)
+        self.assertEqual(self.versions(), [os.path.basename(first), os.path.basename(second)])
+        publish_version(second, root=self.model_dir)
+        prune_versions(root=self.model_dir, keep=1)
+        self.assertEqual(self.versions(), [os.path.basename(second)])
+
+    def test_up_to_date_run_publishes_nothing(self):
+        published = train_new_version(full=True, root=self.model_dir)
+        # A repeat purchase adds no interaction to the binary matrix
+        self.add_orders([(self.shoppers[1], self.products[1])])
+        state_path = os.path.join(published, STATE_FILENAME)
+        mtime = os.stat(state_path).st_mtime_ns
+
+        self.assertIsNone(train_new_version(root=self.model_dir))
+        self.assertEqual(self.versions(), [os.path.basename(published)])
+        self.assertEqual(resolve_model_dir(self.model_dir), os.path.realpath(published))
+        self.assertEqual(os.stat(state_path).st_mtime_ns, mtime)
+
+    def test_failed_runs_keep_the_published_version(self):
+        published = train_new_version(full=True, root=self.model_dir)
+
+        self.assertIsNone(train_new_version(train=lambda model_dir: None, root=self.model_dir))
+
+        def crash(model_dir):
+            with open(os.path.join(model_dir, 'partial.npy'), 'w') as f:
+                f.write('half written')
+            raise RuntimeError('training crashed')
+
+        with self.assertRaises(RuntimeError):
+            train_new_version(train=crash, root=self.model_dir)
+        self.assertEqual(self.versions(), [os.path.basename(published)])
+        self.assertEqual(resolve_model_dir(self.model_dir), os.path.realpath(published))
+
+
+class IVFIndexTests(TestCase):
+    """The approximate index against brute force on a small clustered catalog."""
+
+    def setUp(self):
+        user_item, _, self.product_ids = build_user_item_matrix(
+            iter(synthetic_interactions(300, 400, 6000, n_segments=10))
+        )
+        self.item_user = user_item.T.tocsr()
+
+    def recall(self, n_probe):
+        index = IVFIndex(n_probe=n_probe, n_lists=10, dim=16)
+        return evaluate_ann_recall(self.item_user, self.product_ids, index, top_k=10, sample_size=200)['recall_at_k']
+
+    def test_recall_grows_with_probes(self):
+        recalls = [self.recall(n_probe) for n_probe in (1, 2, 4, 10)]
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreaterEqual(recalls[1], 0.85)
+        # Probing every partition is an exhaustive search, up to float32 ties at the cut-off
+        self.assertGreaterEqual(recalls[-1], 0.99)
+
+    def test_matches_brute_force_format(self):
+        rows = np.arange(50)
+        approx_idx, approx_scores = IVFIndex(n_probe=10, n_lists=10, dim=16).fit(self.item_user).query(rows, 10, self.product_ids)
+        exact_idx, exact_scores = _item_neighbors(self.item_user, rows, 10, self.product_ids)
+        self.assertEqual(approx_idx.shape, exact_idx.shape)
+        self.assertFalse((approx_idx == rows[:, None]).any())
+        # Scores are exact cosines, best first
+        np.testing.assert_allclose(approx_scores[:, 0], exact_scores[:, 0], rtol=1e-4)
+        self.assertTrue((np.diff(approx_scores, axis=1) <= 1e-6).all())
+
+
+class ALSEngineTests(RecommenderDataMixin, TestCase):
+    """ALS serving: exact top-k over the item factors, and fold-in for buyers the model has not seen."""
+
+    def setUp(self):
+        super().setUp()
+        train_als_model(factors=8, iterations=5, model_dir=self.model_dir)
+        self.artifacts = load_als_model(self.model_dir)
+        self.shopper = self.shoppers[3]
+        self.history = [
+            (product_id, 'paid', timezone.now())
+            for product_id in Order.objects.filter(buyer=self.shopper).values_list('product_id', flat=True)
+        ]
+
+    def expected_top(self, user_vector, n):
+        ordered = {self.artifacts['id_to_idx'].get(product_id) for product_id, _, _ in self.history}
+        scores = self.artifacts['item_factors'] @ user_vector
+        ranked = [int(i) for i in np.lexsort((np.arange(len(scores)), -scores)) if int(i) not in ordered]
+        return [int(self.artifacts['product_ids'][i]) for i in ranked[:n]]
+
+    def test_known_buyer_top_k(self):
+        recommended = score_history_als(self.history, self.artifacts, 3, buyer_id=self.shopper.id, half_life_days=None)
+        row = self.artifacts['buyer_index'].get(self.shopper.id)
+        self.assertEqual(recommended, self.expected_top(self.artifacts['user_factors'][row], 6))
+        self.assertFalse({product_id for product_id, _, _ in self.history} & set(recommended))
+
+    def test_fold_in_solves_the_user_step(self):
+        # With the final item factors fixed, folding in a buyer's history is
+        # exactly ALS's own least-squares solve for that buyer
+        cols = sorted(self.artifacts['id_to_idx'].get(product_id) for product_id, _, _ in self.history)
+        item_factors = np.asarray(self.artifacts['item_factors'], dtype=np.float64)
+        interactions = csr_matrix((np.ones(len(cols)), ([0] * len(cols), cols)), shape=(1, item_factors.shape[0]))
+        with open(os.path.join(self.model_dir, ALS_MANIFEST_FILENAME)) as f:
+            regularization = json.load(f)['regularization']
+        solved = _als_solve(interactions, item_factors, regularization, self.artifacts['alpha'])[0]
+
+        recommended = score_history_als(self.history, self.artifacts, 3, buyer_id=None, half_life_days=None)
+        self.assertEqual(recommended, self.expected_top(solved.astype(np.float32), 6))
+
+
+class ContentIndexTests(RecommenderDataMixin, TestCase):
+    """Product edits reach the content index through its delta log, which is compacted as it grows."""
+
+    def setUp(self):
+        super().setUp()
+        build_content_index(model_dir=self.model_dir)
+        patcher = mock.patch('ml_models.content.content_registry', ContentIndexRegistry(self.model_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def copy_of(self, original, target):
+        # Gives `target` the same text as `original`, so it becomes its nearest match
+        target.name, target.description, target.category = original.name, original.description, original.category
+        target.save()
+        update_content_index(target, model_dir=self.model_dir)
+
+    @staticmethod
+    def rows_by_product(index):
+        return {int(pid): index['vectors'][i].toarray() for i, pid in enumerate(index['product_ids'])}
+
+    def test_edits_and_deletions(self):
+        seed, edited = self.products[0], self.products[1]
+        self.assertNotEqual(similar_to_products([seed.id], 1), [edited.id])
+
+        self.copy_of(seed, edited)
+        self.assertEqual(similar_to_products([seed.id], 1), [edited.id])
+
+        remove_from_content_index(edited.id, model_dir=self.model_dir)
+        index = load_content_index(self.model_dir)
+        self.assertIsNone(index['id_to_idx'].get(edited.id))
+        self.assertEqual(len(index['product_ids']), len(self.products) - 1)
+        self.assertNotIn(edited.id, similar_to_products([seed.id], len(self.products)))
+
+    def test_compaction_keeps_the_merged_index(self):
+        self.copy_of(self.products[0], self.products[1])
+        remove_from_content_index(self.products[2].id, model_dir=self.model_dir)
+        before = self.rows_by_product(load_content_index(self.model_dir))
+
+        # Another worker is compacting: leave the log alone
+        lock_path = os.path.join(self.model_dir, CONTENT_COMPACT_LOCK_FILENAME)
+        open(lock_path, 'w').close()
+        self.assertFalse(compact_content_index(self.model_dir))
+        os.remove(lock_path)
+
+        self.assertTrue(compact_content_index(self.model_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.model_dir, CONTENT_DELTA_FILENAME)))
+        self.assertFalse(os.path.exists(lock_path))
+        after = self.rows_by_product(load_content_index(self.model_dir))
+        self.assertEqual(set(after), set(before))
+        for product_id, row in before.items():
+            np.testing.assert_allclose(after[product_id], row)
+
+    def test_large_log_is_compacted_automatically(self):
+        with mock.patch('ml_models.content.CONTENT_DELTA_COMPACT_BYTES', 1), \
+                self.assertLogs('ml_models.content', 'INFO') as logs:
+            self.copy_of(self.products[0], self.products[1])
+        self.assertIn('Compacted the content index delta', logs.output[0])
+        self.assertFalse(os.path.exists(os.path.join(self.model_dir, CONTENT_DELTA_FILENAME)))
+        self.assertEqual(similar_to_products([self.products[0].id], 1), [self.products[1].id])
+
+    def test_new_products_blend_into_warm_recommendations(self):
+        train_and_save_knn_model(model_dir=self.model_dir)
+        shopper = self.shoppers[0]
+        listing = Product.objects.create(
+            seller=self.seller, name='New listing', description='', category='steel', price=10, stock_quantity=5)
+        self.copy_of(self.products[0], listing)
+
+        with mock.patch('ml_models.recommendations.model_registry', ModelRegistry(self.model_dir)):
+            recommended = [product.id for product in get_recommendations(shopper, num_recs=4, engine='knn')]
+        self.assertEqual(len(recommended), 4)
+        # The model has never seen the listing ordered; its text earns it the last slot
+        self.assertEqual(recommended[-1], listing.id)
+        self.assertFalse(set(recommended) & set(Order.objects.filter(buyer=shopper).values_list('product_id', flat=True)))
+
+
+class HotProductLoadTests(TransactionTestCase):
+    """
+    Many buyers paying for the same product at once: every successful
+    payment must take exactly its stock and none may oversell.
+    """
+    payers = 8
+    orders_per_payer = 15
+    initial_stock = 100
+
+    def test_concurrent_payments(self):
+        seller = User.objects.create_user(username='seller', email='seller@example.com', password='pass', role='seller')
+        product = Product.objects.create(
+            seller=seller, name='Hot rod', description='Best seller', category='steel', price=10, stock_quantity=self.initial_stock)
+        orders_by_payer = []
+        for i in range(self.payers):
+            buyer = User.objects.create_user(username=f'buyer{i}', email=f'buyer{i}@example.com', password='pass', role='buyer')
+            orders_by_payer.append([
+                Order.objects.create(product=product, buyer=buyer, quantity=1 + j % 2, status='pending_payment')
+                for j in range(self.orders_per_payer)
+            ])
+
+        results = {'paid': [], 'out_of_stock': [], 'errors': []}
+        lock = threading.Lock()
+        start_line = threading.Barrier(self.payers)
+
+        def pay_all(orders):
+            try:
+                start_line.wait()
+                for order in orders:
+                    try:
+                        pay_order(order)
+                        outcome = 'paid'
+                    except OutOfStock:
+                        outcome = 'out_of_stock'
+                    with lock:
+                        results[outcome].append(order)
+            except Exception as e:
+                with lock:
+                    results['errors'].append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay_all, args=(orders,)) for orders in orders_by_payer]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results['errors'], [])
+        sold = sum(order.quantity for order in results['paid'])
+        product.refresh_from_db()
+        # No lost updates and no overselling
+        self.assertEqual(product.stock_quantity, self.initial_stock - sold)
+        self.assertGreaterEqual(product.stock_quantity, 0)
+        # Demand exceeds supply, so every rejected order must have been
+        # larger than what was left at the end
+        self.assertTrue(results['out_of_stock'])
+        self.assertTrue(all(order.quantity > product.stock_quantity for order in results['out_of_stock']))
+        self.assertEqual(Order.objects.filter(status='paid').count(), len(results['paid']))
+
+        attempts = self.payers * self.orders_per_payer
+        # Throughput only shows up when the test logger is configured to emit INFO
+        logger.info(
+            "%d concurrent payers, %d payments in %.2fs (%.0f/s): %d paid, %d out of stock",
+            self.payers, attempts, elapsed, attempts / elapsed, len(results['paid']), len(results['out_of_stock']),
+        )
@@ -3,10 +3,10 @@
 from django.urls import path
 from .views import (
     RegistrationView, LoginView, LogoutView,
-    BuyerDashboardView, SellerDashboardView,
+    BuyerDashboardView, SellerDashboardView, BuyerRecommendationsView,
     ProductListView, ProductCreateView, ProductUpdateView, ProductDeleteView,
-    MyOrdersView,PlaceOrderView,
-    ManageOrdersView, AcceptOrderView, RejectOrderView,ProcessPaymentView,MarkAsShippedView, MarkAsCompletedView,
+    MyOrdersView,PlaceOrderView, CartView, CartAddView, CartUpdateView, CheckoutView,
+    ManageOrdersView, BulkOrderActionView, OrderExportView, ProductExportView, AcceptOrderView, RejectOrderView,ProcessPaymentView,MarkAsShippedView, MarkAsCompletedView,
     OrderConversationView,
 )
 
@@ -28,14 +28,22 @@ urlpatterns = [
     path('dashboard/seller/products/<int:pk>/delete/', ProductDeleteView.as_view(), name='product_delete'),
 
     path('dashboard/seller/orders/', ManageOrdersView.as_view(), name='manage_orders'),
+    path('dashboard/seller/orders/bulk/', BulkOrderActionView.as_view(), name='bulk_order_action'),
+    path('dashboard/seller/orders/export/', OrderExportView.as_view(), name='export_orders'),
+    path('dashboard/seller/products/export/', ProductExportView.as_view(), name='export_products'),
     path('dashboard/seller/orders/<int:order_id>/accept/', AcceptOrderView.as_view(), name='accept_order'),
     path('dashboard/seller/orders/<int:order_id>/reject/', RejectOrderView.as_view(), name='reject_order'),
 
     
 
     path('buyer/', BuyerDashboardView.as_view(), name='buyer_dashboard'),
+    path('buyer/recommendations/', BuyerRecommendationsView.as_view(), name='buyer_recommendations'),
     path('my-orders/', MyOrdersView.as_view(), name='my_orders'),
     path('order/place/', PlaceOrderView.as_view(), name='place_order'),
+    path('cart/', CartView.as_view(), name='cart'),
+    path('cart/add/', CartAddView.as_view(), name='cart_add'),
+    path('cart/update/', CartUpdateView.as_view(), name='cart_update'),
+    path('cart/checkout/', CheckoutView.as_view(), name='checkout'),
      path('payment/process/<int:order_id>/', ProcessPaymentView.as_view(), name='process_payment'),
 
      path('dashboard/seller/orders/<int:order_id>/ship/', MarkAsShippedView.as_view(), name='ship_order'),
@@ -1,5 +1,7 @@
 # accounts/views.py
 
+import logging
+
 # Django's standard function and class-based view imports
 from django.shortcuts import render, redirect,get_object_or_404
 from django.views import View
@@ -10,11 +12,23 @@ from django.urls import reverse_lazy
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages  # Import the messages framework
+from django.core.cache import cache
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
 # Your local app's models and forms
 # accounts/views.py
 
 from .models import Product, Order, User, Message # Add Message
+from .cart import MAX_CART_LINES, Cart, CheckoutError, checkout
+from .inventory import OutOfStock, pay_order
+from .order_states import SELLER_ACTIONS, TRANSITIONS, InvalidTransition, transition, transition_many
+from .pagination import KeysetPaginationMixin
+from .search import search_products
+from .exports import ORDER_EXPORT_COLUMNS, PRODUCT_EXPORT_COLUMNS, filter_created_between, stream_export
 from .forms import UserRegistrationForm, UserLoginForm, ProductForm, MessageForm # Add MessageForm
+from .forms import ExportFilterForm, OrderExportFilterForm
+
+logger = logging.getLogger(__name__)
 
 
 class RegistrationView(View):
@@ -88,11 +102,28 @@ class SellerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
 
 # --- PRODUCT CRUD VIEWS (Now inside accounts app) ---
 
-class ProductListView(SellerRequiredMixin, ListView):
+def refresh_content_index(product, deleted=False):
+    """
+    Keeps the content-based recommendation index in step with the catalog.
+    A failure here must never break saving the product itself.
+    """
+    from ml_models.content import remove_from_content_index, update_content_index
+
+    try:
+        if deleted:
+            remove_from_content_index(product)
+        else:
+            update_content_index(product)
+    except Exception:
+        logger.exception("Could not update the content index for product %s", getattr(product, 'pk', product))
+
+
+class ProductListView(SellerRequiredMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'accounts/product_list.html'
     context_object_name = 'products'
-    
+    paginate_by = 20
+
     def get_queryset(self):
         # Ensure that sellers only see their own products
         return Product.objects.filter(seller=self.request.user).order_by('-created_at')
@@ -106,7 +137,9 @@ class ProductCreateView(SellerRequiredMixin, CreateView):
     def form_valid(self, form):
         # Automatically assign the logged-in seller to the product
         form.instance.seller = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        refresh_content_index(self.object)
+        return response
 
 class ProductUpdateView(SellerRequiredMixin, UpdateView):
     model = Product
@@ -118,6 +151,11 @@ class ProductUpdateView(SellerRequiredMixin, UpdateView):
         # Crucial security check: ensure a seller can't edit another seller's products
         return Product.objects.filter(seller=self.request.user)
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        refresh_content_index(self.object)
+        return response
+
 class ProductDeleteView(SellerRequiredMixin, DeleteView):
     model = Product
     template_name = 'accounts/product_confirm_delete.html'
@@ -127,6 +165,12 @@ class ProductDeleteView(SellerRequiredMixin, DeleteView):
         # Crucial security check: ensure a seller can't delete another seller's products
         return Product.objects.filter(seller=self.request.user)
 
+    def form_valid(self, form):
+        product_id = self.object.pk
+        response = super().form_valid(form)
+        refresh_content_index(product_id, deleted=True)
+        return response
+
 
 
 class BuyerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
@@ -172,6 +216,7 @@ class PlaceOrderView(BuyerRequiredMixin, View):
             messages.error(request, 'Please enter a valid quantity.')
             return redirect('buyer_dashboard')
 
+        # Only a first check: stock is taken atomically when the order is paid
         if int(quantity) > product.stock_quantity:
             messages.error(request, f'Only {product.stock_quantity} items are in stock.')
             return redirect('buyer_dashboard')
@@ -187,63 +232,204 @@ class PlaceOrderView(BuyerRequiredMixin, View):
         # return redirect('buyer_dashboard')
         return redirect('my_orders') # Redirect to My Orders page to see the new order
 
+def _positive_int(value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+class CartView(BuyerRequiredMixin, View):
+    def get(self, request):
+        cart = Cart(request.session)
+        # One query for every product in the cart
+        products = Product.objects.select_related('seller').in_bulk(list(cart.lines))
+        # Products deleted since they were added would otherwise stay in the
+        # session, hidden here, and fail every checkout
+        removed = cart.discard([product_id for product_id in cart.lines if product_id not in products])
+        if removed:
+            messages.warning(request, f'{len(removed)} product(s) in your cart are no longer available and were removed.')
+        lines = [
+            {'product': products[product_id], 'quantity': quantity, 'total': products[product_id].price * quantity}
+            for product_id, quantity in cart.lines.items()
+        ]
+        return render(request, 'accounts/cart.html', {
+            'lines': lines,
+            'cart_total': sum(line['total'] for line in lines),
+        })
+
+class CartAddView(BuyerRequiredMixin, View):
+    def post(self, request):
+        product_id = _positive_int(request.POST.get('product_id'))
+        quantity = _positive_int(request.POST.get('quantity'))
+        if product_id is None or quantity is None:
+            messages.error(request, 'Please enter a valid quantity.')
+        elif not Cart(request.session).add(product_id, quantity):
+            messages.error(request, f'Your cart is full ({MAX_CART_LINES} products). Check out before adding more.')
+        else:
+            messages.success(request, 'Added to your cart.')
+        return redirect('buyer_dashboard')
+
+class CartUpdateView(BuyerRequiredMixin, View):
+    def post(self, request):
+        product_id = _positive_int(request.POST.get('product_id'))
+        if product_id is not None:
+            # An empty or zero quantity removes the line
+            Cart(request.session).update(product_id, _positive_int(request.POST.get('quantity')) or 0)
+        return redirect('cart')
+
+class CheckoutView(BuyerRequiredMixin, View):
+    def post(self, request):
+        cart = Cart(request.session)
+        try:
+            orders = checkout(request.user, cart.lines)
+        except CheckoutError as e:
+            cart.discard(e.missing_ids)
+            for problem in e.problems:
+                messages.error(request, problem)
+            return redirect('cart')
+        cart.clear()
+        messages.success(request, f'{len(orders)} order request(s) have been sent!')
+        return redirect('my_orders')
+
 # Static view for "My Orders" for now
 # class MyOrdersView(BuyerRequiredMixin, View):
 #     def get(self, request):
 #         # Later, this will show a list of orders. For now, it's a static page.
 #         return render(request, 'accounts/my_orders.html')
 
-class MyOrdersView(BuyerRequiredMixin, ListView): # Changed from View to ListView
+class MyOrdersView(BuyerRequiredMixin, KeysetPaginationMixin, ListView): # Changed from View to ListView
     model = Order
     template_name = 'accounts/my_orders.html'
     context_object_name = 'orders'
+    paginate_by = 20
     def get_queryset(self):
         # This now fetches orders from the database for the logged-in buyer
-        return Order.objects.filter(buyer=self.request.user).order_by('-created_at')        
+        # Product and timeline are loaded with the page, not once per order
+        return (
+            Order.objects.filter(buyer=self.request.user)
+            .select_related('product')
+            .prefetch_related('history_events')
+            .order_by('-created_at')
+        )
 
-class ManageOrdersView(SellerRequiredMixin, ListView):
+class ManageOrdersView(SellerRequiredMixin, KeysetPaginationMixin, ListView):
     model = Order
     template_name = 'accounts/manage_orders.html'
     context_object_name = 'orders'
-    def get_queryset(self): return Order.objects.filter(seller=self.request.user).order_by('-created_at')
+    paginate_by = 20
+    def get_queryset(self): return Order.objects.filter(seller=self.request.user).select_related('product', 'buyer').order_by('-created_at')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['export_form'] = OrderExportFilterForm()
+        return context
+
+class OrderExportView(SellerRequiredMixin, View):
+    """Streams the seller's order book as CSV or JSONL, filtered by date range and status."""
+    def get(self, request):
+        form = OrderExportFilterForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        filters = form.cleaned_data
+        orders = filter_created_between(Order.objects.filter(seller=request.user), filters['start'], filters['end'])
+        if filters['status']:
+            orders = orders.filter(status__in=filters['status'])
+        filename = f"orders-{timezone.localdate().isoformat()}"
+        return stream_export(orders.order_by('created_at', 'id'), ORDER_EXPORT_COLUMNS, filters['format'], filename)
+
+class ProductExportView(SellerRequiredMixin, View):
+    """Streams the seller's catalog as CSV or JSONL, filtered by listing date."""
+    def get(self, request):
+        form = ExportFilterForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        filters = form.cleaned_data
+        products = filter_created_between(Product.objects.filter(seller=request.user), filters['start'], filters['end'])
+        filename = f"products-{timezone.localdate().isoformat()}"
+        return stream_export(products.order_by('created_at', 'id'), PRODUCT_EXPORT_COLUMNS, filters['format'], filename)
 
 class AcceptOrderView(SellerRequiredMixin, View):
     def post(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id, seller=request.user)
-        order.status = 'pending_payment'
-        order.save()
-        messages.success(request, f'Order #{order.id} has been accepted. Waiting for buyer payment.')
+        try:
+            transition(order_id, 'accept', seller=request.user)
+        except InvalidTransition:
+            messages.error(request, f'Order #{order_id} can no longer be accepted.')
+            return redirect('manage_orders')
+        messages.success(request, f'Order #{order_id} has been accepted. Waiting for buyer payment.')
+        return redirect('manage_orders')
+
+class BulkOrderActionView(SellerRequiredMixin, View):
+    """
+    Moves many of the seller's orders to one target status in a single
+    request. Reports per order whether it moved: as JSON if the client
+    asks for it, otherwise as messages on the order list.
+    """
+    def post(self, request):
+        # Target status -> the transition that leads there
+        actions = {TRANSITIONS[action][1]: action for action in SELLER_ACTIONS}
+        status = request.POST.get('status')
+        order_ids = [int(value) for value in request.POST.getlist('order_ids') if value.isdigit()]
+        wants_json = 'application/json' in request.headers.get('Accept', '')
+
+        if status not in actions or not order_ids:
+            error = 'Select at least one order and a valid action.'
+            if wants_json:
+                return JsonResponse({'error': error}, status=400)
+            messages.error(request, error)
+            return redirect('manage_orders')
+
+        results = transition_many(order_ids, actions[status], seller=request.user)
+
+        if wants_json:
+            return JsonResponse({
+                'status': status,
+                'results': [
+                    {'order_id': order_id, 'ok': error is None, 'error': error}
+                    for order_id, error in results.items()
+                ],
+            })
+
+        moved = [order_id for order_id, error in results.items() if error is None]
+        failed = {order_id: error for order_id, error in results.items() if error is not None}
+        label = dict(Order.STATUS_CHOICES)[status]
+        if moved:
+            messages.success(request, f"{len(moved)} order(s) marked as {label}: " + ', '.join(f'#{pk}' for pk in moved))
+        for order_id, error in failed.items():
+            messages.error(request, f"Order #{order_id} was not changed. {error}")
         return redirect('manage_orders')
 
 class RejectOrderView(SellerRequiredMixin, View):
     def post(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id, seller=request.user)
-        order.status = 'rejected'
-        order.save()
-        messages.info(request, f'Order #{order.id} has been rejected.')
+        try:
+            transition(order_id, 'reject', seller=request.user)
+        except InvalidTransition:
+            messages.error(request, f'Order #{order_id} can no longer be rejected.')
+            return redirect('manage_orders')
+        messages.info(request, f'Order #{order_id} has been rejected.')
         return redirect('manage_orders')
 class MarkAsShippedView(SellerRequiredMixin, View):
     def post(self, request, order_id):
-        # Security check: ensure the order exists, belongs to this seller, and is in the correct status
-        order = get_object_or_404(Order, id=order_id, seller=request.user, status='paid')
-        
-        # Update the status
-        order.status = 'shipped'
-        order.save()
-        
-        messages.success(request, f"Order #{order.id} has been marked as shipped.")
+        # Security check: the update only matches an order of this seller that is in the 'paid' status
+        try:
+            transition(order_id, 'ship', seller=request.user)
+        except InvalidTransition:
+            messages.error(request, f"Order #{order_id} cannot be marked as shipped.")
+            return redirect('manage_orders')
+
+        messages.success(request, f"Order #{order_id} has been marked as shipped.")
         return redirect('manage_orders')
 
 class MarkAsCompletedView(SellerRequiredMixin, View):
     def post(self, request, order_id):
-        # Security check: ensure order belongs to seller and is in 'shipped' status
-        order = get_object_or_404(Order, id=order_id, seller=request.user, status='shipped')
-        
-        # Update the status
-        order.status = 'completed'
-        order.save()
-        
-        messages.success(request, f"Order #{order.id} has been marked as completed.")
+        # Security check: the update only matches an order of this seller that is in the 'shipped' status
+        try:
+            transition(order_id, 'complete', seller=request.user)
+        except InvalidTransition:
+            messages.error(request, f"Order #{order_id} cannot be marked as completed.")
+            return redirect('manage_orders')
+
+        messages.success(request, f"Order #{order_id} has been marked as completed.")
         return redirect('manage_orders')        
 
 
@@ -251,7 +437,7 @@ class MarkAsCompletedView(SellerRequiredMixin, View):
 class ProcessPaymentView(BuyerRequiredMixin, View):
     def get(self, request, order_id):
         # Fetch the order that needs to be paid for
-        order = get_object_or_404(Order, id=order_id, buyer=request.user, status='pending_payment')
+        order = get_object_or_404(Order.objects.select_related('product'), id=order_id, buyer=request.user, status='pending_payment')
         context = {
             'order': order,
             'total_price': order.quantity * order.product.price
@@ -260,16 +446,23 @@ class ProcessPaymentView(BuyerRequiredMixin, View):
 
     def post(self, request, order_id):
         # This is where the "payment" is processed
-        order = get_object_or_404(Order, id=order_id, buyer=request.user)
-        product = order.product
-
-        # 1. Update the order status
-        order.status = 'paid'
-        order.save()
-
-        # 2. Decrease the product's stock
-        product.stock_quantity -= order.quantity
-        product.save()
+        order = get_object_or_404(Order.objects.select_related('product'), id=order_id, buyer=request.user, status='pending_payment')
+
+        # 1. Take the stock and mark the order paid, atomically
+        try:
+            pay_order(order, buyer=request.user)
+        except InvalidTransition:
+            messages.error(request, f"Order #{order.id} is not awaiting payment.")
+            return redirect('my_orders')
+        except OutOfStock:
+            messages.error(request, f"Sorry, there is not enough stock left to fulfil Order #{order.id}.")
+            return redirect('my_orders')
+
+        # 2. Count the sale towards the product's popularity
+        try:
+            record_paid_order(order)
+        except Exception:
+            logger.exception("Could not update the popularity index for order %s", order.id)
 
         # 3. Add a success message
         messages.success(request, f"Payment for Order #{order.id} was successful!")
@@ -288,9 +481,9 @@ class OrderConversationView(LoginRequiredMixin, View):
         # Security check: ensure the user is either the buyer or seller for this order
         order = get_object_or_404(Order.objects.filter(
             Q(buyer=request.user) | Q(seller=request.user)
-        ), id=order_id)
+        ).select_related('product'), id=order_id)
         
-        messages = order.messages.all()
+        messages = order.messages.select_related('sender')
         form = MessageForm()
         
         context = {
@@ -315,7 +508,7 @@ class OrderConversationView(LoginRequiredMixin, View):
             return redirect('order_conversation', order_id=order.id)
         
         # If form is invalid, re-render the page with the errors
-        messages_list = order.messages.all()
+        messages_list = order.messages.select_related('sender')
         context = {
             'order': order,
             'messages': messages_list,
@@ -326,23 +519,32 @@ class OrderConversationView(LoginRequiredMixin, View):
 # accounts/views.py
 
 # Add this to your imports at the top of the file
-from ml_models.recommendations import get_recommendations
+from ml_models.recommendations import get_recommendations, get_precomputed_recommendations
+from ml_models.popularity import record_paid_order, trending_products
 
 # ... (other views remain the same)
 
-class BuyerDashboardView(BuyerRequiredMixin, ListView):
+class BuyerDashboardView(BuyerRequiredMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'accounts/all_products.html'
     context_object_name = 'products'
     paginate_by = 12
-    
+
+    def get_keyset_ordering(self):
+        # Search results page through in relevance order
+        if self.request.GET.get('q', '').strip():
+            return ('search_rank', 'id')
+        return self.keyset_ordering
+
     def get_queryset(self):
-        # This logic remains unchanged
-        queryset = Product.objects.all().order_by('-created_at')
-        search_query = self.request.GET.get('q', '')
-        if search_query: queryset = queryset.filter(name__icontains=search_query)
+        # Every card shows the seller's company name
+        queryset = Product.objects.select_related('seller').order_by('-created_at')
         category_filter = self.request.GET.get('category', '')
         if category_filter: queryset = queryset.filter(category=category_filter)
+        # Full-text search over name, description and category, best match
+        # first; the category filter runs in the same query
+        search_query = self.request.GET.get('q', '').strip()
+        if search_query: queryset = search_products(queryset, search_query)
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -352,10 +554,46 @@ class BuyerDashboardView(BuyerRequiredMixin, ListView):
         context['search_query'] = self.request.GET.get('q', '')
         context['selected_category'] = self.request.GET.get('category', '')
 
-        # --- ADD THIS BLOCK ---
-        if self.request.user.is_authenticated:
-            recommended_products = get_recommendations(self.request.user, num_recs=4)
-            context['recommended_products'] = recommended_products
-        # --- END BLOCK ---
+        # "Trending in <category>" strip: one short index scan, cheap enough
+        # to render with the page
+        if context['selected_category']:
+            context['trending_products'] = trending_products(context['selected_category'], num_recs=4)
+            context['selected_category_label'] = dict(Product.CATEGORY_CHOICES).get(context['selected_category'])
 
-        return context
\ No newline at end of file
+        # Recommendations are fetched by the page after first paint from
+        # BuyerRecommendationsView, so the catalog never waits on the model.
+        return context
+
+
+# Rendered recommendation lists are cached per buyer for this many seconds.
+RECOMMENDATIONS_CACHE_SECONDS = 300
+
+
+class BuyerRecommendationsView(BuyerRequiredMixin, View):
+    """
+    Returns the "Recommended For You" section as an HTML fragment. Only the
+    product ids are cached, so every response still carries a fresh CSRF
+    token for its order forms.
+    """
+    def get(self, request):
+        cache_key = f'buyer_recommendations:{request.user.id}'
+        try:
+            product_ids = cache.get(cache_key)
+            if product_ids is None:
+                # Precomputed lists are a single indexed read; buyers without
+                # one (e.g. their first order came after the last batch run,
+                # or the ALS engine is configured) fall back to the live model.
+                recommended_products = get_precomputed_recommendations(request.user, num_recs=4)
+                if not recommended_products:
+                    recommended_products = get_recommendations(request.user, num_recs=4)
+                product_ids = [product.id for product in recommended_products]
+                cache.set(cache_key, product_ids, RECOMMENDATIONS_CACHE_SECONDS)
+            else:
+                products_by_id = Product.objects.in_bulk(product_ids)
+                recommended_products = [products_by_id[pid] for pid in product_ids if pid in products_by_id]
+        except Exception:
+            # An empty fragment simply leaves the section out of the page
+            logger.exception("Could not load recommendations for user %s", request.user.id)
+            recommended_products = []
+
+        return render(request, 'accounts/recommendations_fragment.html', {'recommended_products': recommended_products})
@@ -83,12 +83,28 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so concurrent
+            # writers queue on the busy timeout instead of failing to upgrade
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # A file-backed test database (removed after the run) so tests can
+        # exercise real concurrent connections; in-memory SQLite cannot
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 # settings.py
 RAZORPAY_KEY_ID = 'YOUR_TEST_KEY_ID'
 RAZORPAY_KEY_SECRET = 'YOUR_TEST_KEY_SECRET'
 
+# Recommendation engine served on the buyer dashboard: 'knn' or 'als'
+RECOMMENDER_ENGINE = os.environ.get('RECOMMENDER_ENGINE', 'knn')
+
+# Dotted path to the product search backend; None picks SQLite FTS5 on
+# SQLite and a plain icontains search elsewhere (see accounts/search.py)
+PRODUCT_SEARCH_BACKEND = None
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
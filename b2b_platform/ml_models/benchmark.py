@@ -0,0 +1,320 @@
+# ml_models/benchmark.py
+
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ml_models.recommendations import (
+    IVF_PROBES, IVFIndex, als_registry, build_user_item_matrix, evaluate_ann_recall,
+    get_recommendations, load_training_state, model_registry, resolve_model_dir, train_als_model,
+    train_and_save_knn_model,
+)
+
+# Engines the suite knows how to train, by the name get_recommendations() routes on.
+TRAINERS = {
+    'knn': train_and_save_knn_model,
+    'als': train_als_model,
+}
+
+
+def synthetic_interactions(n_buyers, n_products, n_interactions, n_segments=50, affinity=0.8, seed=0):
+    """
+    Generates (buyer_id, product_id) pairs shaped roughly like a real order
+    table: product popularity is skewed, and every buyer belongs to a segment
+    and buys from that segment's products `affinity` of the time.
+    """
+    rng = np.random.default_rng(seed)
+    buyers = rng.integers(1, n_buyers + 1, size=n_interactions)
+    segment_of_buyer = rng.integers(0, n_segments, size=n_buyers + 1)
+    segment_of_product = rng.integers(0, n_segments, size=n_products)
+
+    # Within each pool, a few products take most of the orders
+    popularity = 1.0 / np.arange(1, n_products + 1)
+    popularity /= popularity.sum()
+    products = rng.choice(np.arange(1, n_products + 1), size=n_interactions, p=popularity)
+
+    in_segment = rng.random(n_interactions) < affinity
+    for segment in range(n_segments):
+        members = np.flatnonzero(segment_of_product == segment)
+        picks = in_segment & (segment_of_buyer[buyers] == segment)
+        if len(members) and picks.any():
+            weights = popularity[members] / popularity[members].sum()
+            products[picks] = rng.choice(members, size=picks.sum(), p=weights) + 1
+    return list(zip(buyers.tolist(), products.tolist()))
+
+
+def _pivot_extraction(pairs):
+    # The original pandas pipeline: DataFrame -> dense pivot -> csr_matrix.
+    import pandas as pd
+
+    df = pd.DataFrame(pairs, columns=['buyer_id', 'product_id'])
+    df['interaction_score'] = 1
+    df = df.drop_duplicates(subset=['buyer_id', 'product_id'])
+    user_item_matrix = df.pivot(index='buyer_id', columns='product_id', values='interaction_score').fillna(0)
+    return csr_matrix(user_item_matrix.values)
+
+
+def _streaming_extraction(pairs):
+    user_item, _, _ = build_user_item_matrix(iter(pairs))
+    return user_item
+
+
+def _measure(func, pairs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(pairs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': round(elapsed, 4), 'peak_mb': round(peak / 2**20, 2)}
+
+
+def benchmark_extraction(n_buyers=5000, n_products=5000, n_interactions=100000, skip_pivot=False):
+    """
+    Times the dense pandas pivot against the streaming sparse extractor on
+    the same synthetic interactions and reports wall time and peak traced
+    memory for each. Pass skip_pivot for sizes where the dense matrix would
+    not fit in memory.
+    """
+    pairs = synthetic_interactions(n_buyers, n_products, n_interactions)
+    results = {
+        'n_buyers': n_buyers,
+        'n_products': n_products,
+        'n_interactions': n_interactions,
+    }
+
+    streaming, results['streaming'] = _measure(_streaming_extraction, pairs)
+    results['nnz'] = int(streaming.nnz)
+    if not skip_pivot:
+        pivot, results['pivot'] = _measure(_pivot_extraction, pairs)
+        assert pivot.nnz == streaming.nnz, "Both extractors must see the same interactions."
+    return results
+
+
+def benchmark_ann_recall(n_buyers=5000, n_products=5000, n_interactions=100000, top_k=10,
+                         n_probe=None, n_lists=None):
+    """
+    Measures recall@k and search time of the IVF index against brute force,
+    on the published training state if there is one and on synthetic data
+    otherwise.
+    """
+    state = load_training_state(resolve_model_dir())
+    if state is not None:
+        source = 'training_state'
+        user_item, product_ids = state['user_item'], state['product_ids']
+    else:
+        source = 'synthetic'
+        user_item, _, product_ids = build_user_item_matrix(
+            iter(synthetic_interactions(n_buyers, n_products, n_interactions))
+        )
+
+    index = IVFIndex(n_probe=n_probe or IVF_PROBES, n_lists=n_lists)
+    results = evaluate_ann_recall(user_item.T.tocsr(), product_ids, index, top_k=top_k)
+    results['source'] = source
+    return results
+
+
+# --- End-to-end suite against a test database ---
+
+def _rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def _train_in_child(engine, model_dir, results):
+    # Runs in a forked process so ru_maxrss reflects this training run only
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    TRAINERS[engine](model_dir=model_dir)
+    results.put({
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_mb': round(_rss_mb(), 1),
+        'peak_rss_growth_mb': round(_rss_mb() - rss_before, 1),
+    })
+
+
+def _measure_training(engine, model_dir):
+    from django.db import connections
+
+    # The child must open its own database connection
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    child = context.Process(target=_train_in_child, args=(engine, model_dir, results))
+    child.start()
+    child.join()
+    if child.exitcode != 0:
+        raise RuntimeError(f"Training the '{engine}' engine failed (exit code {child.exitcode}).")
+    return results.get()
+
+
+@contextmanager
+def _serving_from(model_dir):
+    # Points the process-wide registries at the benchmark's artifacts. The
+    # content index is pointed there too, where there is none, so the
+    # production index (whose product ids collide with the synthetic ones)
+    # never feeds the evaluation. The popularity fallback reads the fresh
+    # test database, where nothing was recorded.
+    from ml_models.content import content_registry
+
+    registries = (model_registry, als_registry, content_registry)
+    previous = [registry.model_dir for registry in registries]
+    for registry in registries:
+        registry.model_dir = model_dir
+        registry.clear()
+    try:
+        yield
+    finally:
+        for registry, previous_dir in zip(registries, previous):
+            registry.model_dir = previous_dir
+            registry.clear()
+
+
+def seed_benchmark_data(n_orders, n_buyers=None, n_products=None, holdout=0.2, seed=0):
+    """
+    Fills the current (test) database with synthetic sellers, buyers,
+    products and paid orders. For every buyer with at least two distinct
+    products, a `holdout` share of them is kept out of the database and
+    returned as {buyer_id: set of held-out product ids} for evaluation.
+    """
+    from accounts.models import Order, Product, User
+
+    n_buyers = n_buyers or max(50, n_orders // 20)
+    n_products = n_products or max(50, n_orders // 50)
+    pairs = synthetic_interactions(n_buyers, n_products, n_orders, seed=seed)
+
+    sellers = User.objects.bulk_create([
+        User(username=f'bench-seller-{i}', email=f'bench-seller-{i}@example.com', role='seller',
+             company_name=f'Bench Seller {i}', password='!')
+        for i in range(max(1, n_products // 100))
+    ])
+    buyers = User.objects.bulk_create([
+        User(username=f'bench-buyer-{i}', email=f'bench-buyer-{i}@example.com', role='buyer', password='!')
+        for i in range(n_buyers)
+    ], batch_size=1000)
+    categories = [value for value, _ in Product.CATEGORY_CHOICES]
+    products = Product.objects.bulk_create([
+        Product(seller=sellers[i % len(sellers)], name=f'Bench product {i}', description='Synthetic benchmark product',
+                category=categories[i % len(categories)], price=10, stock_quantity=1000)
+        for i in range(n_products)
+    ], batch_size=1000)
+
+    # Synthetic ids are 1-based positions into the created rows
+    by_buyer = {}
+    for buyer, product in pairs:
+        by_buyer.setdefault(buyer, []).append(product)
+
+    rng = np.random.default_rng(seed)
+    held_out, orders = {}, []
+    for buyer, bought in by_buyer.items():
+        distinct = list(dict.fromkeys(bought))
+        hidden = set()
+        if len(distinct) >= 2:
+            n_hidden = max(1, int(len(distinct) * holdout))
+            hidden = set(rng.choice(distinct, size=n_hidden, replace=False).tolist())
+            held_out[buyers[buyer - 1].id] = {products[p - 1].id for p in hidden}
+        for product in bought:
+            if product not in hidden:
+                product_row = products[product - 1]
+                orders.append(Order(product=product_row, buyer=buyers[buyer - 1], seller_id=product_row.seller_id,
+                                    quantity=1, status='paid'))
+        if len(orders) >= 10000:
+            Order.objects.bulk_create(orders)
+            orders = []
+    Order.objects.bulk_create(orders)
+
+    return {'n_orders': n_orders, 'n_buyers': n_buyers, 'n_products': n_products}, held_out
+
+
+def evaluate_engine(engine, held_out, k=10, latency_samples=200, seed=0):
+    """
+    Serves recommendations through get_recommendations() for the buyers with
+    held-out orders and reports hit-rate@k, recall@k and per-call latency.
+    """
+    from accounts.models import User
+
+    registry = als_registry if engine == 'als' else model_registry
+    before = registry.stats()
+    buyer_ids = sorted(held_out)
+    users = User.objects.in_bulk(buyer_ids)
+    # The first call loads the model; it is timed by the registry, not here
+    if buyer_ids:
+        get_recommendations(users[buyer_ids[0]], num_recs=k, engine=engine)
+
+    hits, recalls, latencies = 0, [], []
+    rng = np.random.default_rng(seed)
+    timed = set(rng.choice(buyer_ids, size=min(latency_samples, len(buyer_ids)), replace=False).tolist()) if buyer_ids else set()
+    for buyer_id in buyer_ids:
+        start = time.perf_counter()
+        recommended = get_recommendations(users[buyer_id], num_recs=k, engine=engine)
+        elapsed = time.perf_counter() - start
+        if buyer_id in timed:
+            latencies.append(elapsed * 1000)
+        found = {product.id for product in recommended} & held_out[buyer_id]
+        hits += bool(found)
+        recalls.append(len(found) / len(held_out[buyer_id]))
+
+    return {
+        'evaluated_buyers': len(buyer_ids),
+        f'hit_rate_at_{k}': round(hits / len(buyer_ids), 4) if buyer_ids else None,
+        f'recall_at_{k}': round(float(np.mean(recalls)), 4) if recalls else None,
+        'latency_ms': {
+            'samples': len(latencies),
+            'p50': round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+            'p99': round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+        },
+        'registry': _registry_activity(before, registry.stats()),
+    }
+
+
+def _registry_activity(before, after):
+    """The registry counters accumulated between two stats() snapshots."""
+    activity = {key: after[key] - before[key] for key in after if key != 'last_load_seconds'}
+    activity['total_load_seconds'] = round(activity['total_load_seconds'], 4)
+    return activity
+
+
+def run_benchmark_suite(order_counts=(1000, 100000), engines=('knn', 'als'), k=10, latency_samples=200):
+    """
+    For every dataset size, seeds a fresh test database with synthetic data,
+    then trains and evaluates each engine on it. Returns a JSON-serializable
+    dict so runs can be stored and compared to catch regressions.
+    """
+    from django.db import connection
+
+    report = {'k': k, 'runs': []}
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    previous_test_name = test_settings.get('NAME')
+    for n_orders in order_counts:
+        # A file-backed test database, so forked training processes see it
+        test_dir = tempfile.mkdtemp(prefix='recommender-bench-')
+        test_settings['NAME'] = f'{test_dir}/bench.sqlite3'
+        # create_test_db() returns the test database's name, so keep the real one to restore
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            start = time.perf_counter()
+            dataset, held_out = seed_benchmark_data(n_orders)
+            dataset['seed_seconds'] = round(time.perf_counter() - start, 3)
+            run = {'dataset': dataset, 'engines': {}}
+            for engine in engines:
+                model_dir = f'{test_dir}/{engine}/'
+                result = {'training': _measure_training(engine, model_dir)}
+                with _serving_from(model_dir):
+                    result['evaluation'] = evaluate_engine(engine, held_out, k=k, latency_samples=latency_samples)
+                run['engines'][engine] = result
+            report['runs'].append(run)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(test_dir, ignore_errors=True)
+            test_settings['NAME'] = previous_test_name
+    return report
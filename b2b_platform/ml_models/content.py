@@ -0,0 +1,317 @@
+# ml_models/content.py
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from ml_models.recommendations import MODEL_DIR, IdIndex, ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+CONTENT_INDEX_FILENAME = 'content_index.npz'
+# Product creates/edits/deletes are appended here between full rebuilds.
+CONTENT_DELTA_FILENAME = 'content_index_delta.jsonl'
+# A rebuild first moves the live delta aside under this name.
+CONTENT_DELTA_REBUILDING_FILENAME = 'content_index_delta.rebuilding.jsonl'
+# Held (created exclusively) by whichever worker is compacting the delta.
+CONTENT_COMPACT_LOCK_FILENAME = 'content_index.compact.lock'
+
+# Once the delta log grows past this size it is folded into the base index,
+# so workers do not re-parse an ever-growing log on every reload.
+CONTENT_DELTA_COMPACT_BYTES = 1024 * 1024
+# A compaction lock older than this is assumed to belong to a crashed worker.
+CONTENT_COMPACT_LOCK_SECONDS = 10 * 60
+
+# Hashed vocabulary size; hashing keeps the vocabulary fixed so a single
+# product can be vectorized without refitting anything.
+CONTENT_FEATURES = 2**18
+
+_vectorizer = HashingVectorizer(
+    n_features=CONTENT_FEATURES,
+    stop_words='english',
+    alternate_sign=False,
+    norm=None,
+)
+
+
+def product_text(name, description, category):
+    """The text a product is indexed by: its name, description and category label."""
+    from accounts.models import Product
+
+    category_label = dict(Product.CATEGORY_CHOICES).get(category, category)
+    return f"{name} {description} {category_label}"
+
+
+def _term_counts(texts):
+    counts = _vectorizer.transform(texts).tocsr()
+    counts.sort_indices()
+    return counts
+
+
+def _idf(document_frequency, n_documents):
+    # Same smoothing as scikit-learn's TfidfTransformer
+    return np.log((1 + n_documents) / (1 + document_frequency)) + 1
+
+
+def _tfidf(counts, idf):
+    # Sublinear term frequency times IDF, L2-normalized per product
+    weights = counts.astype(np.float32)
+    weights.data = 1 + np.log(weights.data)
+    weights = weights.multiply(idf.astype(np.float32)).tocsr()
+    return normalize(weights, norm='l2', axis=1)
+
+
+def build_content_index(model_dir=MODEL_DIR, chunk_size=2000):
+    """
+    Vectorizes every product from the database into L2-normalized TF-IDF
+    rows and writes them as the new base index. Pending deltas are folded in
+    because the rebuild reads the current catalog.
+    """
+    from accounts.models import Product
+
+    print("Building the product content index...")
+    os.makedirs(model_dir, exist_ok=True)
+    delta_path = os.path.join(model_dir, CONTENT_DELTA_FILENAME)
+    rebuilding_path = os.path.join(model_dir, CONTENT_DELTA_REBUILDING_FILENAME)
+    # Edits that land after this point go to a fresh delta file; edits that
+    # were already committed are read from the database below.
+    if os.path.exists(delta_path):
+        os.replace(delta_path, rebuilding_path)
+
+    product_ids, blocks = [], []
+    rows = Product.objects.order_by('id').values_list('id', 'name', 'description', 'category').iterator(chunk_size=chunk_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk_size:
+            product_ids.extend(r[0] for r in batch)
+            blocks.append(_term_counts([product_text(*r[1:]) for r in batch]))
+            batch = []
+    if batch:
+        product_ids.extend(r[0] for r in batch)
+        blocks.append(_term_counts([product_text(*r[1:]) for r in batch]))
+
+    counts = vstack(blocks).tocsr() if blocks else csr_matrix((0, CONTENT_FEATURES), dtype=np.float64)
+    document_frequency = np.bincount(counts.indices, minlength=CONTENT_FEATURES).astype(np.int64)
+    vectors = _tfidf(counts, _idf(document_frequency, len(product_ids)))
+
+    index_path = _save_base(model_dir, vectors, product_ids, document_frequency, len(product_ids))
+    if os.path.exists(rebuilding_path):
+        os.remove(rebuilding_path)
+    print(f"Content index ({len(product_ids)} products) saved to {index_path}")
+    return index_path
+
+
+def _save_base(model_dir, vectors, product_ids, document_frequency, n_documents):
+    index_path = os.path.join(model_dir, CONTENT_INDEX_FILENAME)
+    with open(f'{index_path}.tmp', 'wb') as f:
+        np.savez(
+            f,
+            data=vectors.data,
+            indices=vectors.indices,
+            indptr=vectors.indptr,
+            product_ids=np.array(product_ids, dtype=np.int64),
+            document_frequency=document_frequency,
+            n_documents=np.array(n_documents, dtype=np.int64),
+        )
+    os.replace(f'{index_path}.tmp', index_path)
+    return index_path
+
+
+def _load_base(model_dir):
+    index_path = os.path.join(model_dir, CONTENT_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return {}, None
+    with np.load(index_path) as saved:
+        product_ids = saved['product_ids']
+        vectors = csr_matrix(
+            (saved['data'], saved['indices'], saved['indptr']),
+            shape=(len(product_ids), CONTENT_FEATURES),
+        )
+        return {int(pid): i for i, pid in enumerate(product_ids)}, vectors
+
+
+def _load_document_frequency(model_dir):
+    # Only reads the two small arrays, not the vectors
+    index_path = os.path.join(model_dir, CONTENT_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return np.zeros(CONTENT_FEATURES, dtype=np.int64), 0
+    with np.load(index_path) as saved:
+        return saved['document_frequency'], int(saved['n_documents'])
+
+
+def update_content_index(product, model_dir=MODEL_DIR):
+    """
+    Re-vectorizes one created or edited product and appends it to the delta
+    log, using the document frequencies of the last full build for its IDF.
+    Serving workers pick the change up on their next request.
+    """
+    document_frequency, n_documents = _load_document_frequency(model_dir)
+    counts = _term_counts([product_text(product.name, product.description, product.category)])
+    # Count the product itself if the last build had not seen its terms
+    idf = _idf(np.maximum(document_frequency, 1), max(n_documents, 1))
+    vector = _tfidf(counts, idf)
+    _append_delta({
+        'product_id': product.pk,
+        'indices': vector.indices.tolist(),
+        'data': vector.data.tolist(),
+    }, model_dir)
+
+
+def remove_from_content_index(product_id, model_dir=MODEL_DIR):
+    """Appends a tombstone so a deleted product stops being recommended."""
+    _append_delta({'product_id': product_id, 'deleted': True}, model_dir)
+
+
+def _append_delta(entry, model_dir):
+    os.makedirs(model_dir, exist_ok=True)
+    # One write() per line so concurrent workers do not interleave entries
+    with open(os.path.join(model_dir, CONTENT_DELTA_FILENAME), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        size = f.tell()
+    if size >= CONTENT_DELTA_COMPACT_BYTES:
+        compact_content_index(model_dir)
+
+
+def compact_content_index(model_dir=MODEL_DIR):
+    """
+    Folds the delta log into the base index without reading the database.
+    The log is moved aside first, so edits made meanwhile go to a fresh log,
+    and readers see the same products at every step. Only one worker
+    compacts at a time; the others skip. Returns True if it compacted.
+    """
+    lock_path = os.path.join(model_dir, CONTENT_COMPACT_LOCK_FILENAME)
+    try:
+        if time.time() - os.stat(lock_path).st_mtime > CONTENT_COMPACT_LOCK_SECONDS:
+            logger.warning("Removing a stale content index compaction lock at %s", lock_path)
+            os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+
+    try:
+        delta_path = os.path.join(model_dir, CONTENT_DELTA_FILENAME)
+        rebuilding_path = os.path.join(model_dir, CONTENT_DELTA_REBUILDING_FILENAME)
+        if os.path.exists(rebuilding_path) or not os.path.exists(delta_path):
+            # A full rebuild is under way (or nothing to fold in)
+            return False
+        os.replace(delta_path, rebuilding_path)
+        merged = _merge_index(model_dir, (CONTENT_DELTA_REBUILDING_FILENAME,))
+        # The delta vectors were weighted with the base's document
+        # frequencies, so those carry over until the next full build
+        document_frequency, n_documents = _load_document_frequency(model_dir)
+        _save_base(model_dir, merged['vectors'], merged['product_ids'], document_frequency, n_documents)
+        os.remove(rebuilding_path)
+        # Runs inside whichever web request crossed the threshold
+        logger.info("Compacted the content index delta (%d products).", len(merged['product_ids']))
+        return True
+    finally:
+        os.remove(lock_path)
+
+
+def load_content_index(model_dir=MODEL_DIR):
+    """
+    Merges the base index with the pending delta entries (later entries win)
+    and returns the product vectors as one CSR matrix with its id map.
+    """
+    return _merge_index(model_dir, (CONTENT_DELTA_REBUILDING_FILENAME, CONTENT_DELTA_FILENAME))
+
+
+def _merge_index(model_dir, delta_names):
+    id_to_row, vectors = _load_base(model_dir)
+    product_ids = sorted(id_to_row, key=id_to_row.get)
+    updates = {}
+    for name in delta_names:
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line still being written by another worker
+                    continue
+                updates[entry['product_id']] = entry
+
+    if vectors is None:
+        vectors = csr_matrix((0, CONTENT_FEATURES), dtype=np.float32)
+    keep = np.ones(len(product_ids), dtype=bool)
+    new_rows, new_ids = [], []
+    for product_id, entry in updates.items():
+        if product_id in id_to_row:
+            # Edited or deleted: the base row is superseded
+            keep[id_to_row[product_id]] = False
+        if not entry.get('deleted'):
+            new_ids.append(product_id)
+            new_rows.append(csr_matrix(
+                (entry['data'], entry['indices'], [0, len(entry['indices'])]),
+                shape=(1, CONTENT_FEATURES), dtype=np.float32,
+            ))
+
+    merged = vstack([vectors[keep]] + new_rows).tocsr() if new_rows else vectors[keep].tocsr()
+    merged_ids = np.array([pid for pid, k in zip(product_ids, keep) if k] + new_ids, dtype=np.int64)
+    return {
+        'vectors': merged.astype(np.float32),
+        'product_ids': merged_ids,
+        'id_to_idx': IdIndex(merged_ids),
+    }
+
+
+class ContentIndexRegistry(ModelRegistry):
+    """Caches the merged content index, versioned by its base and delta files."""
+
+    def _artifact_dir(self):
+        # Not versioned: product edits append to the delta log in place
+        return self.model_dir
+
+    def _file_signature(self, directory):
+        signature = []
+        for name in (CONTENT_INDEX_FILENAME, CONTENT_DELTA_REBUILDING_FILENAME, CONTENT_DELTA_FILENAME):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature) if any(signature) else None
+
+    def _load(self, directory):
+        return load_content_index(directory)
+
+
+content_registry = ContentIndexRegistry()
+
+
+def similar_to_products(product_ids, num_recs, exclude_ids=()):
+    """
+    Returns the ids of the products whose text is most similar to the given
+    products, best first, with one sparse dot product over the whole index.
+    """
+    index = content_registry.get()
+    if index is None:
+        return []
+
+    seeds = [index['id_to_idx'].get(pid) for pid in product_ids]
+    seeds = [row for row in seeds if row is not None]
+    if not seeds:
+        return []
+
+    query = csr_matrix(index['vectors'][seeds].sum(axis=0))
+    scores = np.asarray((index['vectors'] @ query.T).todense()).ravel()
+    excluded = [row for row in (index['id_to_idx'].get(pid) for pid in set(exclude_ids) | set(product_ids)) if row is not None]
+    scores[excluded] = 0
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > num_recs:
+        candidates = candidates[np.argpartition(-scores[candidates], num_recs - 1)[:num_recs]]
+    candidates = candidates[np.lexsort((index['product_ids'][candidates], -scores[candidates]))]
+    return [int(pid) for pid in index['product_ids'][candidates]]
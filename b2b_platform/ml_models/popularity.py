@@ -0,0 +1,108 @@
+# ml_models/popularity.py
+
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ml_models.recommendations import QUALIFYING_STATUSES
+
+# An order counts half as much after this many days.
+POPULARITY_HALF_LIFE_DAYS = 14
+
+# Scores are stored as the sum of 2 ** ((paid_at - epoch) / half-life), i.e.
+# every order's weight grows with time instead of old weights decaying.
+# The ranking is the same as with decayed counts, but paying an order is a
+# single `score = score + w` update. Floats overflow about 1000 half-lives
+# (~40 years) after the epoch.
+POPULARITY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _weight(at):
+    return 2.0 ** ((at - POPULARITY_EPOCH).total_seconds() / (POPULARITY_HALF_LIFE_DAYS * 86400))
+
+
+def decayed_count(score, now=None):
+    """Converts a stored score into the decayed order count as of `now`."""
+    return score / _weight(now or timezone.now())
+
+
+def record_paid_order(order, paid_at=None):
+    """Adds a newly paid order to its product's popularity score."""
+    from accounts.models import ProductPopularity
+
+    weight = _weight(paid_at or timezone.now())
+    updated = ProductPopularity.objects.filter(product_id=order.product_id).update(score=F('score') + weight)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ProductPopularity.objects.create(product_id=order.product_id, category=order.product.category, score=weight)
+    except IntegrityError:
+        # Another request created the row first
+        ProductPopularity.objects.filter(product_id=order.product_id).update(score=F('score') + weight)
+
+
+def update_product_category(product):
+    """Keeps the copied category in step when a seller re-categorizes a product."""
+    from accounts.models import ProductPopularity
+
+    ProductPopularity.objects.filter(product_id=product.pk).exclude(category=product.category).update(category=product.category)
+
+
+def rebuild_popularity_index(chunk_size=2000):
+    """
+    Recomputes every product's score from the qualifying orders, using the
+    order date as the time it was paid. Returns the number of products.
+    """
+    from accounts.models import Order, ProductPopularity
+
+    print("Rebuilding the product popularity index...")
+    scores = defaultdict(float)
+    categories = {}
+    rows = (
+        Order.objects.filter(status__in=QUALIFYING_STATUSES)
+        .values_list('product_id', 'product__category', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    for product_id, category, created_at in rows:
+        scores[product_id] += _weight(created_at)
+        categories[product_id] = category
+
+    with transaction.atomic():
+        ProductPopularity.objects.all().delete()
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=pid, category=categories[pid], score=score) for pid, score in scores.items()],
+            batch_size=chunk_size,
+        )
+    print(f"Popularity index rebuilt for {len(scores)} products.")
+    return len(scores)
+
+
+def trending_product_ids(categories=None, num_recs=4, exclude_ids=()):
+    """
+    Returns the ids of the most popular products right now, best first,
+    within `categories` if given. A single category is one index range scan
+    that stops after num_recs rows (plus any excluded ones); several
+    categories walk the score index until enough of them have matched.
+    """
+    from accounts.models import ProductPopularity
+
+    exclude_ids = set(exclude_ids)
+    rows = ProductPopularity.objects.all()
+    if categories:
+        categories = set(categories)
+        rows = rows.filter(category=categories.pop()) if len(categories) == 1 else rows.filter(category__in=categories)
+    rows = rows.order_by('-score', 'product_id').values_list('product_id', flat=True)[:num_recs + len(exclude_ids)]
+    return [pid for pid in rows if pid not in exclude_ids][:num_recs]
+
+
+def trending_products(category=None, num_recs=4):
+    """The "Trending in <category>" strip: the most popular products, best first."""
+    from accounts.models import Product
+
+    product_ids = trending_product_ids([category] if category else None, num_recs)
+    products_by_id = Product.objects.in_bulk(product_ids)
+    return [products_by_id[pid] for pid in product_ids if pid in products_by_id]
@@ -1,140 +1,1324 @@
 # ml_models/recommendations.py
 
+import json
+import logging
 import os
-import pandas as pd
-from scipy.sparse import csr_matrix
+import threading
+import time
+from array import array
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
 from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
 import joblib
 
-from django.core.exceptions import ObjectDoesNotExist
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = 'ml_models/saved_models/'
+MODEL_FILENAME = 'knn_model.joblib'
+MAPPINGS_FILENAME = 'product_mappings.joblib'
+NEIGHBORS_FILENAME = 'neighbor_table.npz'
+STATE_FILENAME = 'training_state.npz'
+# The memory-mapped format is a set of plain .npy arrays; the manifest is
+# written last and marks a complete export.
+MANIFEST_FILENAME = 'recommender_manifest.json'
+MMAP_FORMAT_VERSION = 1
+ALS_MANIFEST_FILENAME = 'als_manifest.json'
+# Scheduled training runs each write a directory under versions/ and publish
+# it by repointing the `current` symlink.
+VERSIONS_DIRNAME = 'versions'
+CURRENT_LINK = 'current'
+
+# Which engine get_recommendations() serves from unless settings say otherwise.
+DEFAULT_ENGINE = 'knn'
+
+# How many orders to pull from the database per round trip while training.
+EXTRACTION_CHUNK_SIZE = 2000
+
+# How many ranked neighbours to materialize per product.
+NEIGHBOR_TABLE_K = 20
+
+# Implicit-feedback ALS engine hyperparameters.
+ALS_FACTORS = 32
+ALS_REGULARIZATION = 0.1
+ALS_ALPHA = 40.0
+ALS_ITERATIONS = 15
+
+# Default settings of the approximate (IVF) neighbour index: partitions
+# probed per query and the dimension of the SVD embedding it partitions.
+IVF_PROBES = 8
+IVF_DIM = 64
+
+# How many recommendations to precompute per buyer, and how many buyers to
+# score per sparse matrix product.
+PRECOMPUTED_RECS = 12
+PRECOMPUTE_BLOCK_SIZE = 2048
+
+# Live recommendations weigh each past order by recency; an order's weight
+# halves every this many days.
+HISTORY_HALF_LIFE_DAYS = 90
+
+# Share of a warm buyer's live recommendations given to text-similar
+# products the collaborative model has not seen yet (e.g. new listings).
+CONTENT_BLEND_SHARE = 0.25
+
+# A serving registry logs its counters once every this many get() calls.
+REGISTRY_STATS_LOG_EVERY = 1000
+
+# Orders in these statuses count as an interaction between buyer and product.
+QUALIFYING_STATUSES = ['paid', 'completed', 'shipped']
+# Orders in these statuses may still become qualifying later, so incremental
+# training keeps re-checking them even though they are behind the watermark.
+OPEN_STATUSES = ['pending_approval', 'pending_payment']
 
 # This function needs to be called from a Django context to access models
-def train_and_save_knn_model():
+def train_and_save_knn_model(index=None, model_dir=MODEL_DIR):
     """
     Extracts order data, trains an item-to-item KNN model,
     and saves the model and necessary mappings to disk.
+    Pass an IVFIndex as `index` to compute the neighbour table approximately.
     """
     # We must import Django models here, inside the function,
     # because this script is outside the standard Django app structure.
     from accounts.models import Order, Product
+    from django.db.models import Max
 
     print("Starting model training process...")
 
+    # Everything up to this order id is covered by this run; later runs can
+    # pick up from here in incremental mode.
+    watermark = Order.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
     # 1. Data Extraction & Transformation
-    # Get all orders with a positive status
-    orders = Order.objects.filter(status__in=['paid', 'completed', 'shipped']).values('buyer_id', 'product_id')
-    
-    if not orders:
+    # Stream every order with a positive status straight into a sparse matrix
+    user_item, buyer_ids, product_ids = extract_interactions()
+
+    if user_item.nnz == 0:
         print("No sufficient order data to train the model. Exiting.")
         return
 
-    df = pd.DataFrame(list(orders))
-    
-    # We'll use a simple interaction score of 1 for any order
-    df['interaction_score'] = 1
-    
+    print(f"Loaded {user_item.nnz} unique user-product interactions.")
+
+    # 2. Train the KNN Model and save everything to disk
+    pending_ids = Order.objects.filter(id__lte=watermark, status__in=OPEN_STATUSES).values_list('id', flat=True)
+    state = {
+        'user_item': user_item,
+        'buyer_ids': buyer_ids,
+        'product_ids': product_ids,
+        'watermark': watermark,
+        'pending_ids': np.fromiter(pending_ids, dtype=np.int64),
+    }
+    _fit_and_save(state, index=index, model_dir=model_dir)
+    print("Training process complete.")
+
+
+def extract_interactions(chunk_size=EXTRACTION_CHUNK_SIZE):
+    """
+    Streams the qualifying orders from the database in chunks and returns the
+    binary user-item matrix along with its buyer and product id arrays.
+    """
+    from accounts.models import Order
+
+    orders = (
+        Order.objects.filter(status__in=QUALIFYING_STATUSES)
+        .values_list('buyer_id', 'product_id')
+        .iterator(chunk_size=chunk_size)
+    )
+    return build_user_item_matrix(orders)
+
+
+def build_user_item_matrix(pairs):
+    """
+    Assembles a binary CSR user-item matrix from an iterable of
+    (buyer_id, product_id) pairs without ever materializing a dense matrix.
+    Id maps are built on the fly, so memory grows with the number of
+    interactions rather than with buyers x products.
+    """
+    buyer_index, product_index = {}, {}
+    rows, cols = array('q'), array('q')
+    for buyer_id, product_id in pairs:
+        row = buyer_index.get(buyer_id)
+        if row is None:
+            row = buyer_index[buyer_id] = len(buyer_index)
+        col = product_index.get(product_id)
+        if col is None:
+            col = product_index[product_id] = len(product_index)
+        rows.append(row)
+        cols.append(col)
+
+    rows = np.frombuffer(rows, dtype=np.int64) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.frombuffer(cols, dtype=np.int64) if cols else np.zeros(0, dtype=np.int64)
+    shape = (len(buyer_index), len(product_index))
+    user_item = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=shape).tocsr()
     # Drop duplicates in case a user ordered the same product multiple times
-    df = df.drop_duplicates(subset=['buyer_id', 'product_id'])
+    user_item.data[:] = 1.0
 
-    print(f"Loaded {len(df)} unique user-product interactions.")
+    buyer_ids = np.fromiter(buyer_index, dtype=np.int64, count=len(buyer_index))
+    product_ids = np.fromiter(product_index, dtype=np.int64, count=len(product_index))
+    return user_item, buyer_ids, product_ids
 
-    # 2. Build the Utility Matrix
-    # Create pivot table
-    user_item_matrix = df.pivot(index='buyer_id', columns='product_id', values='interaction_score').fillna(0)
-    
-    # Create mappings from product_id to matrix column index and vice-versa
-    product_id_to_idx = {product_id: i for i, product_id in enumerate(user_item_matrix.columns)}
-    idx_to_product_id = {i: product_id for product_id, i in product_id_to_idx.items()}
 
-    # Convert to a sparse matrix for efficiency
-    sparse_user_item_matrix = csr_matrix(user_item_matrix.values)
+def update_knn_model_incremental(index=None, model_dir=MODEL_DIR):
+    """
+    Folds the orders that became qualifying since the last run into the saved
+    training state, refits the KNN model on it and re-derives the neighbour
+    table rows of the affected products only. Falls back to a full rebuild
+    when no training state has been saved yet.
+    """
+    from accounts.models import Order
+
+    state = load_training_state(model_dir)
+    if state is None:
+        print("No saved training state found. Running a full rebuild instead.")
+        return train_and_save_knn_model(index=index, model_dir=model_dir)
 
-    # 3. Train the KNN Model
+    print(f"Starting incremental training from order #{state['watermark']}...")
+
+    # 1. Fetch every order that is new since the watermark, plus the older
+    # orders that were still open last time (they may have been paid since).
+    rows = list(
+        Order.objects.filter(id__gt=state['watermark'])
+        .values_list('id', 'buyer_id', 'product_id', 'status')
+    )
+    pending_ids = state['pending_ids'].tolist()
+    for start in range(0, len(pending_ids), 500):
+        rows.extend(
+            Order.objects.filter(id__in=pending_ids[start:start + 500])
+            .values_list('id', 'buyer_id', 'product_id', 'status')
+        )
+
+    new_pairs = set()
+    still_open = []
+    watermark = state['watermark']
+    for order_id, buyer_id, product_id, status in rows:
+        watermark = max(watermark, order_id)
+        if status in QUALIFYING_STATUSES:
+            new_pairs.add((buyer_id, product_id))
+        elif status in OPEN_STATUSES:
+            still_open.append(order_id)
+
+    state['watermark'] = watermark
+    state['pending_ids'] = np.array(still_open, dtype=np.int64)
+
+    # 2. Fold the new interactions into the user-item matrix, growing the id
+    # maps for buyers and products that were never seen before.
+    buyer_index = {int(bid): i for i, bid in enumerate(state['buyer_ids'])}
+    product_index = {int(pid): i for i, pid in enumerate(state['product_ids'])}
+    new_buyers, new_products = [], []
+    coo_rows, coo_cols = [], []
+    for buyer_id, product_id in new_pairs:
+        if buyer_id not in buyer_index:
+            buyer_index[buyer_id] = len(buyer_index)
+            new_buyers.append(buyer_id)
+        if product_id not in product_index:
+            product_index[product_id] = len(product_index)
+            new_products.append(product_id)
+        coo_rows.append(buyer_index[buyer_id])
+        coo_cols.append(product_index[product_id])
+
+    shape = (len(buyer_index), len(product_index))
+    old_matrix = state['user_item'].copy()
+    old_matrix.resize(shape)
+    delta = csr_matrix((np.ones(len(coo_rows)), (coo_rows, coo_cols)), shape=shape)
+    user_item = old_matrix + delta
+    # Interactions are binary, so a repeat purchase must not raise the weight.
+    user_item.data = np.minimum(user_item.data, 1.0)
+
+    changed = (user_item != old_matrix).tocoo()
+    affected = np.unique(changed.col)
+    state['user_item'] = user_item
+    state['buyer_ids'] = np.concatenate([state['buyer_ids'], np.array(new_buyers, dtype=np.int64)])
+    state['product_ids'] = np.concatenate([state['product_ids'], np.array(new_products, dtype=np.int64)])
+
+    print(f"Folded in {changed.nnz} new interactions touching {len(affected)} products.")
+    if not changed.nnz:
+        # Nothing is written, so the scheduler keeps the published version.
+        # Orders read here are simply read again by the next run.
+        print("Recommendation model is already up to date.")
+        return
+
+    # 3. Only products that share a buyer with an affected product can see
+    # their similarities change, so only their neighbour rows are recomputed.
+    item_user = user_item.T.tocsr()
+    buyers_of_affected = np.unique(item_user[affected].indices)
+    rows_to_refresh = np.unique(user_item[buyers_of_affected].indices)
+
+    table = load_neighbor_table(model_dir)
+    if table is not None:
+        n_old = len(table['product_ids'])
+        if np.array_equal(table['product_ids'], state['product_ids'][:n_old]):
+            table = _grow_neighbor_table(table, state['product_ids'])
+        else:
+            # The table was built from a different model; rebuild all of it.
+            table = None
+    _fit_and_save(state, table=table, refresh_rows=rows_to_refresh, index=index, model_dir=model_dir)
+    print(f"Re-derived neighbours for {len(rows_to_refresh)} products. Incremental training complete.")
+
+
+def _fit_and_save(state, table=None, refresh_rows=None, index=None, model_dir=MODEL_DIR):
+    """
+    Fits the KNN model on the item-user matrix held in `state` and writes the
+    model, mappings, neighbour table and training state to `model_dir`.
+    When an existing `table` is passed only `refresh_rows` are recomputed.
+    Neighbours come from `index` (an IVFIndex) if given, else brute force.
+    """
     # We fit the model on the transpose of the matrix to learn item-item similarity
     # (items are rows, users are columns)
-    item_user_matrix = sparse_user_item_matrix.T
-    
+    item_user_matrix = state['user_item'].T.tocsr()
+    product_ids = state['product_ids']
+
     model_knn = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=10)
     model_knn.fit(item_user_matrix)
     print("KNN model trained successfully.")
 
-    # 4. Save the Model and Mappings
+    # Create mappings from product_id to matrix column index and vice-versa
+    product_id_to_idx = {int(product_id): i for i, product_id in enumerate(product_ids)}
+    idx_to_product_id = {i: product_id for product_id, i in product_id_to_idx.items()}
+
+    # Save the Model and Mappings
     # Ensure the directory to save the models exists
-    model_dir = 'ml_models/saved_models/'
     os.makedirs(model_dir, exist_ok=True)
     
-    model_path = os.path.join(model_dir, 'knn_model.joblib')
-    map_path = os.path.join(model_dir, 'product_mappings.joblib')
+    model_path = os.path.join(model_dir, MODEL_FILENAME)
+    map_path = os.path.join(model_dir, MAPPINGS_FILENAME)
 
     joblib.dump(model_knn, model_path)
     joblib.dump({'id_to_idx': product_id_to_idx, 'idx_to_id': idx_to_product_id}, map_path)
 
     print(f"Model saved to {model_path}")
     print(f"Mappings saved to {map_path}")
-    print("Training process complete.")
 
-# Note: We will create the recommendation function in a later step.
-# This file is now ready for Phase 2.
+    # Materialize the item-to-item neighbour table used at serving time
+    if table is None:
+        table = build_neighbor_table(model_knn, idx_to_product_id, index=index)
+    else:
+        top_k = table['neighbor_ids'].shape[1]
+        if index is not None:
+            neighbor_idx, scores = index.fit(item_user_matrix).query(refresh_rows, top_k, product_ids)
+        else:
+            neighbor_idx, scores = _item_neighbors(item_user_matrix, refresh_rows, top_k, product_ids)
+        table['neighbor_ids'][refresh_rows] = np.where(neighbor_idx >= 0, product_ids[neighbor_idx], -1)
+        table['scores'][refresh_rows] = scores
+    save_neighbor_table(table, model_dir)
+    save_training_state(state, model_dir)
+    export_mmap_artifacts(item_user_matrix, table, model_dir)
+
 
-def get_recommendations(user, num_recs=4):
+def _item_neighbors(item_user_matrix, rows, top_k, product_ids, block_size=1024):
     """
-    Loads the trained KNN model and generates product recommendations for a given user.
+    Computes the cosine top-K neighbours of the given item rows with sparse
+    products, one block of rows at a time so memory stays bounded. Returns
+    model indices (len(rows), top_k) padded with -1 and matching similarities.
+    Ties are broken on product id so the result does not depend on the order
+    in which products were added to the matrix.
     """
-    from accounts.models import Order, Product
+    rows = np.asarray(rows, dtype=np.int64)
+    item_vectors = normalize(csr_matrix(item_user_matrix, dtype=np.float64), norm='l2', axis=1)
+    neighbor_idx = np.full((len(rows), top_k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), top_k), dtype=np.float32)
+
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        similarities = (item_vectors[block_rows] @ item_vectors.T).tocsr()
+        for offset, row in enumerate(block_rows):
+            lo, hi = similarities.indptr[offset], similarities.indptr[offset + 1]
+            cols = similarities.indices[lo:hi]
+            sims = similarities.data[lo:hi]
+            # A product is never its own neighbour.
+            keep = cols != row
+            cols, sims = cols[keep], sims[keep]
+            # Highest similarity first, lower product id first on ties.
+            order = np.lexsort((product_ids[cols], -sims))[:top_k]
+            neighbor_idx[start + offset, :len(order)] = cols[order]
+            scores[start + offset, :len(order)] = sims[order]
+
+    return neighbor_idx, scores
+
 
-    model_dir = 'ml_models/saved_models/'
-    model_path = os.path.join(model_dir, 'knn_model.joblib')
-    map_path = os.path.join(model_dir, 'product_mappings.joblib')
+def build_neighbor_table(model_knn, idx_to_product_id, top_k=NEIGHBOR_TABLE_K, index=None):
+    """
+    Computes the ranked top-K neighbours of every product in the model and
+    returns them as dense arrays (row i belongs to model index i):
+    product_ids (n,), neighbor_ids (n, top_k) padded with -1, and
+    scores (n, top_k) holding the cosine similarity of each neighbour.
+    With an IVFIndex as `index` the neighbours are approximate.
+    """
+    item_vectors = model_knn._fit_X
+    n_items = item_vectors.shape[0]
+    product_ids = np.array([idx_to_product_id[i] for i in range(n_items)], dtype=np.int64)
+
+    if index is not None:
+        neighbor_idx, scores = index.fit(item_vectors).query(np.arange(n_items), top_k, product_ids)
+    else:
+        neighbor_idx, scores = _item_neighbors(item_vectors, np.arange(n_items), top_k, product_ids)
+    neighbor_ids = np.where(neighbor_idx >= 0, product_ids[neighbor_idx], -1)
+
+    return {'product_ids': product_ids, 'neighbor_ids': neighbor_ids, 'scores': scores}
+
+
+class IVFIndex:
+    """
+    Approximate cosine nearest-neighbour index over the item vectors, in
+    plain NumPy/SciPy. Items are embedded with a truncated SVD and grouped
+    into `n_lists` partitions by spherical k-means; a query only scores
+    the items of its `n_probe` closest partitions, exactly, against the
+    original sparse vectors. `n_probe` is the recall/latency knob: more
+    probes find more true neighbours and scan more items.
+    """
 
-    # Check if the model files exist before trying to load them
+    def __init__(self, n_probe=IVF_PROBES, n_lists=None, dim=IVF_DIM, n_iter=10, seed=0, block_size=256):
+        self.n_probe = n_probe
+        self.n_lists = n_lists
+        self.dim = dim
+        self.n_iter = n_iter
+        self.seed = seed
+        self.block_size = block_size
+        self._vectors = None
+
+    def fit(self, item_user_matrix):
+        from sklearn.utils.extmath import randomized_svd
+
+        self._vectors = normalize(csr_matrix(item_user_matrix, dtype=np.float32), norm='l2', axis=1)
+        n_items = self._vectors.shape[0]
+        dim = max(1, min(self.dim, min(self._vectors.shape) - 1))
+        u, sigma, _ = randomized_svd(self._vectors, dim, random_state=self.seed)
+        embedding = normalize(u * sigma).astype(np.float32)
+
+        # Spherical k-means: centroids are normalized means of their members
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n_items))), n_items)
+        rng = np.random.default_rng(self.seed)
+        centroids = embedding[rng.choice(n_items, size=n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = self._assign(embedding, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, embedding)
+            # An empty partition keeps its previous centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        assignment = self._assign(embedding, centroids)
+
+        # Items sorted by partition, so a partition is a contiguous slice
+        self._embedding = embedding
+        self._centroids = centroids
+        self._order = np.argsort(assignment, kind='stable')
+        self._offsets = np.searchsorted(assignment[self._order], np.arange(n_lists + 1))
+        return self
+
+    def _assign(self, embedding, centroids):
+        assignment = np.empty(len(embedding), dtype=np.int64)
+        for start in range(0, len(embedding), 4096):
+            assignment[start:start + 4096] = np.argmax(embedding[start:start + 4096] @ centroids.T, axis=1)
+        return assignment
+
+    def query(self, rows, top_k, product_ids):
+        """
+        Returns approximate neighbours for the given item rows in the same
+        shape as the brute-force search: model indices (len(rows), top_k)
+        padded with -1 and their exact cosine similarities.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        neighbor_idx = np.full((len(rows), top_k), -1, dtype=np.int64)
+        scores = np.zeros((len(rows), top_k), dtype=np.float32)
+        n_probe = min(self.n_probe, len(self._centroids))
+
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            closeness = self._embedding[block_rows] @ self._centroids.T
+            probes = np.argpartition(-closeness, n_probe - 1, axis=1)[:, :n_probe]
+            candidates = []
+            for row, row_probes in zip(block_rows, probes):
+                cols = np.concatenate([self._order[self._offsets[p]:self._offsets[p + 1]] for p in row_probes])
+                candidates.append(cols[cols != row])
+
+            pair_rows = np.repeat(block_rows, [len(c) for c in candidates])
+            pair_cols = np.concatenate(candidates)
+            # Exact cosine of every (row, candidate) pair in one sparse op
+            pair_sims = np.asarray(self._vectors[pair_rows].multiply(self._vectors[pair_cols]).sum(axis=1)).ravel()
+
+            offset = 0
+            for i, cols in enumerate(candidates):
+                sims = pair_sims[offset:offset + len(cols)]
+                offset += len(cols)
+                # Like the brute-force search, only co-purchased products count
+                keep = sims > 0
+                cols, sims = cols[keep], sims[keep]
+                order = np.lexsort((product_ids[cols], -sims))[:top_k]
+                neighbor_idx[start + i, :len(order)] = cols[order]
+                scores[start + i, :len(order)] = sims[order]
+
+        return neighbor_idx, scores
+
+
+def evaluate_ann_recall(item_user_matrix, product_ids, index, top_k=10, sample_size=1000, seed=0):
+    """
+    Offline check of an approximate index: compares its neighbours with the
+    brute-force ones on a sample of products and reports recall@k plus the
+    time each search took.
+    """
+    n_items = item_user_matrix.shape[0]
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n_items, size=min(sample_size, n_items), replace=False))
+
+    start = time.perf_counter()
+    exact_idx, _ = _item_neighbors(item_user_matrix, rows, top_k, product_ids)
+    brute_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.fit(item_user_matrix)
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approx_idx, _ = index.query(rows, top_k, product_ids)
+    query_seconds = time.perf_counter() - start
+
+    hits, total = 0, 0
+    for exact, approx in zip(exact_idx, approx_idx):
+        exact = set(exact[exact >= 0].tolist())
+        hits += len(exact & set(approx[approx >= 0].tolist()))
+        total += len(exact)
+
+    return {
+        'k': top_k,
+        'sampled_products': len(rows),
+        'n_lists': len(index._centroids),
+        'n_probe': index.n_probe,
+        'recall_at_k': round(hits / total, 4) if total else None,
+        'brute_seconds': round(brute_seconds, 4),
+        'ann_fit_seconds': round(fit_seconds, 4),
+        'ann_query_seconds': round(query_seconds, 4),
+    }
+
+
+def _grow_neighbor_table(table, product_ids):
+    # Appends empty rows for products added since the table was built.
+    n_old, top_k = table['neighbor_ids'].shape
+    n_new = len(product_ids) - n_old
+    return {
+        'product_ids': np.asarray(product_ids, dtype=np.int64),
+        'neighbor_ids': np.vstack([table['neighbor_ids'], np.full((n_new, top_k), -1, dtype=np.int64)]),
+        'scores': np.vstack([table['scores'], np.zeros((n_new, top_k), dtype=np.float32)]),
+    }
+
+
+def save_neighbor_table(table, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    table_path = os.path.join(model_dir, NEIGHBORS_FILENAME)
+    np.savez(table_path, **table)
+    print(f"Neighbor table ({len(table['product_ids'])} products) saved to {table_path}")
+    return table_path
+
+
+def load_neighbor_table(model_dir=MODEL_DIR):
+    table_path = os.path.join(model_dir, NEIGHBORS_FILENAME)
+    if not os.path.exists(table_path):
+        return None
+    with np.load(table_path) as table:
+        return {key: table[key] for key in table.files}
+
+
+def save_training_state(state, model_dir=MODEL_DIR):
+    """
+    Persists the sparse user-item matrix, its id maps and the order watermark
+    so the next run can continue from where this one stopped.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    state_path = os.path.join(model_dir, STATE_FILENAME)
+    user_item = state['user_item'].tocsr()
+    np.savez(
+        state_path,
+        data=user_item.data,
+        indices=user_item.indices,
+        indptr=user_item.indptr,
+        shape=np.array(user_item.shape, dtype=np.int64),
+        buyer_ids=state['buyer_ids'],
+        product_ids=state['product_ids'],
+        watermark=np.array(state['watermark'], dtype=np.int64),
+        pending_ids=state['pending_ids'],
+    )
+    print(f"Training state (watermark: order #{state['watermark']}) saved to {state_path}")
+    return state_path
+
+
+def load_training_state(model_dir=MODEL_DIR):
+    state_path = os.path.join(model_dir, STATE_FILENAME)
+    if not os.path.exists(state_path):
+        return None
+    with np.load(state_path) as saved:
+        user_item = csr_matrix((saved['data'], saved['indices'], saved['indptr']), shape=tuple(saved['shape']))
+        return {
+            'user_item': user_item,
+            'buyer_ids': saved['buyer_ids'],
+            'product_ids': saved['product_ids'],
+            'watermark': int(saved['watermark']),
+            'pending_ids': saved['pending_ids'],
+        }
+
+
+def rebuild_neighbor_table(model_dir=MODEL_DIR, top_k=NEIGHBOR_TABLE_K, index=None):
+    """
+    Re-derives only the neighbour table from the KNN model already on disk,
+    without touching the order data or retraining the model.
+    """
+    model_path = os.path.join(model_dir, MODEL_FILENAME)
+    map_path = os.path.join(model_dir, MAPPINGS_FILENAME)
     if not os.path.exists(model_path) or not os.path.exists(map_path):
         print("Model files not found. Please train the model first.")
-        return []
+        return None
 
-    # Load the saved model and mappings
     model_knn = joblib.load(model_path)
     mappings = joblib.load(map_path)
-    product_id_to_idx = mappings['id_to_idx']
-    idx_to_product_id = mappings['idx_to_id']
+    table = build_neighbor_table(model_knn, mappings['idx_to_id'], top_k=top_k, index=index)
+    table_path = save_neighbor_table(table, model_dir)
+    export_mmap_artifacts(model_knn._fit_X, table, model_dir)
+    return table_path
+
+
+class IdIndex:
+    """
+    Maps product (or buyer) ids to matrix indices with a binary search over
+    sorted arrays, so the map can live in shared memory-mapped pages instead
+    of a per-worker Python dict.
+    """
+
+    def __init__(self, product_ids, sorter=None):
+        self.product_ids = product_ids
+        self.sorter = np.argsort(product_ids, kind='stable') if sorter is None else sorter
+
+    def get(self, product_id, default=None):
+        pos = np.searchsorted(self.product_ids, product_id, sorter=self.sorter)
+        if pos < len(self.sorter) and self.product_ids[self.sorter[pos]] == product_id:
+            return int(self.sorter[pos])
+        return default
+
+    def __contains__(self, product_id):
+        return self.get(product_id) is not None
+
+    def __len__(self):
+        return len(self.product_ids)
+
+
+def _save_array(model_dir, name, array):
+    # Write to a temporary file and rename it into place: workers that still
+    # have the previous version mapped keep reading the old inode untouched.
+    path = os.path.join(model_dir, f'{name}.npy')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def _index_dtype(*sizes):
+    return np.int32 if max(sizes) < np.iinfo(np.int32).max else np.int64
+
+
+def export_mmap_artifacts(item_user_matrix, table, model_dir=MODEL_DIR):
+    """
+    Writes the recommender as plain .npy arrays that serving code opens with
+    mmap_mode='r': the item-user CSR matrix, the neighbour table, the item
+    similarity CSR matrix and the product id map. Every worker on a host then
+    shares the same physical pages and loading needs no unpickling.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    product_ids = np.asarray(table['product_ids'], dtype=np.int64)
+    item_user = csr_matrix(item_user_matrix, dtype=np.float32)
+    similarity = _similarity_matrix(table, product_ids)
+
+    arrays = {
+        'product_ids': product_ids,
+        'product_order': np.argsort(product_ids, kind='stable'),
+        'neighbor_ids': table['neighbor_ids'],
+        'neighbor_scores': table['scores'],
+    }
+    for prefix, matrix in (('item_user', item_user), ('similarity', similarity)):
+        index_dtype = _index_dtype(matrix.nnz, *matrix.shape)
+        arrays[f'{prefix}_data'] = matrix.data
+        arrays[f'{prefix}_indices'] = matrix.indices.astype(index_dtype, copy=False)
+        arrays[f'{prefix}_indptr'] = matrix.indptr.astype(index_dtype, copy=False)
+    for name, array in arrays.items():
+        _save_array(model_dir, name, array)
+
+    manifest = {
+        'format': 'npy',
+        'version': MMAP_FORMAT_VERSION,
+        'n_products': int(item_user.shape[0]),
+        'n_buyers': int(item_user.shape[1]),
+        'top_k': int(table['neighbor_ids'].shape[1]),
+    }
+    manifest_path = os.path.join(model_dir, MANIFEST_FILENAME)
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    print(f"Memory-mapped recommender artifacts saved to {model_dir}")
+    return manifest_path
+
+
+def load_mmap_artifacts(model_dir=MODEL_DIR):
+    """
+    Opens the .npy recommender artifacts read-only and memory-mapped.
+    Returns the same artifact dict as the joblib loader.
+    """
+    with open(os.path.join(model_dir, MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != 'npy' or manifest.get('version') != MMAP_FORMAT_VERSION:
+        raise ValueError(f"Unsupported recommender artifact format: {manifest}")
+
+    def load(name):
+        return np.load(os.path.join(model_dir, f'{name}.npy'), mmap_mode='r')
+
+    n_products, n_buyers = manifest['n_products'], manifest['n_buyers']
+    product_ids = load('product_ids')
+    neighbors = {
+        'product_ids': product_ids,
+        'neighbor_ids': load('neighbor_ids'),
+        'scores': load('neighbor_scores'),
+    }
+    item_user = csr_matrix(
+        (load('item_user_data'), load('item_user_indices'), load('item_user_indptr')),
+        shape=(n_products, n_buyers), copy=False,
+    )
+    similarity = csr_matrix(
+        (load('similarity_data'), load('similarity_indices'), load('similarity_indptr')),
+        shape=(n_products, n_products), copy=False,
+    )
+    return {
+        'id_to_idx': IdIndex(product_ids, load('product_order')),
+        'neighbors': neighbors,
+        'item_user': item_user,
+        'similarity': similarity,
+    }
+
+
+def convert_joblib_artifacts(model_dir=MODEL_DIR):
+    """
+    Converts a model saved in the joblib format (plus its neighbour table,
+    if any) to the memory-mapped .npy format, without retraining.
+    """
+    model_path = os.path.join(model_dir, MODEL_FILENAME)
+    map_path = os.path.join(model_dir, MAPPINGS_FILENAME)
+    if not os.path.exists(model_path) or not os.path.exists(map_path):
+        print("Model files not found. Please train the model first.")
+        return None
+
+    model_knn = joblib.load(model_path)
+    mappings = joblib.load(map_path)
+    table = load_neighbor_table(model_dir)
+    if table is None or len(table['product_ids']) != len(mappings['idx_to_id']):
+        table = build_neighbor_table(model_knn, mappings['idx_to_id'])
+    return export_mmap_artifacts(model_knn._fit_X, table, model_dir)
+
+def resolve_model_dir(model_dir=MODEL_DIR):
+    """
+    Returns the directory holding the published artifacts: the version the
+    `current` symlink points at, or model_dir itself for the flat layout.
+    """
+    current = os.path.join(model_dir, CURRENT_LINK)
+    if os.path.isdir(current):
+        return os.path.realpath(current)
+    return model_dir
+
+
+class ModelRegistry:
+    """
+    Keeps the trained recommender artifacts in memory for the lifetime of the
+    worker process, reloading them only when the files on disk change. The
+    memory-mapped .npy format is preferred; models saved only in the older
+    joblib format are still loaded.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self._lock = threading.Lock()
+        self._artifacts = None
+        self._loaded_signature = None
+        self._failed_signature = None
+        self._calls = 0
+        self._stats = {
+            'cache_hits': 0,
+            'reloads': 0,
+            'reload_failures': 0,
+            'misses': 0,
+            'total_load_seconds': 0.0,
+            'last_load_seconds': 0.0,
+        }
+
+    def _artifact_dir(self):
+        # With versioned training runs, serve whichever version `current`
+        # points at right now; otherwise the files live in model_dir itself.
+        return resolve_model_dir(self.model_dir)
+
+    def _file_signature(self, directory):
+        # The (mtime, size) pair of every artifact acts as the model's version.
+        # The manifest is rewritten after every .npy export, so it alone
+        # versions that format.
+        try:
+            stat = os.stat(os.path.join(directory, MANIFEST_FILENAME))
+            return ('npy', stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        # Joblib format: None if any of the required files is missing; the
+        # neighbour table is optional and only contributes when it exists.
+        try:
+            signature = [
+                (os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                for path in (os.path.join(directory, MODEL_FILENAME), os.path.join(directory, MAPPINGS_FILENAME))
+            ]
+        except FileNotFoundError:
+            return None
+        try:
+            stat = os.stat(os.path.join(directory, NEIGHBORS_FILENAME))
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+        return tuple(signature)
+
+    def _load(self, directory):
+        if os.path.exists(os.path.join(directory, MANIFEST_FILENAME)):
+            return load_mmap_artifacts(directory)
+
+        model_knn = joblib.load(os.path.join(directory, MODEL_FILENAME))
+        mappings = joblib.load(os.path.join(directory, MAPPINGS_FILENAME))
+        neighbors = load_neighbor_table(directory)
+        if neighbors is None or len(neighbors['product_ids']) != len(mappings['idx_to_id']):
+            # Models trained before the neighbour table existed: derive it once
+            # here instead of running kneighbors on every request.
+            neighbors = build_neighbor_table(model_knn, mappings['idx_to_id'])
+        return {
+            'id_to_idx': mappings['id_to_idx'],
+            'neighbors': neighbors,
+            'item_user': model_knn._fit_X,
+            'similarity': _similarity_matrix(neighbors, neighbors['product_ids']),
+        }
+
+    def get(self):
+        """
+        Returns the cached artifacts, reloading them first if the files on disk
+        have changed. If a reload fails the previously loaded version keeps
+        being served. Returns None if no model has been trained yet.
+        """
+        artifacts = self._get()
+        with self._lock:
+            self._calls += 1
+            due = self._calls % REGISTRY_STATS_LOG_EVERY == 0
+        if due:
+            logger.info("%s for %s: %s", type(self).__name__, self.model_dir, self.stats())
+        return artifacts
+
+    def _get(self):
+        # Resolve the directory once so the signature and the load below
+        # always refer to the same version, even if a new one is published
+        # in between.
+        directory = self._artifact_dir()
+        files = self._file_signature(directory)
+        signature = None if files is None else (directory, files)
+        if signature is None or signature == self._failed_signature:
+            # Nothing (readable) on disk; keep serving whatever we already have.
+            with self._lock:
+                if self._artifacts is None:
+                    self._stats['misses'] += 1
+                else:
+                    self._stats['cache_hits'] += 1
+                return self._artifacts
+
+        with self._lock:
+            if signature == self._loaded_signature and self._artifacts is not None:
+                self._stats['cache_hits'] += 1
+                return self._artifacts
+
+            # The files changed since the last load (or were never loaded).
+            start = time.perf_counter()
+            try:
+                artifacts = self._load(directory)
+            except Exception:
+                # A half-written or corrupt artifact must not take the dashboard down.
+                self._failed_signature = signature
+                self._stats['reload_failures'] += 1
+                logger.exception("Failed to load the recommendation model from %s, keeping the previous version", directory)
+                return self._artifacts
+
+            elapsed = time.perf_counter() - start
+            self._artifacts = artifacts
+            self._loaded_signature = signature
+            self._failed_signature = None
+            self._stats['reloads'] += 1
+            self._stats['last_load_seconds'] = elapsed
+            self._stats['total_load_seconds'] += elapsed
+            return self._artifacts
+
+    def stats(self):
+        """Returns a snapshot of the registry's counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        """Drops the cached artifacts so the next call loads them from disk."""
+        with self._lock:
+            self._artifacts = None
+            self._loaded_signature = None
+            self._failed_signature = None
+
+
+# One registry per worker process, shared by every request it serves.
+model_registry = ModelRegistry()
+
+
+def get_recommendations(user, num_recs=4, half_life_days=HISTORY_HALF_LIFE_DAYS, engine=None):
+    """
+    Generates product recommendations for a given user from their whole order
+    history, using the engine named by settings.RECOMMENDER_ENGINE: the KNN
+    item similarity matrix ('knn') or the ALS factors ('als'), each held by a
+    process-wide registry. Pass half_life_days=None to weigh every past order
+    equally.
+    """
+    from django.conf import settings
+    from accounts.models import Order, Product
+
+    engine = engine or getattr(settings, 'RECOMMENDER_ENGINE', DEFAULT_ENGINE)
+    registry = als_registry if engine == 'als' else model_registry
+    artifacts = registry.get()
+    if artifacts is None:
+        print(f"Model files for the '{engine}' engine not found. Please train the model first.")
 
     try:
-        # Find the most recent product the user has ordered
-        latest_order = Order.objects.filter(buyer=user, status__in=['paid', 'completed', 'shipped']).latest('created_at')
-        seed_product_id = latest_order.product.id
-        
-        # Check if the product the user ordered is in our model's vocabulary
-        if seed_product_id not in product_id_to_idx:
-            print(f"Seed product {seed_product_id} not in model training data. Cannot provide recommendations.")
+        # One query for the buyer's whole history: qualifying orders seed the
+        # scores and every ordered product, whatever its status, is masked out
+        history = list(Order.objects.filter(buyer=user).values_list('product_id', 'status', 'created_at'))
+        recommended_ids = []
+        if artifacts is not None and engine == 'als':
+            recommended_ids = score_history_als(history, artifacts, num_recs, user.id, half_life_days)
+        elif artifacts is not None:
+            recommended_ids = score_history(history, artifacts, num_recs, half_life_days)
+
+        if history:
+            from ml_models.content import similar_to_products
+
+            content_ids = similar_to_products([row[0] for row in history], num_recs * 2)
+            if not recommended_ids:
+                # Cold start: none of the buyer's products are known to the
+                # model yet, so fall back to products whose text resembles them
+                recommended_ids = content_ids
+            else:
+                # Products the model has never seen ordered can only surface
+                # through their text, so give them a share of the slots
+                unseen_ids = [pid for pid in content_ids if artifacts['id_to_idx'].get(pid) is None]
+                recommended_ids = blend_candidates(recommended_ids, unseen_ids, num_recs)
+
+        if not recommended_ids:
+            # Nothing personal to go on: show what is trending in the
+            # categories the buyer orders from, or across the whole catalog
+            from ml_models.popularity import trending_product_ids
+
+            ordered_ids = {row[0] for row in history}
+            categories = Product.objects.filter(id__in=ordered_ids).values_list('category', flat=True).distinct()
+            recommended_ids = trending_product_ids(list(categories), num_recs, exclude_ids=ordered_ids)
+
+        if not recommended_ids:
+            print(f"User {user.id} has no past orders to base recommendations on.")
             return []
 
-        # Get the internal index of our seed product
-        seed_product_idx = product_id_to_idx[seed_product_id]
+        # Fetch the recommended products from the database, keeping the ranking
+        products_by_id = Product.objects.in_bulk(recommended_ids)
+        return [products_by_id[pid] for pid in recommended_ids if pid in products_by_id][:num_recs]
 
-        # Use the model to find the nearest neighbors (num_recs + 1 because it includes the product itself)
-        distances, indices = model_knn.kneighbors([model_knn._fit_X[seed_product_idx]], n_neighbors=num_recs + 1)
-        
-        # The indices are returned as a 2D array, so we get the first row
-        similar_product_indices = indices.flatten()
-        
-        # Get the actual product IDs from the indices
-        recommended_ids = []
-        for idx in similar_product_indices:
-            # Skip the first item, as it's the seed product itself
-            if idx != seed_product_idx:
-                recommended_ids.append(idx_to_product_id[idx])
-        
-        # Get the products the user has already ordered to filter them out
-        already_ordered_ids = set(Order.objects.filter(buyer=user).values_list('product_id', flat=True))
-        
-        # Fetch the recommended products from the database, excluding already ordered ones
-        final_recommendations = list(Product.objects.filter(id__in=recommended_ids).exclude(id__in=already_ordered_ids)[:num_recs])
-
-        return final_recommendations
-
-    except ObjectDoesNotExist:
-        # This happens if the user has no past orders
-        print(f"User {user.id} has no past orders to base recommendations on.")
-        return []
     except Exception as e:
         print(f"An error occurred during recommendation generation: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+def blend_candidates(ranked_ids, extra_ids, num_recs, share=CONTENT_BLEND_SHARE):
+    """
+    Interleaves `extra_ids` into `ranked_ids`: up to `share` of the first
+    `num_recs` slots, spread evenly and starting from the bottom of the
+    page, go to extra candidates. The rest of the ranking keeps its order.
+    """
+    seen = set(ranked_ids)
+    extra_ids = [pid for pid in extra_ids if pid not in seen]
+    blended = list(ranked_ids)
+    if not extra_ids:
+        return blended
+    n_extra = min(len(extra_ids), max(1, int(num_recs * share)))
+    step = num_recs // n_extra
+    for i, pid in enumerate(extra_ids[:n_extra]):
+        blended.insert(min(step * (i + 1) - 1, len(blended)), pid)
+    return blended
+
+
+def score_history(history, artifacts, num_recs, half_life_days=HISTORY_HALF_LIFE_DAYS, now=None):
+    """
+    Scores every product against a buyer's interaction vector with one sparse
+    vector-matrix product and returns the top product ids, best first.
+    `history` is an iterable of (product_id, status, created_at) rows. With
+    a half-life, each order's weight halves every `half_life_days`.
+    """
+    id_to_idx = artifacts['id_to_idx']
+    similarity = artifacts['similarity']
+    product_ids = artifacts['neighbors']['product_ids']
+
+    weights, ordered = _history_weights(history, id_to_idx, half_life_days, now)
+    if not weights:
+        return []
+
+    n_items = similarity.shape[0]
+    seeds = list(weights)
+    history_vector = csr_matrix((list(weights.values()), ([0] * len(seeds), seeds)), shape=(1, n_items), dtype=np.float32)
+    ordered = list(ordered)
+    ordered_vector = csr_matrix((np.ones(len(ordered)), ([0] * len(ordered), ordered)), shape=(1, n_items))
+
+    # Over-fetch a little in case some recommended products have been deleted
+    [(cols, _)] = _score_buyer_block(history_vector, num_recs * 2, similarity, exclude=ordered_vector)
+    return [int(pid) for pid in product_ids[cols]]
+
+
+def _history_weights(history, id_to_idx, half_life_days, now=None):
+    """
+    Turns (product_id, status, created_at) rows into {model index: weight}
+    for the qualifying orders and the set of every ordered model index.
+    """
+    from django.utils import timezone
+
+    now = now or timezone.now()
+    weights, ordered = {}, set()
+    for product_id, status, created_at in history:
+        idx = id_to_idx.get(product_id)
+        if idx is None:
+            continue
+        ordered.add(idx)
+        if status not in QUALIFYING_STATUSES:
+            continue
+        weight = 1.0
+        if half_life_days:
+            age_days = max((now - created_at).total_seconds(), 0) / 86400
+            weight = 0.5 ** (age_days / half_life_days)
+        # Interactions are binary, so a repeat purchase only refreshes recency
+        weights[idx] = max(weights.get(idx, 0.0), weight)
+    return weights, ordered
+
+
+# Item-item similarity matrix shared with the precomputation worker processes.
+_worker_similarity = None
+
+
+def _init_precompute_worker(similarity):
+    global _worker_similarity
+    _worker_similarity = similarity
+
+
+def _score_buyer_block(user_item_block, num_recs, similarity=None, exclude=None):
+    """
+    Scores every product for a block of buyers with one sparse product
+    (history x item similarity), masks what each buyer already has (or the
+    `exclude` matrix, if given) and returns, per buyer, the top `num_recs`
+    (column indices, scores).
+    """
+    if similarity is None:
+        similarity = _worker_similarity
+    if exclude is None:
+        exclude = user_item_block
+    scores = (user_item_block @ similarity).tocsr()
+    # Zero out products the buyer has already ordered, in one vector op
+    scores = scores - scores.multiply(exclude > 0)
+    scores.eliminate_zeros()
+
+    results = []
+    for row in range(scores.shape[0]):
+        lo, hi = scores.indptr[row], scores.indptr[row + 1]
+        cols, row_scores = scores.indices[lo:hi], scores.data[lo:hi]
+        if len(cols) > num_recs:
+            top = np.argpartition(-row_scores, num_recs - 1)[:num_recs]
+            cols, row_scores = cols[top], row_scores[top]
+        order = np.lexsort((cols, -row_scores))
+        results.append((cols[order], row_scores[order]))
+    return results
+
+
+def _similarity_matrix(table, product_ids):
+    # Turns the neighbour table into a sparse items x items similarity matrix.
+    sorter = np.argsort(product_ids)
+    rows, slots = np.nonzero(table['neighbor_ids'] != -1)
+    neighbor_ids = table['neighbor_ids'][rows, slots]
+    cols = sorter[np.searchsorted(product_ids, neighbor_ids, sorter=sorter)]
+    data = table['scores'][rows, slots]
+    n_items = len(product_ids)
+    return csr_matrix((data, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+
+
+def precompute_buyer_recommendations(num_recs=PRECOMPUTED_RECS, block_size=PRECOMPUTE_BLOCK_SIZE, workers=1, model_dir=MODEL_DIR):
+    """
+    Computes recommendations for every buyer in the saved training state and
+    stores them in the BuyerRecommendation table. As on the live path, every
+    product a buyer has ordered, whatever the status, is left out. Buyers are
+    processed in blocks of `block_size` so memory stays bounded; with
+    `workers` > 1 the blocks are scored in a process pool. Returns the number
+    of buyers stored.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from django.db import transaction
+    from accounts.models import BuyerRecommendation, Order, Product, User
+
+    model_dir = resolve_model_dir(model_dir)
+    state = load_training_state(model_dir)
+    table = load_neighbor_table(model_dir)
+    if state is None or table is None:
+        print("Model files not found. Please train the model first.")
+        return 0
+    if not np.array_equal(table['product_ids'], state['product_ids']):
+        print("Neighbor table does not match the training state. Please retrain the model.")
+        return 0
+
+    print(f"Precomputing recommendations for {len(state['buyer_ids'])} buyers...")
+    user_item = state['user_item'].astype(np.float32)
+    similarity = _similarity_matrix(table, state['product_ids'])
+    product_ids = state['product_ids']
+    buyer_ids = state['buyer_ids']
+    ordered = _ordered_matrix(
+        Order.objects.values_list('buyer_id', 'product_id').iterator(chunk_size=EXTRACTION_CHUNK_SIZE),
+        buyer_ids, product_ids,
+    )
+    blocks = [
+        (start, user_item[start:start + block_size], ordered[start:start + block_size])
+        for start in range(0, user_item.shape[0], block_size)
+    ]
+
+    def store(start, results):
+        block_buyer_ids = buyer_ids[start:start + len(results)].tolist()
+        # Buyers and products deleted since training would fail the foreign
+        # keys, so skip them; one query each per block
+        live_buyers = set(User.objects.filter(id__in=block_buyer_ids).values_list('id', flat=True))
+        block_product_ids = {int(product_ids[col]) for cols, _ in results for col in cols}
+        live_products = set(Product.objects.filter(id__in=block_product_ids).values_list('id', flat=True))
+        rows = []
+        for buyer_id, (cols, scores) in zip(block_buyer_ids, results):
+            if buyer_id not in live_buyers:
+                continue
+            live = [(int(product_ids[col]), score) for col, score in zip(cols, scores) if int(product_ids[col]) in live_products]
+            rows.extend(
+                BuyerRecommendation(buyer_id=buyer_id, product_id=product_id, rank=rank, score=float(score))
+                for rank, (product_id, score) in enumerate(live, start=1)
+            )
+        with transaction.atomic():
+            BuyerRecommendation.objects.filter(buyer_id__in=block_buyer_ids).delete()
+            BuyerRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_precompute_worker, initargs=(similarity,)) as pool:
+            futures = [(start, pool.submit(_score_buyer_block, block, num_recs, None, exclude)) for start, block, exclude in blocks]
+            for start, future in futures:
+                store(start, future.result())
+    else:
+        for start, block, exclude in blocks:
+            store(start, _score_buyer_block(block, num_recs, similarity, exclude))
+
+    print(f"Stored recommendations for {len(buyer_ids)} buyers.")
+    return len(buyer_ids)
+
+
+def _ordered_matrix(pairs, buyer_ids, product_ids):
+    """
+    Builds the buyers x products matrix of every (buyer_id, product_id)
+    order pair, whatever its status, over the given id arrays. Pairs outside
+    them are skipped.
+    """
+    flat = np.fromiter((value for pair in pairs for value in pair), dtype=np.int64).reshape(-1, 2)
+
+    def positions(ids, values):
+        # Vectorized id -> index lookup; `found` marks ids that are present
+        if not len(ids):
+            return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+        sorter = np.argsort(ids, kind='stable')
+        index = sorter[np.minimum(np.searchsorted(ids, values, sorter=sorter), len(ids) - 1)]
+        return index, ids[index] == values
+
+    rows, known_buyers = positions(np.asarray(buyer_ids), flat[:, 0])
+    cols, known_products = positions(np.asarray(product_ids), flat[:, 1])
+    keep = known_buyers & known_products
+    ordered = csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.float32), (rows[keep], cols[keep])),
+        shape=(len(buyer_ids), len(product_ids)),
+    )
+    # Repeat orders of the same product count once
+    ordered.data[:] = 1.0
+    return ordered
+
+
+def get_precomputed_recommendations(user, num_recs=4, engine=None):
+    """
+    Reads the buyer's precomputed recommendations in rank order with a single
+    indexed query, leaving out products they have ordered since the batch
+    ran. Returns an empty list if none were computed for them, or if the
+    configured engine is not the KNN model the lists are computed from.
+    """
+    from django.conf import settings
+    from accounts.models import Order, Product
+
+    engine = engine or getattr(settings, 'RECOMMENDER_ENGINE', DEFAULT_ENGINE)
+    if engine != 'knn':
+        return []
+    return list(
+        Product.objects.filter(recommended_to__buyer=user)
+        .exclude(id__in=Order.objects.filter(buyer=user).values('product_id'))
+        .order_by('recommended_to__rank')[:num_recs]
+    )
+
+
+# --- Implicit-feedback ALS engine ---
+
+def train_als_model(factors=ALS_FACTORS, regularization=ALS_REGULARIZATION, alpha=ALS_ALPHA,
+                    iterations=ALS_ITERATIONS, seed=0, model_dir=MODEL_DIR):
+    """
+    Trains an implicit-feedback matrix factorization (alternating least
+    squares, Hu/Koren/Volinsky) on the qualifying orders and saves float32
+    user and item factor arrays plus their id maps as .npy files.
+    """
+    print("Starting ALS model training process...")
+    user_item, buyer_ids, product_ids = extract_interactions()
+    if user_item.nnz == 0:
+        print("No sufficient order data to train the model. Exiting.")
+        return None
+    print(f"Loaded {user_item.nnz} unique user-product interactions.")
+
+    user_factors, item_factors = fit_als(user_item, factors, regularization, alpha, iterations, seed)
+    print("ALS model trained successfully.")
+    return save_als_model(user_factors, item_factors, buyer_ids, product_ids, {
+        'factors': factors,
+        'regularization': regularization,
+        'alpha': alpha,
+        'iterations': iterations,
+    }, model_dir)
+
+
+def fit_als(user_item, factors=ALS_FACTORS, regularization=ALS_REGULARIZATION, alpha=ALS_ALPHA,
+            iterations=ALS_ITERATIONS, seed=0):
+    """
+    Alternates exact least-squares solves for the user and item factors.
+    Every observed interaction gets confidence 1 + alpha * r and every
+    unobserved one confidence 1 with preference 0.
+    """
+    user_item = csr_matrix(user_item, dtype=np.float64)
+    item_user = user_item.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(scale=0.01, size=(user_item.shape[0], factors))
+    item_factors = rng.normal(scale=0.01, size=(user_item.shape[1], factors))
+
+    for _ in range(iterations):
+        user_factors = _als_solve(user_item, item_factors, regularization, alpha)
+        item_factors = _als_solve(item_user, user_factors, regularization, alpha)
+
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+
+def _als_solve(interactions, fixed, regularization, alpha):
+    # Solves every row of `interactions` against the fixed factors. The
+    # YtY term is shared, so each row only adds its own observed entries.
+    gram = fixed.T @ fixed + regularization * np.eye(fixed.shape[1])
+    solved = np.zeros((interactions.shape[0], fixed.shape[1]))
+    for row in range(interactions.shape[0]):
+        lo, hi = interactions.indptr[row], interactions.indptr[row + 1]
+        if lo == hi:
+            continue
+        solved[row] = _fold_in(fixed, interactions.indices[lo:hi], alpha * interactions.data[lo:hi], gram)
+    return solved
+
+
+def _fold_in(fixed, cols, confidence, gram):
+    # (YtY + Yu^T (Cu - I) Yu + lambda I) x = Yu^T Cu p(u), with p(u) = 1 on cols
+    observed = fixed[cols]
+    a = gram + (observed.T * confidence) @ observed
+    b = (observed * (1.0 + confidence)[:, None]).sum(axis=0)
+    return np.linalg.solve(a, b)
+
+
+def save_als_model(user_factors, item_factors, buyer_ids, product_ids, params, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    arrays = {
+        'als_user_factors': user_factors,
+        'als_item_factors': item_factors,
+        'als_buyer_ids': np.asarray(buyer_ids, dtype=np.int64),
+        'als_buyer_order': np.argsort(buyer_ids, kind='stable'),
+        'als_product_ids': np.asarray(product_ids, dtype=np.int64),
+        'als_product_order': np.argsort(product_ids, kind='stable'),
+    }
+    for name, array in arrays.items():
+        _save_array(model_dir, name, array)
+
+    manifest = dict(params, format='npy', version=MMAP_FORMAT_VERSION,
+                    n_buyers=int(user_factors.shape[0]), n_products=int(item_factors.shape[0]))
+    manifest_path = os.path.join(model_dir, ALS_MANIFEST_FILENAME)
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    print(f"ALS factors ({user_factors.shape[0]} buyers, {item_factors.shape[0]} products) saved to {model_dir}")
+    return manifest_path
+
+
+def load_als_model(model_dir=MODEL_DIR):
+    """Opens the ALS factor arrays read-only and memory-mapped."""
+    with open(os.path.join(model_dir, ALS_MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != 'npy' or manifest.get('version') != MMAP_FORMAT_VERSION:
+        raise ValueError(f"Unsupported ALS artifact format: {manifest}")
+
+    def load(name):
+        return np.load(os.path.join(model_dir, f'{name}.npy'), mmap_mode='r')
+
+    item_factors = load('als_item_factors')
+    return {
+        'user_factors': load('als_user_factors'),
+        'item_factors': item_factors,
+        'buyer_index': IdIndex(load('als_buyer_ids'), load('als_buyer_order')),
+        'id_to_idx': IdIndex(load('als_product_ids'), load('als_product_order')),
+        'product_ids': load('als_product_ids'),
+        # Shared by every fold-in of a buyer the model has not seen
+        'gram': item_factors.T.astype(np.float64) @ item_factors + manifest['regularization'] * np.eye(item_factors.shape[1]),
+        'alpha': manifest['alpha'],
+    }
+
+
+class ALSModelRegistry(ModelRegistry):
+    """Caches the ALS factor arrays, versioned by their manifest."""
+
+    def _file_signature(self, directory):
+        try:
+            stat = os.stat(os.path.join(directory, ALS_MANIFEST_FILENAME))
+        except FileNotFoundError:
+            return None
+        return ('als', stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, directory):
+        return load_als_model(directory)
+
+
+als_registry = ALSModelRegistry()
+
+
+def score_history_als(history, artifacts, num_recs, buyer_id=None, half_life_days=HISTORY_HALF_LIFE_DAYS, now=None):
+    """
+    Scores every product for a buyer with one dot product against the item
+    factors and returns the top product ids, best first. Buyers unseen at
+    training time are folded in from their (optionally time-decayed) history.
+    """
+    weights, ordered = _history_weights(history, artifacts['id_to_idx'], half_life_days, now)
+    if not weights:
+        return []
+
+    item_factors = artifacts['item_factors']
+    row = artifacts['buyer_index'].get(buyer_id) if buyer_id is not None else None
+    if row is not None:
+        user_vector = artifacts['user_factors'][row]
+    else:
+        cols = np.fromiter(weights, dtype=np.int64)
+        confidence = artifacts['alpha'] * np.fromiter(weights.values(), dtype=np.float64)
+        user_vector = _fold_in(item_factors, cols, confidence, artifacts['gram']).astype(np.float32)
+
+    scores = item_factors @ user_vector
+    # Mask everything the buyer has already ordered
+    scores[list(ordered)] = -np.inf
+
+    # Over-fetch a little in case some recommended products have been deleted
+    n = min(num_recs * 2, len(scores) - len(ordered))
+    if n <= 0:
+        return []
+    # Keep every product tied with the n-th best, so ties at the cut-off
+    # are broken on model index like the rest of the ranking
+    cutoff = -np.partition(-scores, n - 1)[n - 1]
+    top = np.flatnonzero(scores >= cutoff)
+    top = top[np.lexsort((top, -scores[top]))][:n]
+    return [int(pid) for pid in artifacts['product_ids'][top]]
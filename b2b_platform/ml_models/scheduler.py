@@ -0,0 +1,224 @@
+# ml_models/scheduler.py
+
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from datetime import datetime
+
+from ml_models.recommendations import (
+    CURRENT_LINK,
+    MODEL_DIR,
+    QUALIFYING_STATUSES,
+    VERSIONS_DIRNAME,
+    resolve_model_dir,
+    train_als_model,
+    train_and_save_knn_model,
+    update_knn_model_incremental,
+)
+
+# Written into every published version; records what the run covered.
+VERSION_INFO_FILENAME = 'version.json'
+
+# Retrain once this many new qualifying orders have arrived...
+RETRAIN_ORDER_THRESHOLD = 500
+# ...or once the published version is this old, whichever comes first.
+RETRAIN_INTERVAL_SECONDS = 6 * 60 * 60
+# How often the scheduler checks the two triggers above.
+SCHEDULER_POLL_SECONDS = 60
+# After a run that failed or had nothing to train on, wait this long before
+# trying again instead of retraining on every poll.
+RETRY_AFTER_SECONDS = 15 * 60
+
+# Published versions kept on disk besides the current one, so workers that
+# still have an older version memory-mapped are not pulled from under.
+KEEP_VERSIONS = 3
+
+
+def _trainer(engine, full=False, index=None):
+    if engine == 'als':
+        return lambda model_dir: train_als_model(model_dir=model_dir)
+    if full:
+        return lambda model_dir: train_and_save_knn_model(index=index, model_dir=model_dir)
+    return lambda model_dir: update_knn_model_incremental(index=index, model_dir=model_dir)
+
+
+def _directory_signature(directory):
+    return {
+        entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+        for entry in os.scandir(directory) if entry.is_file()
+    }
+
+
+def _new_version_dir(root):
+    """
+    Creates versions/<timestamp>/ seeded with a copy of the published
+    artifacts, so an incremental run continues from the current state and
+    the engines that are not retrained are carried over unchanged.
+    """
+    name = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    version_dir = os.path.join(root, VERSIONS_DIRNAME, name)
+    os.makedirs(version_dir)
+
+    published = resolve_model_dir(root)
+    if os.path.isdir(published):
+        for entry in os.scandir(published):
+            # Only the recommender's own artifacts; the content index and
+            # leftover temporary files stay where they are
+            if entry.is_file() and not entry.name.startswith('content_index') and not entry.name.endswith('.tmp'):
+                shutil.copy2(entry.path, os.path.join(version_dir, entry.name))
+    return version_dir
+
+
+def publish_version(version_dir, root=MODEL_DIR):
+    """
+    Points `current` at version_dir. The new symlink is created under a
+    temporary name and renamed over the old one, which is atomic: readers
+    see either the previous version or the new one, never a mix.
+    """
+    link_path = os.path.join(root, CURRENT_LINK)
+    tmp_link = f'{link_path}.tmp-{os.getpid()}'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    # Relative target, so the whole model directory can be moved
+    os.symlink(os.path.relpath(version_dir, root), tmp_link)
+    os.replace(tmp_link, link_path)
+    print(f"Published recommender version {os.path.basename(version_dir)}")
+
+
+def prune_versions(root=MODEL_DIR, keep=KEEP_VERSIONS):
+    """Deletes all but the `keep` newest versions, never the published one."""
+    versions_dir = os.path.join(root, VERSIONS_DIRNAME)
+    if not os.path.isdir(versions_dir):
+        return
+    published = resolve_model_dir(root)
+    names = sorted(os.listdir(versions_dir), reverse=True)
+    for name in names[keep:]:
+        path = os.path.join(versions_dir, name)
+        if os.path.realpath(path) != published:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def train_new_version(engine='knn', full=False, index=None, train=None, root=MODEL_DIR):
+    """
+    Runs one training run into a fresh version directory and publishes it.
+    Serving code picks the new version up on its next request. The version
+    is discarded if training fails or writes nothing (e.g. no order data).
+    Returns the published directory, or None.
+    """
+    from accounts.models import Order
+    from django.db.models import Max
+
+    train = train or _trainer(engine, full=full, index=index)
+    # Orders placed while training runs count towards the next run
+    last_order_id = Order.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    version_dir = _new_version_dir(root)
+    before = _directory_signature(version_dir)
+    try:
+        train(version_dir)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    if _directory_signature(version_dir) == before:
+        print("Training produced no new artifacts; keeping the published version.")
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return None
+
+    with open(os.path.join(version_dir, VERSION_INFO_FILENAME), 'w') as f:
+        json.dump({
+            'engine': engine,
+            'full': full,
+            'last_order_id': last_order_id,
+            'trained_at': time.time(),
+        }, f)
+    publish_version(version_dir, root)
+    prune_versions(root)
+    return version_dir
+
+
+def load_version_info(root=MODEL_DIR):
+    """Returns the version.json of the published version, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_LINK, VERSION_INFO_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def retraining_due(order_threshold=RETRAIN_ORDER_THRESHOLD, interval=RETRAIN_INTERVAL_SECONDS, root=MODEL_DIR):
+    """
+    Returns why a retraining run is due, or None if it is not: no published
+    version yet, `order_threshold` new qualifying orders since the last run,
+    or the published version being older than `interval` seconds.
+    """
+    from accounts.models import Order
+
+    info = load_version_info(root)
+    if info is None:
+        return "no published version"
+
+    new_orders = Order.objects.filter(id__gt=info['last_order_id'], status__in=QUALIFYING_STATUSES).count()
+    if order_threshold and new_orders >= order_threshold:
+        return f"{new_orders} new qualifying orders"
+
+    age = time.time() - info['trained_at']
+    if interval and age >= interval:
+        return f"published version is {age / 3600:.1f} hours old"
+    return None
+
+
+def _train_in_child(engine, full, root):
+    train_new_version(engine=engine, full=full, root=root)
+
+
+class RetrainingScheduler:
+    """
+    Polls the retraining triggers and runs each training run in a child
+    process, so the scheduler itself stays small and the memory a run needs
+    is returned to the system when it finishes. Web workers never train;
+    they only follow the `current` symlink.
+    """
+
+    def __init__(self, engine='knn', order_threshold=RETRAIN_ORDER_THRESHOLD,
+                 interval=RETRAIN_INTERVAL_SECONDS, poll_seconds=SCHEDULER_POLL_SECONDS,
+                 full=False, root=MODEL_DIR):
+        self.engine = engine
+        self.order_threshold = order_threshold
+        self.interval = interval
+        self.poll_seconds = poll_seconds
+        self.full = full
+        self.root = root
+        self._retry_at = 0.0
+
+    def run_once(self):
+        """Trains and publishes a new version if one is due. Returns True if it did."""
+        from django.db import connections
+
+        if time.monotonic() < self._retry_at:
+            return False
+        reason = retraining_due(self.order_threshold, self.interval, self.root)
+        if reason is None:
+            return False
+
+        print(f"Retraining the '{self.engine}' engine: {reason}.")
+        # The child must open its own database connection
+        connections.close_all()
+        published = load_version_info(self.root)
+        context = multiprocessing.get_context('fork')
+        child = context.Process(target=_train_in_child, args=(self.engine, self.full, self.root))
+        child.start()
+        child.join()
+        if child.exitcode != 0:
+            print(f"Retraining failed (exit code {child.exitcode}); the published version is unchanged.")
+        elif load_version_info(self.root) != published:
+            return True
+        self._retry_at = time.monotonic() + RETRY_AFTER_SECONDS
+        return False
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+            time.sleep(self.poll_seconds)